@@ -0,0 +1,24 @@
+import time
+from typing import Callable, List, Optional
+
+
+def best_time(
+    fn: Callable[..., object],
+    repeat: int = 5,
+    setup: Optional[Callable[[], object]] = None,
+) -> float:
+    """
+    The fastest of `repeat` runs of fn, in seconds. If given, setup is run before each run
+    without being timed, and its result is passed to fn.
+    """
+    times: List[float] = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        started = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f}ms"
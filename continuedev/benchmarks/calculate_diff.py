@@ -0,0 +1,149 @@
+"""
+Compares calculate_line_diff against calculate_diff2, which it replaced. calculate_diff2 ran
+a character-level SequenceMatcher over the whole file, applied the first edit, and started
+over, once for every edit, giving up after 1000 of them.
+
+Run from the root of the repo with `python3 -m continuedev.benchmarks.calculate_diff`.
+"""
+import difflib
+import random
+import time
+from typing import List, Tuple
+
+from ..src.continuedev.libs.util.calculate_diff import calculate_line_diff
+from ..src.continuedev.models.filesystem_edit import FileEdit
+from ..src.continuedev.models.main import LineIndex, Position, Range
+from . import best_time, format_ms
+
+# calculate_diff2 is quadratic, so only run it on the smaller files
+BASELINE_MAX_LINES = 200
+
+
+def baseline_apply_edit_to_str(s: str, edit: FileEdit) -> str:
+    lines = s.splitlines()
+    if s.startswith("\n"):
+        lines.insert(0, "")
+    if s.endswith("\n"):
+        lines.append("")
+
+    if len(lines) == 0:
+        lines = [""]
+
+    end = Position(line=edit.range.end.line, character=edit.range.end.character)
+    if edit.range.end.line == len(lines) and edit.range.end.character == 0:
+        end = Position(
+            line=edit.range.end.line - 1,
+            character=len(lines[min(len(lines) - 1, edit.range.end.line - 1)]),
+        )
+
+    before_lines = lines[: edit.range.start.line]
+    after_lines = lines[end.line + 1 :]
+    between_str = (
+        lines[min(len(lines) - 1, edit.range.start.line)][: edit.range.start.character]
+        + edit.replacement
+        + lines[min(len(lines) - 1, end.line)][end.character + 1 :]
+    )
+
+    lines = before_lines + between_str.splitlines() + after_lines
+    return "\n".join(lines)
+
+
+def baseline_calculate_diff2(
+    filepath: str, original: str, updated: str
+) -> List[FileEdit]:
+    edits = []
+    max_iterations = 1000
+    i = 0
+    while not original == updated:
+        s = difflib.SequenceMatcher(None, original, updated)
+        for tag, i1, i2, j1, j2 in s.get_opcodes():
+            replacement = updated[j1:j2]
+            if tag == "equal":
+                continue
+            elif tag == "delete":
+                edits.append(
+                    FileEdit.from_deletion(
+                        filepath, Range.from_indices(original, i1, i2)
+                    )
+                )
+            elif tag == "insert":
+                edits.append(
+                    FileEdit.from_insertion(
+                        filepath, Position.from_index(original, i1), replacement
+                    )
+                )
+            elif tag == "replace":
+                edits.append(
+                    FileEdit(
+                        filepath=filepath,
+                        range=Range.from_indices(original, i1, i2),
+                        replacement=replacement,
+                    )
+                )
+            break
+
+        original = baseline_apply_edit_to_str(original, edits[-1])
+
+        i += 1
+        if i > max_iterations:
+            raise Exception("Max iterations reached")
+
+    return edits
+
+
+def apply_edits(contents: str, edits: List[FileEdit]) -> str:
+    """Apply the edits one after the other, as the IDE does, with exclusive range ends"""
+    for edit in edits:
+        line_index = LineIndex(contents)
+        start = line_index.index(edit.range.start)
+        end = line_index.index(edit.range.end)
+        contents = contents[:start] + edit.replacement + contents[end:]
+    return contents
+
+
+def make_edit(rng: random.Random, num_lines: int) -> Tuple[str, str]:
+    """A file of num_lines lines, and a copy of it with about 5% of the lines changed"""
+    lines = [
+        f"    value_{i} = compute(x_{i}, y={rng.randint(0, 99)})\n"
+        for i in range(num_lines)
+    ]
+    updated = list(lines)
+    for _ in range(max(1, num_lines // 20)):
+        i = rng.randrange(len(updated))
+        r = rng.random()
+        if r < 0.4:
+            updated[i] = updated[i].replace("compute", "compute_fast")
+        elif r < 0.7:
+            updated.insert(i, "    # added\n")
+        else:
+            del updated[i]
+    return "".join(lines), "".join(updated)
+
+
+def main():
+    rng = random.Random(0)
+    for num_lines in (50, 100, 200, 1000, 5000):
+        original, updated = make_edit(rng, num_lines)
+
+        edits = calculate_line_diff("main.py", original, updated, refine=True)
+        assert apply_edits(original, edits) == updated
+        new = best_time(
+            lambda: calculate_line_diff("main.py", original, updated, refine=True)
+        )
+        result = f"{num_lines} lines: calculate_line_diff {format_ms(new)} ({len(edits)} edits)"
+
+        if num_lines <= BASELINE_MAX_LINES:
+            started = time.perf_counter()
+            try:
+                baseline_edits = baseline_calculate_diff2("main.py", original, updated)
+                outcome = f"{len(baseline_edits)} edits"
+            except Exception as e:
+                outcome = f"failed: {e}"
+            old = time.perf_counter() - started
+            result += f", calculate_diff2 {format_ms(old)} ({outcome})"
+
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
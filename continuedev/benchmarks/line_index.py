@@ -0,0 +1,74 @@
+"""
+Compares index/position conversions on a 5000-line string with and without a LineIndex.
+Without one, Range.from_indices counts newlines from the start of the string for every
+index, and FileSystem.read_range_in_str splits the whole string into lines for every read.
+
+Run from the root of the repo with `python3 -m continuedev.benchmarks.line_index`.
+"""
+import random
+
+from ..src.continuedev.models.filesystem import FileSystem
+from ..src.continuedev.models.main import LineIndex, Range
+from . import best_time, format_ms
+
+NUM_LINES = 5000
+
+
+def make_file(rng: random.Random) -> str:
+    return "\n".join(
+        " " * rng.randint(0, 12) + "x" * rng.randint(0, 80) for _ in range(NUM_LINES)
+    )
+
+
+def main():
+    rng = random.Random(0)
+    contents = make_file(rng)
+    index_pairs = [
+        tuple(sorted(rng.randint(0, len(contents)) for _ in range(2)))
+        for _ in range(2000)
+    ]
+    ranges = [
+        Range.from_indices(contents, start, end) for start, end in index_pairs[:500]
+    ]
+
+    line_index = LineIndex(contents)
+    assert [
+        Range.from_indices(contents, start, end, line_index)
+        for start, end in index_pairs
+    ] == [Range.from_indices(contents, start, end) for start, end in index_pairs]
+    assert [FileSystem.read_range_in_str(contents, r, line_index) for r in ranges] == [
+        FileSystem.read_range_in_str(contents, r) for r in ranges
+    ]
+
+    def from_indices_with_index():
+        # Building the index is part of the cost
+        line_index = LineIndex(contents)
+        return [
+            Range.from_indices(contents, start, end, line_index)
+            for start, end in index_pairs
+        ]
+
+    def read_ranges_with_index():
+        line_index = LineIndex(contents)
+        return [FileSystem.read_range_in_str(contents, r, line_index) for r in ranges]
+
+    old = best_time(
+        lambda: [Range.from_indices(contents, start, end) for start, end in index_pairs]
+    )
+    new = best_time(from_indices_with_index)
+    print(
+        f"{len(index_pairs)} Range.from_indices: scanning {format_ms(old)}, indexed {format_ms(new)} ({old / new:.1f}x)"
+    )
+
+    old = best_time(lambda: [FileSystem.read_range_in_str(contents, r) for r in ranges])
+    new = best_time(read_ranges_with_index)
+    print(
+        f"{len(ranges)} read_range_in_str: splitting {format_ms(old)}, indexed {format_ms(new)} ({old / new:.1f}x)"
+    )
+
+    build = best_time(lambda: LineIndex(contents))
+    print(f"Building the LineIndex for {NUM_LINES} lines: {format_ms(build)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compares prune_chat_history against the implementation it replaced, which re-tokenized
+messages in every pruning phase and popped dropped messages from the front of the list.
+
+Run from the root of the repo with `python3 -m continuedev.benchmarks.prune_chat_history`.
+"""
+import random
+from typing import List
+
+from ..src.continuedev.core.main import ChatMessage
+from ..src.continuedev.libs.util.count_tokens import (
+    count_chat_message_tokens,
+    count_tokens,
+    prune_chat_history,
+    prune_raw_prompt_from_top,
+)
+from . import best_time, format_ms
+
+MODEL_NAME = "gpt-4"
+WORDS = ["def", "return", "self", "value", "import", "the", "error", "file", "(", ")"]
+
+
+def baseline_prune_chat_history(
+    model_name: str,
+    chat_history: List[ChatMessage],
+    context_length: int,
+    tokens_for_completion: int,
+):
+    total_tokens = tokens_for_completion + sum(
+        count_chat_message_tokens(model_name, message) for message in chat_history
+    )
+
+    # 1. Replace beyond last 5 messages with summary
+    i = 0
+    while total_tokens > context_length and i < len(chat_history) - 5:
+        message = chat_history[0]
+        total_tokens -= count_tokens(model_name, message.content)
+        total_tokens += count_tokens(model_name, message.summary)
+        message.content = message.summary
+        i += 1
+
+    # 2. Remove entire messages until the last 5
+    while (
+        len(chat_history) > 5
+        and total_tokens > context_length
+        and len(chat_history) > 0
+    ):
+        message = chat_history.pop(0)
+        total_tokens -= count_tokens(model_name, message.content)
+
+    # 3. Truncate message in the last 5, except last 1
+    i = 0
+    while (
+        total_tokens > context_length
+        and len(chat_history) > 0
+        and i < len(chat_history) - 1
+    ):
+        message = chat_history[i]
+        total_tokens -= count_tokens(model_name, message.content)
+        total_tokens += count_tokens(model_name, message.summary)
+        message.content = message.summary
+        i += 1
+
+    # 4. Remove entire messages in the last 5, except last 1
+    while total_tokens > context_length and len(chat_history) > 1:
+        message = chat_history.pop(0)
+        total_tokens -= count_tokens(model_name, message.content)
+
+    # 5. Truncate last message
+    if total_tokens > context_length and len(chat_history) > 0:
+        message = chat_history[0]
+        message.content = prune_raw_prompt_from_top(
+            model_name, context_length, message.content, tokens_for_completion
+        )
+        total_tokens = context_length
+
+    return chat_history
+
+
+def make_history(rng: random.Random, num_messages: int) -> List[ChatMessage]:
+    return [
+        ChatMessage(
+            role=rng.choice(["user", "assistant"]),
+            content=" ".join(rng.choices(WORDS, k=rng.randint(5, 200))) + f" {i}",
+            summary=f"Message {i}",
+        )
+        for i in range(num_messages)
+    ]
+
+
+def main():
+    rng = random.Random(0)
+    for num_messages in (100, 1000, 4000):
+        history = make_history(rng, num_messages)
+        context_length = 4096
+
+        def copy_history():
+            return [message.copy() for message in history]
+
+        baseline = baseline_prune_chat_history(
+            MODEL_NAME, copy_history(), context_length, 1024
+        )
+        pruned = prune_chat_history(MODEL_NAME, copy_history(), context_length, 1024)
+        assert [m.dict() for m in pruned] == [m.dict() for m in baseline]
+
+        # Both share the token count cache, which the runs above have warmed
+        old = best_time(
+            lambda messages: baseline_prune_chat_history(
+                MODEL_NAME, messages, context_length, 1024
+            ),
+            setup=copy_history,
+        )
+        new = best_time(
+            lambda messages: prune_chat_history(
+                MODEL_NAME, messages, context_length, 1024
+            ),
+            setup=copy_history,
+        )
+        print(
+            f"{num_messages} messages: baseline {format_ms(old)}, ledger {format_ms(new)} ({old / new:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
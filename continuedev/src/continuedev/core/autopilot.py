@@ -1,16 +1,21 @@
+import asyncio
+import heapq
+import itertools
 import json
 import os
 import time
 import traceback
 from functools import cached_property
-from typing import Callable, Coroutine, Dict, List, Optional
+from typing import Callable, Coroutine, Dict, List, Optional, Tuple
 
 from aiohttp import ClientPayloadError
 from openai import error as openai_errors
 from pydantic import root_validator
 
+from ..libs.llm.instrumentation import reset_llm_call_sink, set_llm_call_sink
 from ..libs.util.create_async_task import create_async_task
 from ..libs.util.logging import logger
+from ..libs.util.metrics import histogram
 from ..libs.util.paths import getSavedContextGroupsPath
 from ..libs.util.queue import AsyncSubscriptionQueue
 from ..libs.util.strings import remove_quotes_and_escapes
@@ -73,6 +78,122 @@ def get_error_title(e: Exception) -> str:
     return e.__str__() or e.__repr__()
 
 
+class UpdateScheduler:
+    """
+    Coalesces requests to update the GUI, so that streaming steps don't wait on the websocket.
+
+    Requests only mark the state as dirty. A background task then sends it at most
+    max_per_second times per second (unthrottled if it is None or 0), always sending the latest state.
+    """
+
+    def __init__(
+        self,
+        send_update: Callable[[], Coroutine],
+        max_per_second: Optional[float] = 30,
+    ):
+        # Counters to see how many updates are being coalesced
+        self.updates_requested = 0
+        self.updates_flushed = 0
+
+        self._send_update = send_update
+        self._min_interval = (
+            1 / max_per_second
+            if max_per_second is not None and max_per_second > 0
+            else 0
+        )
+        self._dirty = False
+        self._last_flush = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def request(self):
+        """Mark the state as changed and make sure that an update will be sent soon"""
+        self.updates_requested += 1
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = create_async_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            await asyncio.sleep(
+                max(0, self._last_flush + self._min_interval - time.monotonic())
+            )
+            await self.flush()
+
+    async def flush(self):
+        """Send an update now if anything has changed since the last one"""
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            self.updates_flushed += 1
+            await self._send_update()
+
+
+class SummarizationQueue:
+    """
+    Runs the background LLM calls that summarize steps (step.describe), a few at a time.
+
+    Jobs with a lower priority number run first. A job is dropped without running if its
+    is_stale check returns True by the time it reaches the front, e.g. because its step was deleted.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 2,
+        on_error: Optional[Callable[[Exception], Coroutine]] = None,
+    ):
+        # Counters to see how much work is being skipped
+        self.jobs_run = 0
+        self.jobs_dropped = 0
+
+        self._max_concurrent = max(1, max_concurrent or 1)
+        self._on_error = on_error
+        self._queue: List[
+            Tuple[int, int, Callable[[], Coroutine], Optional[Callable[[], bool]]]
+        ] = []
+        self._counter = itertools.count()
+        self._workers = 0
+
+    def submit(
+        self,
+        job: Callable[[], Coroutine],
+        priority: int = 0,
+        is_stale: Optional[Callable[[], bool]] = None,
+    ):
+        # The counter breaks ties, so jobs of the same priority run in the order they were submitted
+        heapq.heappush(self._queue, (priority, next(self._counter), job, is_stale))
+        if self._workers < self._max_concurrent:
+            self._workers += 1
+            create_async_task(self._work())
+
+    async def _work(self):
+        try:
+            while len(self._queue) > 0:
+                _, _, job, is_stale = heapq.heappop(self._queue)
+                if is_stale is not None and is_stale():
+                    self.jobs_dropped += 1
+                    continue
+
+                self.jobs_run += 1
+                try:
+                    await job()
+                except Exception as e:
+                    logger.warning(f"Error while summarizing step: {e}")
+                    if self._on_error is not None:
+                        await self._on_error(e)
+        finally:
+            self._workers -= 1
+
+
+STEP_DURATION = histogram(
+    "continue_step_duration_seconds",
+    "Time to run a step, including its substeps",
+    ["step", "status"],
+)
+
+
 class Autopilot(ContinueBaseModel):
     ide: AbstractIdeProtocolServer
 
@@ -85,6 +206,8 @@ class Autopilot(ContinueBaseModel):
     continue_sdk: ContinueSDK = None
 
     _on_update_callbacks: List[Callable[[FullState], None]] = []
+    _update_scheduler: Optional[UpdateScheduler] = None
+    _summarization_queue: Optional[SummarizationQueue] = None
 
     _active: bool = False
     _should_halt: bool = False
@@ -97,6 +220,14 @@ class Autopilot(ContinueBaseModel):
 
     async def start(self, full_state: Optional[FullState] = None):
         self.continue_sdk = await ContinueSDK.create(self)
+        self._update_scheduler = UpdateScheduler(
+            self._send_update_to_subscribers,
+            self.continue_sdk.config.max_ui_updates_per_second,
+        )
+        self._summarization_queue = SummarizationQueue(
+            self.continue_sdk.config.max_concurrent_summaries,
+            on_error=lambda e: self.continue_sdk.run_step(DisplayErrorStep(e=e)),
+        )
         if override_policy := self.continue_sdk.config.policy_override:
             self.policy = override_policy
 
@@ -200,6 +331,18 @@ class Autopilot(ContinueBaseModel):
         self._on_update_callbacks.append(callback)
 
     async def update_subscribers(self):
+        """Request that subscribers be sent the latest state. Updates are coalesced by the scheduler."""
+        if self._update_scheduler is None:
+            await self._send_update_to_subscribers()
+        else:
+            self._update_scheduler.request()
+
+    async def flush_updates(self):
+        """Send any pending update to subscribers immediately"""
+        if self._update_scheduler is not None:
+            await self._update_scheduler.flush()
+
+    async def _send_update_to_subscribers(self):
         full_state = await self.get_full_state()
         for callback in self._on_update_callbacks:
             await callback(full_state)
@@ -270,12 +413,14 @@ class Autopilot(ContinueBaseModel):
 
     async def retry_at_index(self, index: int):
         self.history.timeline[index].step.hide = True
+        self.history.timeline[index].mark_changed()
         self._retry_queue.post(str(index), None)
 
     async def delete_at_index(self, index: int):
         self.history.timeline[index].step.hide = True
         self.history.timeline[index].deleted = True
         self.history.timeline[index].active = False
+        self.history.timeline[index].mark_changed()
 
         await self.update_subscribers()
 
@@ -349,9 +494,8 @@ class Autopilot(ContinueBaseModel):
                 await self._run_singular_step(manualEditsStep)
 
         # Update history - do this first so we get top-first tree ordering
-        index_of_history_node = self.history.add_node(
-            HistoryNode(step=step, observation=None, depth=self._step_depth)
-        )
+        history_node = HistoryNode(step=step, observation=None, depth=self._step_depth)
+        index_of_history_node = self.history.add_node(history_node)
 
         # Call all subscribed callbacks
         await self.update_subscribers()
@@ -360,9 +504,18 @@ class Autopilot(ContinueBaseModel):
         self._step_depth += 1
 
         caught_error = False
+        # Record the LLM calls made by this step (substeps record their own)
+        llm_call_sink = set_llm_call_sink(history_node.llm_calls.append)
+        step_started = time.monotonic()
         try:
             observation = await step(self.continue_sdk)
+            STEP_DURATION.labels(step.__class__.__name__, "success").observe(
+                time.monotonic() - step_started
+            )
         except Exception as e:
+            STEP_DURATION.labels(step.__class__.__name__, "error").observe(
+                time.monotonic() - step_started
+            )
             if (
                 index_of_history_node >= len(self.history.timeline)
                 or self.history.timeline[index_of_history_node].deleted
@@ -408,6 +561,7 @@ class Autopilot(ContinueBaseModel):
             i = self.history.get_current_index()
             while self.history.timeline[i].step.name != step.name:
                 self.history.timeline[i].step.hide = True
+                self.history.timeline[i].mark_changed()
                 i -= 1
 
             # i is now the index of the step that we want to show/rerun
@@ -432,6 +586,9 @@ class Autopilot(ContinueBaseModel):
             observation = await self._run_singular_step(copy_step)
             self._step_depth += 1
 
+        finally:
+            reset_llm_call_sink(llm_call_sink)
+
         self._step_depth -= 1
 
         # Add observation to history, unless already attached error observation
@@ -440,15 +597,40 @@ class Autopilot(ContinueBaseModel):
             self.history.timeline[index_of_history_node].active = False
             await self.update_subscribers()
 
-        # Update its description
+        # Make sure the final state of the step is sent, even if updates were being throttled
+        await self.flush_updates()
+
+        # Update its description in the background
+        node = (
+            self.history.timeline[index_of_history_node]
+            if index_of_history_node < len(self.history.timeline)
+            else None
+        )
+
+        def is_stale() -> bool:
+            # Don't spend an LLM call on a step that has been deleted or cleared from history
+            return (
+                node is None
+                or node.deleted
+                or all(n is not node for n in self.history.timeline)
+            )
+
         async def update_description():
-            step.description = await step.describe(self.continue_sdk.models)
+            llm_call_sink = set_llm_call_sink(node.llm_calls.append)
+            try:
+                description = await step.describe(self.continue_sdk.models)
+            finally:
+                reset_llm_call_sink(llm_call_sink)
+            if is_stale():
+                return
+            step.description = description
+            node.mark_changed()
             # Update subscribers with new description
             await self.update_subscribers()
 
-        create_async_task(
-            update_description(),
-            on_error=lambda e: self.continue_sdk.run_step(DisplayErrorStep(e=e)),
+        # Steps that are shown in the GUI are summarized first
+        self._summarization_queue.submit(
+            update_description, priority=1 if step.hide else 0, is_stale=is_stale
         )
 
         return observation
@@ -478,6 +660,7 @@ class Autopilot(ContinueBaseModel):
 
         # Doing this so active can make it to the frontend after steps are done. But want better state syncing tools
         await self.update_subscribers()
+        await self.flush_updates()
 
     async def run_from_observation(self, observation: Observation):
         next_step = self.policy.next(self.continue_sdk.config, self.history)
@@ -491,7 +674,7 @@ class Autopilot(ContinueBaseModel):
         if self._active:
             self._should_halt = True
             while self._active:
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
         self._should_halt = False
         return None
 
@@ -34,6 +34,8 @@ class ContinueConfig(BaseModel):
         medium=MaybeProxyOpenAI(model="gpt-3.5-turbo"),
     )
     temperature: Optional[float] = 0.5
+    max_ui_updates_per_second: Optional[float] = 30
+    max_concurrent_summaries: Optional[int] = 2
     custom_commands: Optional[List[CustomCommand]] = [
         CustomCommand(
             name="test",
@@ -8,12 +8,24 @@ from pydantic import BaseModel
 
 from ..libs.util.create_async_task import create_async_task
 from ..libs.util.logging import logger
+from ..libs.util.metrics import counter, histogram
 from ..libs.util.telemetry import posthog_logger
 from ..server.meilisearch_server import poll_meilisearch_running
 from .main import ChatMessage, ContextItem, ContextItemDescription, ContextItemId
 
 SEARCH_INDEX_NAME = "continue_context_items"
 
+MEILISEARCH_INDEX_DURATION = histogram(
+    "continue_meilisearch_index_duration_seconds",
+    "Time to collect a context provider's items and add them to the search index",
+    ["provider"],
+)
+MEILISEARCH_DOCUMENTS_INDEXED = counter(
+    "continue_meilisearch_documents_indexed",
+    "Documents added to the search index",
+    ["provider"],
+)
+
 
 class ContextProvider(BaseModel):
     """
@@ -235,6 +247,10 @@ class ContextManager:
                         )
 
                     tf = time.time()
+                    MEILISEARCH_INDEX_DURATION.labels(provider.title).observe(tf - ti)
+                    MEILISEARCH_DOCUMENTS_INDEXED.labels(provider.title).inc(
+                        len(documents)
+                    )
                     logger.debug(
                         f"Loaded {len(documents)} documents into meilisearch in {tf - ti} seconds for context provider {provider.title}"
                     )
@@ -1,5 +1,5 @@
 import json
-from typing import Coroutine, Dict, List, Literal, Optional, Union
+from typing import Coroutine, Dict, List, Literal, Optional, Tuple, Union
 
 from pydantic import BaseModel, validator
 from pydantic.schema import schema
@@ -23,6 +23,9 @@ class ChatMessage(ContinueBaseModel):
     summary: str
     function_call: Union[FunctionCall, None] = None
 
+    # (encoding name, content, token count), set by count_chat_messages_tokens
+    _token_count: Optional[Tuple[str, Optional[str], int]] = None
+
     def to_dict(self, with_functions: bool) -> Dict:
         d = self.dict()
         del d["summary"]
@@ -99,6 +102,45 @@ def step_to_fn_call_arguments(step: "Step") -> str:
     return json.dumps(args)
 
 
+class LLMCallTelemetry(ContinueBaseModel):
+    """Timings and token counts for a single call to an LLM. Durations are in seconds."""
+
+    provider: str
+    model: str
+    method: str
+    roles: List[str] = []
+
+    queue_wait: float = 0
+    time_to_first_token: Optional[float] = None
+    duration: float = 0
+    # Counts of the gaps between streamed chunks, bucketed by INTER_TOKEN_LATENCY_BUCKETS
+    inter_token_latency_histogram: List[int] = []
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hit: bool = False
+    retries: int = 0
+    error: Optional[str] = None
+
+    # The completion that completion_tokens was counted from, until the call is finished
+    _counted_completion: Optional[str] = None
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        # Time to first token is measured from the start of the call, so it includes the queue wait
+        if self.time_to_first_token is not None:
+            generating = self.duration - self.time_to_first_token
+        else:
+            generating = self.duration - self.queue_wait
+        if self.completion_tokens == 0 or generating <= 0:
+            return None
+        return self.completion_tokens / generating
+
+
+# Upper bounds of the inter-token latency histogram buckets, in seconds (the last bucket is unbounded)
+INTER_TOKEN_LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+
 class HistoryNode(ContinueBaseModel):
     """A point in history, a list of which make up History"""
 
@@ -108,6 +150,14 @@ class HistoryNode(ContinueBaseModel):
     deleted: bool = False
     active: bool = True
     logs: List[str] = []
+    llm_calls: List[LLMCallTelemetry] = []
+
+    # Bumped by mark_changed, so GUI clients know to look at a node that isn't active again
+    _revision: int = 0
+
+    def mark_changed(self):
+        """Call after changing a node that has finished running, e.g. its step's description"""
+        self._revision += 1
 
     def to_chat_messages(self) -> List[ChatMessage]:
         if self.step.description is None or self.step.manage_own_chat_context:
@@ -57,6 +57,14 @@ class Models(BaseModel):
         else:
             self.large = self.default
 
+        # Label each LLM (and any LLMs it wraps) with its roles, for telemetry
+        for role in ("default", "small", "medium", "large"):
+            llm = getattr(self, role)
+            while llm is not None:
+                if role not in llm._roles:
+                    llm._roles.append(role)
+                llm = getattr(llm, "llm", None)
+
     async def stop(self, sdk: "ContinueSDK"):
         """Stop each LLM (if it's not the default, which is shared)"""
         await self.default.stop()
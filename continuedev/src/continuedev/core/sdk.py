@@ -1,6 +1,7 @@
+import asyncio
 import os
 import traceback
-from typing import Coroutine, Union
+from typing import Coroutine, List, Union
 
 from ..libs.llm import LLM
 from ..libs.util.logging import logger
@@ -91,7 +92,9 @@ class ContinueSDK(AbstractContinueSDK):
         return self.__autopilot.history
 
     def write_log(self, message: str):
-        self.history.timeline[self.history.current_index].logs.append(message)
+        node = self.history.timeline[self.history.current_index]
+        node.logs.append(message)
+        node.mark_changed()
 
     async def start_model(self, llm: LLM):
         kwargs = {}
@@ -183,6 +186,13 @@ class ContinueSDK(AbstractContinueSDK):
             )
         )
 
+    async def read_files(self, filenames: List[str]) -> List[str]:
+        """Read the contents of several files with a single request to the IDE"""
+        filepaths = await asyncio.gather(
+            *[self._ensure_absolute_path(filename) for filename in filenames]
+        )
+        return await self.ide.readFiles(list(filepaths))
+
     async def append_to_file(self, filename: str, content: str):
         filepath = await self._ensure_absolute_path(filename)
         previous_content = await self.ide.readFile(filepath)
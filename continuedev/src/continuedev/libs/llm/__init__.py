@@ -12,6 +12,20 @@ class LLM(ContinueBaseModel, ABC):
 
     system_message: Optional[str] = None
 
+    # Limits on the requests to this LLM's provider, shared by every session (see rate_limit.py)
+    max_concurrent_requests: Optional[int] = 8
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+
+    # Retrying failed requests and hedging slow ones (see retry.py)
+    max_retries: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8
+    hedge_percentile: Optional[float] = None
+
+    # The roles in Models that this LLM fills, set by Models.start
+    _roles: List[str] = []
+
     class Config:
         arbitrary_types_allowed = True
 
@@ -20,6 +34,11 @@ class LLM(ContinueBaseModel, ABC):
         """Return the name of the LLM."""
         raise NotImplementedError
 
+    @property
+    def rate_limit_key(self) -> str:
+        """Requests with the same key share a rate limit."""
+        return self.__class__.__name__
+
     async def start(self, *, api_key: Optional[str] = None, **kwargs):
         """Start the connection to the LLM."""
         raise NotImplementedError
@@ -50,6 +69,10 @@ class LLM(ContinueBaseModel, ABC):
         """Return the number of tokens in the given text."""
         raise NotImplementedError
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Return the number of tokens in each of the given texts."""
+        return [self.count_tokens(text) for text in texts]
+
     @abstractproperty
     def context_length(self) -> int:
         """Return the context length of the LLM in tokens, as counted by count_tokens."""
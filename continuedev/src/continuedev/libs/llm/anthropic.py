@@ -8,8 +8,12 @@ from ..util.count_tokens import (
     DEFAULT_ARGS,
     compile_chat_messages,
     count_tokens,
+    count_tokens_batch,
     format_chat_messages,
 )
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 
 class AnthropicLLM(LLM):
@@ -59,6 +63,9 @@ class AnthropicLLM(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.model, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.model, texts)
+
     @property
     def context_length(self):
         if self.model == "claude-2":
@@ -81,6 +88,9 @@ class AnthropicLLM(LLM):
         prompt += AI_PROMPT
         return prompt
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -100,6 +110,9 @@ class AnthropicLLM(LLM):
 
         self.write_log(f"Completion: \n\n{completion}")
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(
         self, messages: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -127,6 +140,9 @@ class AnthropicLLM(LLM):
 
         self.write_log(f"Completion: \n\n{completion}")
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, str]:
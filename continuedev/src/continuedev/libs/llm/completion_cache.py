@@ -0,0 +1,259 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Coroutine, Dict, Generator, List, Optional, Union
+
+from pydantic import BaseModel
+
+from ...core.main import ChatMessage
+from ..util.count_tokens import DEFAULT_ARGS
+from ..util.executor import run_in_executor
+from ..util.logging import logger
+from ..util.paths import getCompletionCachePath
+from . import LLM
+from .instrumentation import current_llm_call, instrumented
+
+
+class CompletionCache:
+    """
+    A content-addressed store of completions, kept in a SQLite database.
+
+    Entries older than ttl_seconds are never returned, and once the completions stored
+    add up to more than max_size_bytes, the least recently used are evicted.
+    All methods block, so they should be run in an executor.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_size_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    completion TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT completion FROM completions WHERE key = ? AND created > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE completions SET last_used = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def put(self, key: str, completion: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                (key, completion, len(completion.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute(
+            "DELETE FROM completions WHERE created <= ?", (now - self.ttl_seconds,)
+        )
+        (total_size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()
+        if total_size <= self.max_size_bytes:
+            return
+
+        # Walk from least recently used, and delete everything up to where we're back under the limit
+        to_free = total_size - self.max_size_bytes
+        cutoff = None
+        for last_used, size in self._conn.execute(
+            "SELECT last_used, size FROM completions ORDER BY last_used"
+        ):
+            to_free -= size
+            cutoff = last_used
+            if to_free <= 0:
+                break
+        self._conn.execute("DELETE FROM completions WHERE last_used <= ?", (cutoff,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM completions")
+
+
+# Stores are shared between every CachedLLM that uses the same file
+_caches: Dict[str, CompletionCache] = {}
+
+
+class CompletionCacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+class CachedLLM(LLM):
+    """
+    Wraps another LLM, and caches the results of `complete` on disk.
+
+    Completions are keyed by the model, the messages and the arguments of the call, so only
+    identical requests hit the cache. Because a request with a temperature above 0 is expected
+    to give different results each time, these bypass the cache unless cache_nondeterministic is set.
+    Streaming calls are always passed straight through.
+    """
+
+    llm: LLM
+
+    ttl_seconds: float = 60 * 60 * 24 * 7
+    max_size_mb: float = 50
+    cache_nondeterministic: bool = False
+    cache_path: Optional[str] = None
+
+    _cache: Optional[CompletionCache] = None
+    _stats: CompletionCacheStats
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.requires_api_key = self.llm.requires_api_key
+        self.requires_unique_id = self.llm.requires_unique_id
+        self.requires_write_log = self.llm.requires_write_log
+        self._stats = CompletionCacheStats()
+
+    @property
+    def name(self):
+        return self.llm.name
+
+    @property
+    def context_length(self):
+        return self.llm.context_length
+
+    @property
+    def default_args(self):
+        return self.llm.default_args
+
+    @property
+    def stats(self) -> CompletionCacheStats:
+        return self._stats
+
+    async def start(self, **kwargs):
+        await self.llm.start(**kwargs)
+
+        path = self.cache_path or getCompletionCachePath()
+        if path not in _caches:
+            try:
+                _caches[path] = await run_in_executor(
+                    CompletionCache,
+                    path,
+                    self.ttl_seconds,
+                    int(self.max_size_mb * 1024 * 1024),
+                )
+            except Exception as e:
+                logger.warning(f"Completion cache disabled, failed to open {path}: {e}")
+                return
+        self._cache = _caches[path]
+
+    async def stop(self):
+        await self.llm.stop()
+
+    def _should_cache(self, kwargs: Dict[str, Any]) -> bool:
+        if self._cache is None:
+            return False
+        if self.cache_nondeterministic:
+            return True
+
+        try:
+            default_args = self.llm.default_args
+        except Exception:
+            default_args = DEFAULT_ARGS
+        temperature = kwargs.get("temperature", default_args.get("temperature", 0))
+        return temperature is not None and temperature <= 0
+
+    def _key(
+        self, prompt: str, with_history: Optional[List[ChatMessage]], kwargs: Dict
+    ) -> str:
+        messages = [
+            {**msg.to_dict(with_functions=True), "content": (msg.content or "").strip()}
+            for msg in with_history or []
+        ]
+        key = json.dumps(
+            {
+                "model": self.llm.name,
+                "system_message": self.llm.system_message,
+                "messages": messages,
+                "prompt": prompt.strip(),
+                "args": kwargs,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @instrumented
+    async def complete(
+        self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
+    ) -> Coroutine[Any, Any, str]:
+        if not self._should_cache(kwargs):
+            self._stats.bypassed += 1
+            return await self.llm.complete(prompt, with_history=with_history, **kwargs)
+
+        key = self._key(prompt, with_history, kwargs)
+        try:
+            completion = await run_in_executor(self._cache.get, key)
+        except Exception as e:
+            logger.warning(f"Error reading from completion cache: {e}")
+            completion = None
+
+        if completion is not None:
+            self._stats.hits += 1
+            call = current_llm_call()
+            if call is not None:
+                call.cache_hit = True
+            return completion
+
+        self._stats.misses += 1
+        completion = await self.llm.complete(
+            prompt, with_history=with_history, **kwargs
+        )
+        if isinstance(completion, str):
+            try:
+                await run_in_executor(self._cache.put, key, completion)
+            except Exception as e:
+                logger.warning(f"Error writing to completion cache: {e}")
+        return completion
+
+    async def stream_complete(
+        self, prompt, with_history: List[ChatMessage] = None, **kwargs
+    ) -> Generator[Union[Any, List, Dict], None, None]:
+        async for item in self.llm.stream_complete(
+            prompt, with_history=with_history, **kwargs
+        ):
+            yield item
+
+    async def stream_chat(
+        self, messages: List[ChatMessage] = None, **kwargs
+    ) -> Generator[Union[Any, List, Dict], None, None]:
+        async for item in self.llm.stream_chat(messages=messages, **kwargs):
+            yield item
+
+    def count_tokens(self, text: str):
+        return self.llm.count_tokens(text)
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return self.llm.count_tokens_batch(texts)
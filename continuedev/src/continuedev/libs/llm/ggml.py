@@ -5,7 +5,18 @@ import aiohttp
 
 from ...core.main import ChatMessage
 from ..llm import LLM
-from ..util.count_tokens import DEFAULT_ARGS, compile_chat_messages, count_tokens
+from ..util.count_tokens import (
+    DEFAULT_ARGS,
+    compile_chat_messages,
+    count_tokens,
+    count_tokens_batch,
+)
+from ..util.errors import LLMHTTPError
+from ..util.http_client import get_client_session
+from ..util.stream_decoder import iter_sse_data, iter_text
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 
 class GGML(LLM):
@@ -20,12 +31,11 @@ class GGML(LLM):
         arbitrary_types_allowed = True
 
     async def start(self, **kwargs):
-        self._client_session = aiohttp.ClientSession(
-            connector=aiohttp.TCPConnector(verify_ssl=self.verify_ssl)
-        )
+        self._client_session = get_client_session(verify_ssl=self.verify_ssl)
 
     async def stop(self):
-        await self._client_session.close()
+        # The session is shared, so it's closed when the server shuts down
+        pass
 
     @property
     def name(self):
@@ -42,6 +52,12 @@ class GGML(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.name, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.name, texts)
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -63,13 +79,14 @@ class GGML(LLM):
         async with self._client_session.post(
             f"{self.server_url}/v1/completions", json={"messages": messages, **args}
         ) as resp:
-            async for line in resp.content.iter_any():
-                if line:
-                    try:
-                        yield line.decode("utf-8")
-                    except:
-                        raise Exception(str(line))
-
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for text in iter_text(resp):
+                yield text
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(
         self, messages: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -89,23 +106,16 @@ class GGML(LLM):
             f"{self.server_url}/v1/chat/completions",
             json={"messages": messages, **args},
         ) as resp:
-            # This is streaming application/json instaed of text/event-stream
-            async for line, end in resp.content.iter_chunks():
-                if end:
-                    continue
-
-                json_chunk = line.decode("utf-8")
-                if json_chunk.startswith(": ping - ") or json_chunk.startswith(
-                    "data: [DONE]"
-                ):
-                    continue
-                chunks = json_chunk.split("\n")
-                for chunk in chunks:
-                    if chunk.strip() != "":
-                        yield json.loads(chunk[6:])["choices"][0][
-                            "delta"
-                        ]  # {"role": "assistant", "content": "..."}
-
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for data in iter_sse_data(resp):
+                yield json.loads(data)["choices"][0][
+                    "delta"
+                ]  # {"role": "assistant", "content": "..."}
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, str]:
@@ -126,4 +136,6 @@ class GGML(LLM):
                 **args,
             },
         ) as resp:
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
             return json.loads(await resp.text())["choices"][0]["text"]
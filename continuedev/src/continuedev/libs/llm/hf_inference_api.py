@@ -1,11 +1,15 @@
 from typing import Any, Coroutine, Dict, Generator, List
 
 import aiohttp
-import requests
 
 from ...core.main import ChatMessage
 from ..llm import LLM
-from ..util.count_tokens import DEFAULT_ARGS, count_tokens
+from ..util.count_tokens import DEFAULT_ARGS, count_tokens, count_tokens_batch
+from ..util.errors import LLMHTTPError
+from ..util.http_client import get_client_session
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 DEFAULT_MAX_TIME = 120.0
 
@@ -23,12 +27,11 @@ class HuggingFaceInferenceAPI(LLM):
         arbitrary_types_allowed = True
 
     async def start(self, **kwargs):
-        self._client_session = aiohttp.ClientSession(
-            connector=aiohttp.TCPConnector(verify_ssl=self.verify_ssl)
-        )
+        self._client_session = get_client_session(verify_ssl=self.verify_ssl)
 
     async def stop(self):
-        await self._client_session.close()
+        # The session is shared, so it's closed when the server shuts down
+        pass
 
     @property
     def name(self):
@@ -45,6 +48,12 @@ class HuggingFaceInferenceAPI(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.name, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.name, texts)
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ):
@@ -52,7 +61,7 @@ class HuggingFaceInferenceAPI(LLM):
         API_URL = f"https://api-inference.huggingface.co/models/{self.model}"
         headers = {"Authorization": f"Bearer {self.hf_token}"}
 
-        response = requests.post(
+        async with self._client_session.post(
             API_URL,
             headers=headers,
             json={
@@ -65,8 +74,10 @@ class HuggingFaceInferenceAPI(LLM):
                     "return_full_text": False,
                 },
             },
-        )
-        data = response.json()
+        ) as response:
+            if response.status != 200:
+                raise LLMHTTPError(response.status, await response.text())
+            data = await response.json(content_type=None)
 
         # Error if the response is not a list
         if not isinstance(data, list):
@@ -74,12 +85,18 @@ class HuggingFaceInferenceAPI(LLM):
 
         return data[0]["generated_text"]
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(
         self, messages: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, Generator[Any | List | Dict, None, None]]:
         response = await self.complete(messages[-1].content, messages[:-1])
         yield {"content": response, "role": "assistant"}
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ) -> Generator[Any | List | Dict, None, None]:
@@ -0,0 +1,327 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ...core.main import INTER_TOKEN_LATENCY_BUCKETS, ChatMessage, LLMCallTelemetry
+from ..util.logging import logger
+from ..util.metrics import counter, histogram
+
+# The call being recorded by the current task, so that the layers underneath
+# (rate limiting, retries, caching) can add to it
+_current_call: "contextvars.ContextVar[Optional[LLMCallTelemetry]]" = (
+    contextvars.ContextVar("current_llm_call", default=None)
+)
+
+# Where finished calls are sent, e.g. the HistoryNode of the step that made them
+_call_sink: "contextvars.ContextVar[Optional[Callable[[LLMCallTelemetry], None]]]" = (
+    contextvars.ContextVar("llm_call_sink", default=None)
+)
+
+
+def current_llm_call() -> Optional[LLMCallTelemetry]:
+    return _current_call.get()
+
+
+def set_llm_call_sink(
+    sink: Optional[Callable[[LLMCallTelemetry], None]]
+) -> contextvars.Token:
+    """Send the telemetry of LLM calls made in the current context to `sink`. Returns a token for reset_llm_call_sink."""
+    return _call_sink.set(sink)
+
+
+def reset_llm_call_sink(token: contextvars.Token):
+    _call_sink.reset(token)
+
+
+LLM_CALLS = counter(
+    "continue_llm_calls",
+    "Calls to LLMs, by whether they succeeded",
+    ["provider", "model", "method", "status"],
+)
+LLM_CACHE_HITS = counter(
+    "continue_llm_cache_hits", "LLM calls answered by the completion cache", ["model"]
+)
+LLM_TOKENS = counter(
+    "continue_llm_tokens", "Tokens sent to and received from LLMs", ["model", "kind"]
+)
+LLM_CALL_DURATION = histogram(
+    "continue_llm_call_duration_seconds",
+    "Total time of LLM calls, including time spent queued and retrying",
+    ["provider", "model", "method"],
+    buckets=[0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300],
+)
+LLM_QUEUE_WAIT = histogram(
+    "continue_llm_queue_wait_seconds",
+    "Time LLM calls waited for the provider's rate limiter",
+    ["provider", "model"],
+)
+LLM_TIME_TO_FIRST_TOKEN = histogram(
+    "continue_llm_time_to_first_token_seconds",
+    "Time from the start of a streamed LLM call to its first chunk",
+    ["provider", "model"],
+    buckets=[0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60],
+)
+LLM_INTER_TOKEN_LATENCY = histogram(
+    "continue_llm_inter_token_latency_seconds",
+    "Time between the chunks of streamed LLM calls",
+    ["provider", "model"],
+    buckets=INTER_TOKEN_LATENCY_BUCKETS,
+)
+
+
+class LLMMetrics:
+    """Totals over every call made to one model"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_duration = 0.0
+        self.total_queue_wait = 0.0
+        self.total_time_to_first_token = 0.0
+        self.streamed_calls = 0
+        self.inter_token_latency_histogram = [0] * (
+            len(INTER_TOKEN_LATENCY_BUCKETS) + 1
+        )
+        self.roles = set()
+
+    def add(self, call: LLMCallTelemetry):
+        self.calls += 1
+        self.errors += call.error is not None
+        self.cache_hits += call.cache_hit
+        self.retries += call.retries
+        self.prompt_tokens += call.prompt_tokens
+        self.completion_tokens += call.completion_tokens
+        self.total_duration += call.duration
+        self.total_queue_wait += call.queue_wait
+        if call.time_to_first_token is not None:
+            self.streamed_calls += 1
+            self.total_time_to_first_token += call.time_to_first_token
+        for i, count in enumerate(call.inter_token_latency_histogram):
+            self.inter_token_latency_histogram[i] += count
+        self.roles.update(call.roles)
+
+    def dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "roles": sorted(self.roles),
+            "average_duration": self.total_duration / self.calls if self.calls else 0,
+            "average_queue_wait": self.total_queue_wait / self.calls
+            if self.calls
+            else 0,
+            "average_time_to_first_token": self.total_time_to_first_token
+            / self.streamed_calls
+            if self.streamed_calls
+            else None,
+            "inter_token_latency_histogram": {
+                **{
+                    str(bound): count
+                    for bound, count in zip(
+                        INTER_TOKEN_LATENCY_BUCKETS, self.inter_token_latency_histogram
+                    )
+                },
+                "+Inf": self.inter_token_latency_histogram[-1],
+            },
+        }
+
+
+# Keyed by (provider, model)
+_metrics: Dict[Tuple[str, str], LLMMetrics] = {}
+
+
+def llm_metrics() -> List[Dict[str, Any]]:
+    return [
+        {"provider": provider, "model": model, **metrics.dict()}
+        for (provider, model), metrics in _metrics.items()
+    ]
+
+
+def count_prompt_tokens(llm, args: Tuple, kwargs: Dict) -> int:
+    """Count the tokens in the prompt and messages passed to an LLM method"""
+    texts = []
+    for value in list(args) + [
+        kwargs.get(k) for k in ("prompt", "with_history", "messages")
+    ]:
+        if isinstance(value, str):
+            texts.append(value)
+        elif isinstance(value, list):
+            texts += [m.content for m in value if isinstance(m, ChatMessage)]
+    return sum(llm.count_tokens_batch(texts))
+
+
+def output_text(item: Any) -> str:
+    """The text of a completion, or of one item of a stream"""
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict) and isinstance(item.get("content"), str):
+        return item["content"]
+    return ""
+
+
+def count_completion_tokens(
+    llm, call: Optional[LLMCallTelemetry], output: List[str]
+) -> int:
+    """
+    Count the tokens of a completion and store them on the call. The rate limiter finishes
+    a call before instrumentation does, so this keeps the completion from being tokenized twice.
+    """
+    text = "".join(output)
+    if call is not None and call._counted_completion == text:
+        return call.completion_tokens
+
+    tokens = llm.count_tokens(text)
+    if call is not None:
+        call.completion_tokens = tokens
+        call._counted_completion = text
+    return tokens
+
+
+def _start_call(llm, method: str) -> LLMCallTelemetry:
+    # Report wrappers like CachedLLM under the provider they wrap
+    provider = llm
+    while getattr(provider, "llm", None) is not None:
+        provider = provider.llm
+    return LLMCallTelemetry(
+        provider=provider.__class__.__name__,
+        model=str(llm.name),
+        method=method,
+        roles=list(llm._roles),
+    )
+
+
+def _export(call: LLMCallTelemetry):
+    status = "success" if call.error is None else "error"
+    LLM_CALLS.labels(call.provider, call.model, call.method, status).inc()
+    if call.cache_hit:
+        LLM_CACHE_HITS.labels(call.model).inc()
+    LLM_TOKENS.labels(call.model, "prompt").inc(call.prompt_tokens)
+    LLM_TOKENS.labels(call.model, "completion").inc(call.completion_tokens)
+    LLM_CALL_DURATION.labels(call.provider, call.model, call.method).observe(
+        call.duration
+    )
+    LLM_QUEUE_WAIT.labels(call.provider, call.model).observe(call.queue_wait)
+    if call.time_to_first_token is not None:
+        LLM_TIME_TO_FIRST_TOKEN.labels(call.provider, call.model).observe(
+            call.time_to_first_token
+        )
+
+
+def _finish_call(
+    llm,
+    call: LLMCallTelemetry,
+    started: float,
+    args: Tuple,
+    kwargs: Dict,
+    output: List[str],
+):
+    call.duration = time.monotonic() - started
+    try:
+        # The rate limiter may have counted these already
+        if call.prompt_tokens == 0:
+            call.prompt_tokens = count_prompt_tokens(llm, args, kwargs)
+        count_completion_tokens(llm, call, output)
+    except Exception as e:
+        logger.debug(f"Failed to count tokens for LLM telemetry: {e}")
+    call._counted_completion = None
+
+    _metrics.setdefault((call.provider, call.model), LLMMetrics()).add(call)
+    _export(call)
+    sink = _call_sink.get()
+    if sink is not None:
+        sink(call)
+
+
+def instrumented(fn: Callable):
+    """
+    Record an LLMCallTelemetry for each call to an LLM method, and add it to the per-model totals.
+
+    Calls made while another call is being recorded (e.g. MaybeProxyOpenAI calling the model
+    it wraps) are part of the outer call, so each call from a step is only counted once.
+    """
+    method = fn.__name__
+
+    if inspect.isasyncgenfunction(fn):
+
+        @functools.wraps(fn)
+        async def stream_wrapper(self, *args, **kwargs):
+            if _current_call.get() is not None:
+                async for item in fn(self, *args, **kwargs):
+                    yield item
+                return
+
+            call = _start_call(self, method)
+            started = last = time.monotonic()
+            output = []
+            gaps = LLM_INTER_TOKEN_LATENCY.labels(call.provider, call.model)
+            agen = fn(self, *args, **kwargs)
+            try:
+                while True:
+                    # Only mark the call as current while the generator is running, not while the caller is
+                    token = _current_call.set(call)
+                    try:
+                        item = await agen.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        _current_call.reset(token)
+
+                    now = time.monotonic()
+                    if call.time_to_first_token is None:
+                        call.time_to_first_token = now - started
+                        call.inter_token_latency_histogram = [0] * (
+                            len(INTER_TOKEN_LATENCY_BUCKETS) + 1
+                        )
+                    else:
+                        call.inter_token_latency_histogram[
+                            bisect.bisect_left(INTER_TOKEN_LATENCY_BUCKETS, now - last)
+                        ] += 1
+                        gaps.observe(now - last)
+                    last = now
+
+                    output.append(output_text(item))
+                    yield item
+            except Exception as e:
+                call.error = e.__class__.__name__
+                raise
+            finally:
+                token = _current_call.set(call)
+                try:
+                    await agen.aclose()
+                finally:
+                    _current_call.reset(token)
+                    _finish_call(self, call, started, args, kwargs, output)
+
+        return stream_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        if _current_call.get() is not None:
+            return await fn(self, *args, **kwargs)
+
+        call = _start_call(self, method)
+        started = time.monotonic()
+        output = []
+        token = _current_call.set(call)
+        try:
+            result = await fn(self, *args, **kwargs)
+            output.append(output_text(result))
+            return result
+        except Exception as e:
+            call.error = e.__class__.__name__
+            raise
+        finally:
+            _current_call.reset(token)
+            _finish_call(self, call, started, args, kwargs, output)
+
+    return wrapper
@@ -24,6 +24,10 @@ class MaybeProxyOpenAI(LLM):
     def context_length(self):
         return self.llm.context_length
 
+    @property
+    def default_args(self):
+        return self.llm.default_args
+
     async def start(
         self,
         *,
@@ -31,10 +35,22 @@ class MaybeProxyOpenAI(LLM):
         unique_id: str,
         write_log: Callable[[str], None]
     ):
+        limits = {
+            key: getattr(self, key)
+            for key in (
+                "max_concurrent_requests",
+                "requests_per_minute",
+                "tokens_per_minute",
+                "max_retries",
+                "retry_base_delay",
+                "retry_max_delay",
+                "hedge_percentile",
+            )
+        }
         if self.api_key is None or self.api_key.strip() == "":
-            self.llm = ProxyServer(model=self.model)
+            self.llm = ProxyServer(model=self.model, **limits)
         else:
-            self.llm = OpenAI(api_key=self.api_key, model=self.model)
+            self.llm = OpenAI(api_key=self.api_key, model=self.model, **limits)
 
         await self.llm.start(write_log=write_log, unique_id=unique_id)
 
@@ -62,3 +78,6 @@ class MaybeProxyOpenAI(LLM):
 
     def count_tokens(self, text: str):
         return self.llm.count_tokens(text)
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return self.llm.count_tokens_batch(texts)
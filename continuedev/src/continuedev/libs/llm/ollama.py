@@ -1,11 +1,21 @@
-import json
 from typing import Any, Coroutine, Dict, Generator, List, Union
 
 import aiohttp
 
 from ...core.main import ChatMessage
 from ..llm import LLM
-from ..util.count_tokens import DEFAULT_ARGS, compile_chat_messages, count_tokens
+from ..util.count_tokens import (
+    DEFAULT_ARGS,
+    compile_chat_messages,
+    count_tokens,
+    count_tokens_batch,
+)
+from ..util.errors import LLMHTTPError
+from ..util.http_client import get_client_session
+from ..util.stream_decoder import iter_ndjson
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 
 class Ollama(LLM):
@@ -19,10 +29,11 @@ class Ollama(LLM):
         arbitrary_types_allowed = True
 
     async def start(self, **kwargs):
-        self._client_session = aiohttp.ClientSession()
+        self._client_session = get_client_session()
 
     async def stop(self):
-        await self._client_session.close()
+        # The session is shared, so it's closed when the server shuts down
+        pass
 
     @property
     def name(self):
@@ -39,6 +50,9 @@ class Ollama(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.name, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.name, texts)
+
     def convert_to_chat(self, msgs: ChatMessage) -> str:
         if len(msgs) == 0:
             return ""
@@ -66,6 +80,9 @@ class Ollama(LLM):
 
         return prompt
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -88,19 +105,15 @@ class Ollama(LLM):
                 "model": self.model,
             },
         ) as resp:
-            async for line in resp.content.iter_any():
-                if line:
-                    try:
-                        json_chunk = line.decode("utf-8")
-                        chunks = json_chunk.split("\n")
-                        for chunk in chunks:
-                            if chunk.strip() != "":
-                                j = json.loads(chunk)
-                                if "response" in j:
-                                    yield j["response"]
-                    except:
-                        raise Exception(str(line[0]))
-
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for j in iter_ndjson(resp):
+                if "response" in j:
+                    yield j["response"]
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(
         self, messages: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -123,27 +136,23 @@ class Ollama(LLM):
                 "model": self.model,
             },
         ) as resp:
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
             # This is streaming application/json instaed of text/event-stream
-            async for line in resp.content.iter_chunks():
-                if line[1]:
-                    try:
-                        json_chunk = line[0].decode("utf-8")
-                        chunks = json_chunk.split("\n")
-                        for chunk in chunks:
-                            if chunk.strip() != "":
-                                j = json.loads(chunk)
-                                if "response" in j:
-                                    yield {
-                                        "role": "assistant",
-                                        "content": j["response"],
-                                    }
-                    except:
-                        raise Exception(str(line[0]))
-
+            async for j in iter_ndjson(resp):
+                if "response" in j:
+                    yield {
+                        "role": "assistant",
+                        "content": j["response"],
+                    }
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, str]:
-        completion = ""
+        completion = []
 
         async with self._client_session.post(
             f"{self.server_url}/api/generate",
@@ -152,17 +161,10 @@ class Ollama(LLM):
                 "model": self.model,
             },
         ) as resp:
-            async for line in resp.content.iter_any():
-                if line:
-                    try:
-                        json_chunk = line.decode("utf-8")
-                        chunks = json_chunk.split("\n")
-                        for chunk in chunks:
-                            if chunk.strip() != "":
-                                j = json.loads(chunk)
-                                if "response" in j:
-                                    completion += j["response"]
-                    except:
-                        raise Exception(str(line[0]))
-
-        return completion
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for j in iter_ndjson(resp):
+                if "response" in j:
+                    completion.append(j["response"])
+
+        return "".join(completion)
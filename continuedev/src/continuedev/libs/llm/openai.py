@@ -20,9 +20,13 @@ from ..util.count_tokens import (
     DEFAULT_ARGS,
     compile_chat_messages,
     count_tokens,
+    count_tokens_batch,
     format_chat_messages,
     prune_raw_prompt_from_top,
 )
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 
 class OpenAIServerInfo(BaseModel):
@@ -100,6 +104,12 @@ class OpenAI(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.model, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.model, texts)
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -139,6 +149,9 @@ class OpenAI(LLM):
 
             self.write_log(f"Completion:\n\n{completion}")
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(
         self, messages: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -172,6 +185,9 @@ class OpenAI(LLM):
                 completion += chunk.choices[0].delta.content
         self.write_log(f"Completion: \n\n{completion}")
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, str]:
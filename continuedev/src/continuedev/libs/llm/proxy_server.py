@@ -21,9 +21,16 @@ from ..util.count_tokens import (
     DEFAULT_ARGS,
     compile_chat_messages,
     count_tokens,
+    count_tokens_batch,
     format_chat_messages,
 )
+from ..util.errors import LLMHTTPError
+from ..util.http_client import get_client_session
+from ..util.stream_decoder import iter_lines, iter_text
 from ..util.telemetry import posthog_logger
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 ca_bundle_path = certifi.where()
 ssl_context = ssl.create_default_context(cafile=ca_bundle_path)
@@ -61,14 +68,13 @@ class ProxyServer(LLM):
         unique_id: str,
         **kwargs,
     ):
-        self._client_session = aiohttp.ClientSession(
-            connector=aiohttp.TCPConnector(ssl_context=ssl_context)
-        )
+        self._client_session = get_client_session(ssl_context=ssl_context)
         self.write_log = write_log
         self.unique_id = unique_id
 
     async def stop(self):
-        await self._client_session.close()
+        # The session is shared, so it's closed when the server shuts down
+        pass
 
     @property
     def name(self):
@@ -85,10 +91,16 @@ class ProxyServer(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.model, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.model, texts)
+
     def get_headers(self):
         # headers with unique id
         return {"unique_id": self.unique_id}
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, str]:
@@ -110,12 +122,15 @@ class ProxyServer(LLM):
             headers=self.get_headers(),
         ) as resp:
             if resp.status != 200:
-                raise Exception(await resp.text())
+                raise LLMHTTPError(resp.status, await resp.text())
 
             response_text = await resp.text()
             self.write_log(f"Completion: \n\n{response_text}")
             return response_text
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(
         self, messages: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, Generator[Union[Any, List, Dict], None, None]]:
@@ -137,36 +152,33 @@ class ProxyServer(LLM):
             headers=self.get_headers(),
         ) as resp:
             # This is streaming application/json instaed of text/event-stream
-            completion = ""
+            completion = []
             if resp.status != 200:
-                raise Exception(await resp.text())
-            async for line in resp.content.iter_chunks():
-                if line[1]:
-                    try:
-                        json_chunk = line[0].decode("utf-8")
-                        json_chunk = "{}" if json_chunk == "" else json_chunk
-                        chunks = json_chunk.split("\n")
-                        for chunk in chunks:
-                            if chunk.strip() != "":
-                                loaded_chunk = json.loads(chunk)
-                                yield loaded_chunk
-                                if "content" in loaded_chunk:
-                                    completion += loaded_chunk["content"]
-                    except Exception as e:
-                        posthog_logger.capture_event(
-                            "proxy_server_parse_error",
-                            {
-                                "error_title": "Proxy server stream_chat parsing failed",
-                                "error_message": "\n".join(
-                                    traceback.format_exception(e)
-                                ),
-                            },
-                        )
-                else:
-                    break
-
-            self.write_log(f"Completion: \n\n{completion}")
-
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for line in iter_lines(resp):
+                if line.strip() == b"":
+                    continue
+                try:
+                    loaded_chunk = json.loads(line)
+                except Exception as e:
+                    posthog_logger.capture_event(
+                        "proxy_server_parse_error",
+                        {
+                            "error_title": "Proxy server stream_chat parsing failed",
+                            "error_message": "\n".join(traceback.format_exception(e)),
+                        },
+                    )
+                    continue
+
+                yield loaded_chunk
+                if "content" in loaded_chunk:
+                    completion.append(loaded_chunk["content"])
+
+            self.write_log(f"Completion: \n\n{''.join(completion)}")
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -187,15 +199,10 @@ class ProxyServer(LLM):
             json={"messages": messages, **args},
             headers=self.get_headers(),
         ) as resp:
-            completion = ""
+            completion = []
             if resp.status != 200:
-                raise Exception(await resp.text())
-            async for line in resp.content.iter_any():
-                if line:
-                    try:
-                        decoded_line = line.decode("utf-8")
-                        yield decoded_line
-                        completion += decoded_line
-                    except:
-                        raise Exception(str(line))
-            self.write_log(f"Completion: \n\n{completion}")
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for text in iter_text(resp):
+                yield text
+                completion.append(text)
+            self.write_log(f"Completion: \n\n{''.join(completion)}")
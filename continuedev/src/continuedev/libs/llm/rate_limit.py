@@ -0,0 +1,353 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, List, Optional, Tuple
+
+from ..util.metrics import add_collector, gauge
+from .instrumentation import (
+    count_completion_tokens,
+    count_prompt_tokens,
+    current_llm_call,
+    output_text,
+)
+
+
+class TokenBucket:
+    """A budget of `per_minute` units that refills continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self._rate = per_minute / 60
+        self._level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(
+            self.capacity, self._level + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def seconds_until_available(self, amount: float) -> float:
+        self._refill()
+        # A request bigger than the whole bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self._level >= amount:
+            return 0
+        return (amount - self._level) / self._rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self._level -= amount
+
+    def refund(self, amount: float):
+        self._refill()
+        self._level = min(self.capacity, self._level + amount)
+
+
+class ProviderLimiter:
+    """
+    Admission control for the requests to a single LLM provider, shared by every session.
+
+    A request is admitted once there is a free concurrency slot and the requests/minute and
+    tokens/minute budgets can cover it. Waiting requests are grouped by client (the LLM object
+    that made them, so each session and model role is a separate client), and the clients
+    take turns, so one session sending many requests can't starve the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        self.configure(max_concurrent, requests_per_minute, tokens_per_minute)
+        self.in_flight = 0
+        self._waiting: "OrderedDict[int, Deque[Tuple[asyncio.Future, float]]]" = (
+            OrderedDict()
+        )
+        self._retry_handle: Optional[asyncio.TimerHandle] = None
+
+        # Metrics
+        self.requests_admitted = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def configure(
+        self,
+        max_concurrent: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self._request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self._token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+
+    @property
+    def tracks_tokens(self) -> bool:
+        return self._token_bucket is not None
+
+    @property
+    def queue_length(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queue_length": self.queue_length,
+            "requests_admitted": self.requests_admitted,
+            "total_wait_seconds": self.total_wait_seconds,
+            "max_wait_seconds": self.max_wait_seconds,
+            "average_wait_seconds": self.total_wait_seconds / self.requests_admitted
+            if self.requests_admitted > 0
+            else 0.0,
+        }
+
+    async def acquire(self, client: int, tokens: float = 0) -> float:
+        """Wait until the request is admitted, returning how long that took. Must be followed by release."""
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(client, deque()).append((future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled, so give the slot back
+                self.release()
+            raise
+
+        waited = time.monotonic() - started
+        self.requests_admitted += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return waited
+
+    def release(self, unused_tokens: float = 0):
+        """Finish a request, returning any tokens that were reserved but not used"""
+        self.in_flight -= 1
+        if unused_tokens > 0 and self._token_bucket is not None:
+            self._token_bucket.refund(unused_tokens)
+        self._dispatch()
+
+    def _dispatch(self):
+        while len(self._waiting) > 0:
+            client, waiters = next(iter(self._waiting.items()))
+            future, tokens = waiters[0]
+            if future.done():
+                # Cancelled while waiting
+                waiters.popleft()
+                if len(waiters) == 0:
+                    del self._waiting[client]
+                continue
+
+            if (
+                self.max_concurrent is not None
+                and self.in_flight >= self.max_concurrent
+            ):
+                return  # release() will dispatch again
+
+            delay = max(
+                self._request_bucket.seconds_until_available(1)
+                if self._request_bucket is not None
+                else 0,
+                self._token_bucket.seconds_until_available(tokens)
+                if self._token_bucket is not None
+                else 0,
+            )
+            if delay > 0:
+                self._schedule_retry(delay)
+                return
+
+            # Admit, then move this client to the back of the line
+            waiters.popleft()
+            del self._waiting[client]
+            if len(waiters) > 0:
+                self._waiting[client] = waiters
+            if self._request_bucket is not None:
+                self._request_bucket.consume(1)
+            if self._token_bucket is not None:
+                self._token_bucket.consume(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _schedule_retry(self, delay: float):
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+
+        def retry():
+            self._retry_handle = None
+            self._dispatch()
+
+        self._retry_handle = asyncio.get_event_loop().call_later(delay, retry)
+
+
+# Limiters are shared by every LLM object that talks to the same provider
+_limiters: Dict[str, ProviderLimiter] = {}
+
+# The limiters that the current task is already inside of, so nested calls
+# (e.g. a stream_chat implemented with complete) don't queue twice
+_held: "contextvars.ContextVar[FrozenSet[str]]" = contextvars.ContextVar(
+    "held_provider_limiters", default=frozenset()
+)
+
+
+def get_provider_limiter(
+    key: str,
+    max_concurrent: Optional[int] = None,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+) -> ProviderLimiter:
+    limits = (max_concurrent, requests_per_minute, tokens_per_minute)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = ProviderLimiter(*limits)
+    elif limits != (
+        limiter.max_concurrent,
+        limiter._request_bucket and limiter._request_bucket.capacity,
+        limiter._token_bucket and limiter._token_bucket.capacity,
+    ):
+        # The most recently loaded config wins
+        limiter.configure(*limits)
+    return limiter
+
+
+def provider_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {key: limiter.stats() for key, limiter in _limiters.items()}
+
+
+LIMITER_IN_FLIGHT = gauge(
+    "continue_llm_limiter_in_flight",
+    "Requests admitted by each provider's limiter and not yet finished",
+    ["provider"],
+)
+LIMITER_QUEUE_LENGTH = gauge(
+    "continue_llm_limiter_queue_length",
+    "Requests waiting for each provider's limiter",
+    ["provider"],
+)
+
+
+def _collect_limiter_metrics():
+    for key, limiter in _limiters.items():
+        LIMITER_IN_FLIGHT.labels(key).set(limiter.in_flight)
+        LIMITER_QUEUE_LENGTH.labels(key).set(limiter.queue_length)
+
+
+add_collector(_collect_limiter_metrics)
+
+
+def rate_limited(fn: Callable):
+    """
+    Make calls to an LLM method wait for the provider's limiter (see LLM.rate_limit_key).
+    Works on both coroutines and async generators; for a stream, the request is counted
+    as in flight until the stream is finished.
+
+    Tokens are reserved up front for the prompt and max_tokens, and whatever the
+    completion didn't use is returned to the budget afterwards.
+    """
+
+    async def admit(llm, args, kwargs) -> Tuple[Optional[ProviderLimiter], int]:
+        """Wait for the limiter, returning it and the number of tokens reserved for the completion"""
+        if (
+            llm.max_concurrent_requests is None
+            and llm.requests_per_minute is None
+            and llm.tokens_per_minute is None
+        ):
+            return None, 0
+
+        key = llm.rate_limit_key
+        if key in _held.get():
+            return None, 0
+
+        limiter = get_provider_limiter(
+            key,
+            llm.max_concurrent_requests,
+            llm.requests_per_minute,
+            llm.tokens_per_minute,
+        )
+        prompt_tokens = completion_tokens = 0
+        if limiter.tracks_tokens:
+            prompt_tokens = count_prompt_tokens(llm, args, kwargs)
+            completion_tokens = kwargs.get("max_tokens") or llm.default_args.get(
+                "max_tokens", 0
+            )
+        waited = await limiter.acquire(id(llm), prompt_tokens + completion_tokens)
+        call = current_llm_call()
+        if call is not None:
+            call.queue_wait += waited
+            if limiter.tracks_tokens:
+                call.prompt_tokens = prompt_tokens
+        return limiter, completion_tokens
+
+    def finish(
+        llm, limiter: ProviderLimiter, completion_tokens: int, output: List[str]
+    ):
+        unused = 0
+        if limiter.tracks_tokens:
+            used = count_completion_tokens(llm, current_llm_call(), output)
+            unused = max(0, completion_tokens - used)
+        limiter.release(unused)
+
+    if inspect.isasyncgenfunction(fn):
+
+        @functools.wraps(fn)
+        async def stream_wrapper(self, *args, **kwargs):
+            limiter, completion_tokens = await admit(self, args, kwargs)
+            if limiter is None:
+                async for item in fn(self, *args, **kwargs):
+                    yield item
+                return
+
+            held = _held.get() | {self.rate_limit_key}
+            output = []
+            agen = fn(self, *args, **kwargs)
+            try:
+                while True:
+                    # Only mark the key as held while the generator is running, not while the caller
+                    # is, or the caller's own calls to the provider would skip the limiter
+                    token = _held.set(held)
+                    try:
+                        item = await agen.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        _held.reset(token)
+
+                    output.append(output_text(item))
+                    yield item
+            finally:
+                token = _held.set(held)
+                try:
+                    await agen.aclose()
+                finally:
+                    _held.reset(token)
+                    finish(self, limiter, completion_tokens, output)
+
+        return stream_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        limiter, completion_tokens = await admit(self, args, kwargs)
+        if limiter is None:
+            return await fn(self, *args, **kwargs)
+
+        held = _held.get()
+        _held.set(held | {self.rate_limit_key})
+        output = []
+        try:
+            result = await fn(self, *args, **kwargs)
+            output.append(output_text(result))
+            return result
+        finally:
+            _held.set(held)
+            finish(self, limiter, completion_tokens, output)
+
+    return wrapper
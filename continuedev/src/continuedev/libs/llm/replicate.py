@@ -1,11 +1,14 @@
-import concurrent.futures
 from typing import List
 
 import replicate
 
 from ...core.main import ChatMessage
-from ..util.count_tokens import DEFAULT_ARGS, count_tokens
+from ..util.count_tokens import DEFAULT_ARGS, count_tokens, count_tokens_batch
+from ..util.executor import NETWORK_LANE, iterate_in_executor, run_in_executor
 from . import LLM
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 
 class ReplicateLLM(LLM):
@@ -30,12 +33,18 @@ class ReplicateLLM(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.name, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.name, texts)
+
     async def start(self):
         self._client = replicate.Client(api_token=self.api_key)
 
     async def stop(self):
         pass
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ):
@@ -49,23 +58,34 @@ class ReplicateLLM(LLM):
 
             return completion
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(helper)
-            completion = future.result()
-
-        return completion
+        return await run_in_executor(helper, lane=NETWORK_LANE)
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ):
-        for item in self._client.run(
-            self.model, input={"message": prompt, "prompt": prompt}
+        async for item in iterate_in_executor(
+            lambda: self._client.run(
+                self.model, input={"message": prompt, "prompt": prompt}
+            ),
+            lane=NETWORK_LANE,
         ):
             yield item
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(self, messages: List[ChatMessage] = None, **kwargs):
-        for item in self._client.run(
-            self.model,
-            input={"message": messages[-1].content, "prompt": messages[-1].content},
+        async for item in iterate_in_executor(
+            lambda: self._client.run(
+                self.model,
+                input={
+                    "message": messages[-1].content,
+                    "prompt": messages[-1].content,
+                },
+            ),
+            lane=NETWORK_LANE,
         ):
             yield {"content": item, "role": "assistant"}
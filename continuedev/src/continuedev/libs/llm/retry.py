@@ -0,0 +1,322 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import random
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Coroutine,
+    Dict,
+    FrozenSet,
+    Optional,
+    Tuple,
+)
+
+import aiohttp
+
+import anthropic
+from openai import error as openai_errors
+
+from ..util.errors import LLMHTTPError
+from ..util.logging import logger
+from ..util.metrics import counter
+from .instrumentation import current_llm_call
+
+RETRYABLE_ERRORS = (
+    openai_errors.APIError,
+    openai_errors.APIConnectionError,
+    openai_errors.RateLimitError,
+    openai_errors.ServiceUnavailableError,
+    openai_errors.Timeout,
+    openai_errors.TryAgain,
+    anthropic.APIConnectionError,
+    anthropic.InternalServerError,
+    anthropic.RateLimitError,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, LLMHTTPError):
+        # Running out of free usage isn't going to fix itself
+        if "rate_limit_ip_middleware" in str(e):
+            return False
+        return e.status in (408, 429) or e.status >= 500
+    if (
+        isinstance(e, openai_errors.RateLimitError)
+        and getattr(e, "code", None) == "insufficient_quota"
+    ):
+        return False
+    return isinstance(e, RETRYABLE_ERRORS)
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class LatencyTracker:
+    """Remembers recent latencies, to decide when a request is slow enough to be hedged"""
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, max_samples: int = 200):
+        self._samples = deque(maxlen=max_samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class ResilienceStats:
+    def __init__(self):
+        self.retries = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def dict(self) -> Dict[str, int]:
+        return {
+            "retries": self.retries,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+        }
+
+
+# Keyed by (LLM.rate_limit_key, kind of call), because a stream's latency is the time to its first item
+_latencies: Dict[Tuple[str, str], LatencyTracker] = {}
+_stats: Dict[str, ResilienceStats] = {}
+
+LLM_RETRIES = counter(
+    "continue_llm_retries", "Failed LLM requests that were retried", ["provider"]
+)
+LLM_HEDGES = counter(
+    "continue_llm_hedges",
+    "Duplicate requests sent for slow LLM calls, and how many of them finished first",
+    ["provider", "outcome"],
+)
+
+
+# The providers whose resilient calls the current task is inside of. A nested call (e.g. a
+# stream_chat implemented with complete) doesn't retry on its own, because the outer call
+# already retries, and nesting would multiply the attempts
+_retrying: "contextvars.ContextVar[FrozenSet[str]]" = contextvars.ContextVar(
+    "retrying_providers", default=frozenset()
+)
+
+
+def resilience_stats() -> Dict[str, Dict[str, int]]:
+    return {key: stats.dict() for key, stats in _stats.items()}
+
+
+def _hedge_threshold(llm, kind: str) -> Optional[float]:
+    if llm.hedge_percentile is None:
+        return None
+    tracker = _latencies.setdefault((llm.rate_limit_key, kind), LatencyTracker())
+    return tracker.percentile(llm.hedge_percentile)
+
+
+def _record_latency(llm, kind: str, seconds: float):
+    _latencies.setdefault((llm.rate_limit_key, kind), LatencyTracker()).record(seconds)
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _race(
+    llm, kind: str, make_attempt: Callable[[], Coroutine], threshold: float
+) -> Tuple[Any, int]:
+    """
+    Start an attempt, and if it hasn't finished after `threshold` seconds, start a second one.
+    Return the result of whichever succeeds first, and the index of that attempt.
+    """
+    tasks = [asyncio.ensure_future(make_attempt())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=threshold)
+        if not done:
+            _stats.setdefault(llm.rate_limit_key, ResilienceStats()).hedges_sent += 1
+            LLM_HEDGES.labels(llm.rate_limit_key, "sent").inc()
+            tasks.append(asyncio.ensure_future(make_attempt()))
+
+        pending = set(tasks)
+        error = None
+        while len(pending) > 0:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), tasks.index(task)
+                error = task.exception()
+        raise error
+    finally:
+        await _cancel([task for task in tasks if not task.done()])
+
+
+_EMPTY = object()
+
+
+async def _next_item(agen: AsyncGenerator, retrying: FrozenSet[str]) -> Any:
+    # Only mark the provider while the generator is running, not while the caller is,
+    # or the caller's own calls to the provider would never be retried
+    token = _retrying.set(retrying)
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _EMPTY
+    finally:
+        _retrying.reset(token)
+
+
+async def _aclose(agen: AsyncGenerator, retrying: FrozenSet[str]):
+    token = _retrying.set(retrying)
+    try:
+        await agen.aclose()
+    finally:
+        _retrying.reset(token)
+
+
+def resilient(fn: Callable):
+    """
+    Retry calls to an LLM method that fail with a retryable error, with jittered exponential
+    backoff (see LLM.max_retries). A stream is only retried if it fails before yielding anything,
+    so nothing is ever repeated to the caller. Calls made from inside another resilient call
+    to the same provider aren't retried separately.
+
+    If LLM.hedge_percentile is set, a call that is slower than that percentile of recent
+    calls (or, for a stream, slower to give its first item) gets a second, identical request,
+    and whichever finishes first is used.
+    """
+
+    async def wait_before_retry(llm, attempt: int, e: Exception):
+        _stats.setdefault(llm.rate_limit_key, ResilienceStats()).retries += 1
+        LLM_RETRIES.labels(llm.rate_limit_key).inc()
+        call = current_llm_call()
+        if call is not None:
+            call.retries += 1
+        delay = backoff_delay(attempt, llm.retry_base_delay, llm.retry_max_delay)
+        logger.warning(
+            f"Request to {llm.name} failed ({e.__class__.__name__}: {e}), retrying in {delay:.1f}s"
+        )
+        await asyncio.sleep(delay)
+
+    if inspect.isasyncgenfunction(fn):
+
+        async def start_stream(
+            llm, args, kwargs, retrying: FrozenSet[str]
+        ) -> Tuple[AsyncGenerator, Any]:
+            """Start the stream and wait for its first item"""
+            threshold = _hedge_threshold(llm, "stream")
+            started = time.monotonic()
+            if threshold is None:
+                agen = fn(llm, *args, **kwargs)
+                try:
+                    first = await _next_item(agen, retrying)
+                except BaseException:
+                    await _aclose(agen, retrying)
+                    raise
+            else:
+                agens = []
+
+                def make_attempt():
+                    agens.append(fn(llm, *args, **kwargs))
+                    return _next_item(agens[-1], retrying)
+
+                winner = None
+                try:
+                    first, winner = await _race(llm, "stream", make_attempt, threshold)
+                finally:
+                    # Close the streams that lost, or all of them if both failed
+                    for i, agen in enumerate(agens):
+                        if i != winner:
+                            await _aclose(agen, retrying)
+                if winner > 0:
+                    _stats[llm.rate_limit_key].hedges_won += 1
+                    LLM_HEDGES.labels(llm.rate_limit_key, "won").inc()
+                agen = agens[winner]
+
+            _record_latency(llm, "stream", time.monotonic() - started)
+            return agen, first
+
+        @functools.wraps(fn)
+        async def stream_wrapper(self, *args, **kwargs):
+            if self.rate_limit_key in _retrying.get():
+                async for item in fn(self, *args, **kwargs):
+                    yield item
+                return
+
+            retrying = _retrying.get() | {self.rate_limit_key}
+            attempt = 0
+            while True:
+                emitted = False
+                agen = None
+                try:
+                    agen, first = await start_stream(self, args, kwargs, retrying)
+                    if first is _EMPTY:
+                        return
+                    emitted = True
+                    yield first
+                    while True:
+                        item = await _next_item(agen, retrying)
+                        if item is _EMPTY:
+                            return
+                        yield item
+                except Exception as e:
+                    if emitted or attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    await wait_before_retry(self, attempt, e)
+                    attempt += 1
+                finally:
+                    if agen is not None:
+                        await _aclose(agen, retrying)
+
+        return stream_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        if self.rate_limit_key in _retrying.get():
+            return await fn(self, *args, **kwargs)
+
+        token = _retrying.set(_retrying.get() | {self.rate_limit_key})
+        attempt = 0
+        try:
+            while True:
+                try:
+                    threshold = _hedge_threshold(self, "complete")
+                    started = time.monotonic()
+                    if threshold is None:
+                        result = await fn(self, *args, **kwargs)
+                    else:
+                        result, winner = await _race(
+                            self,
+                            "complete",
+                            lambda: fn(self, *args, **kwargs),
+                            threshold,
+                        )
+                        if winner > 0:
+                            _stats[self.rate_limit_key].hedges_won += 1
+                            LLM_HEDGES.labels(self.rate_limit_key, "won").inc()
+                    _record_latency(self, "complete", time.monotonic() - started)
+                    return result
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    await wait_before_retry(self, attempt, e)
+                    attempt += 1
+        finally:
+            _retrying.reset(token)
+
+    return wrapper
@@ -5,7 +5,18 @@ import aiohttp
 
 from ...core.main import ChatMessage
 from ..llm import LLM
-from ..util.count_tokens import DEFAULT_ARGS, compile_chat_messages, count_tokens
+from ..util.count_tokens import (
+    DEFAULT_ARGS,
+    compile_chat_messages,
+    count_tokens,
+    count_tokens_batch,
+)
+from ..util.errors import LLMHTTPError
+from ..util.http_client import get_client_session
+from ..util.stream_decoder import iter_sse_data, iter_text
+from .instrumentation import instrumented
+from .rate_limit import rate_limited
+from .retry import resilient
 
 
 class TogetherLLM(LLM):
@@ -19,12 +30,11 @@ class TogetherLLM(LLM):
     _client_session: aiohttp.ClientSession = None
 
     async def start(self, **kwargs):
-        self._client_session = aiohttp.ClientSession(
-            connector=aiohttp.TCPConnector(verify_ssl=self.verify_ssl)
-        )
+        self._client_session = get_client_session(verify_ssl=self.verify_ssl)
 
     async def stop(self):
-        await self._client_session.close()
+        # The session is shared, so it's closed when the server shuts down
+        pass
 
     @property
     def name(self):
@@ -41,6 +51,9 @@ class TogetherLLM(LLM):
     def count_tokens(self, text: str):
         return count_tokens(self.name, text)
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self.name, texts)
+
     def convert_to_prompt(self, chat_messages: List[ChatMessage]) -> str:
         system_message = None
         if chat_messages[0]["role"] == "system":
@@ -55,6 +68,9 @@ class TogetherLLM(LLM):
         prompt += "<bot>:"
         return prompt
 
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_complete(
         self, prompt, with_history: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -78,13 +94,14 @@ class TogetherLLM(LLM):
             json={"prompt": self.convert_to_prompt(messages), **args},
             headers={"Authorization": f"Bearer {self.api_key}"},
         ) as resp:
-            async for line in resp.content.iter_any():
-                if line:
-                    try:
-                        yield line.decode("utf-8")
-                    except:
-                        raise Exception(str(line))
-
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for text in iter_text(resp):
+                yield text
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def stream_chat(
         self, messages: List[ChatMessage] = None, **kwargs
     ) -> Generator[Union[Any, List, Dict], None, None]:
@@ -105,25 +122,19 @@ class TogetherLLM(LLM):
             json={"prompt": self.convert_to_prompt(messages), **args},
             headers={"Authorization": f"Bearer {self.api_key}"},
         ) as resp:
-            async for line in resp.content.iter_chunks():
-                if line[1]:
-                    json_chunk = line[0].decode("utf-8")
-                    if json_chunk.startswith(": ping - ") or json_chunk.startswith(
-                        "data: [DONE]"
-                    ):
-                        continue
-                    if json_chunk.startswith("data: "):
-                        json_chunk = json_chunk[6:]
-                    chunks = json_chunk.split("\n")
-                    for chunk in chunks:
-                        if chunk.strip() != "":
-                            json_chunk = json.loads(chunk)
-                            if "choices" in json_chunk:
-                                yield {
-                                    "role": "assistant",
-                                    "content": json_chunk["choices"][0]["text"],
-                                }
-
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, await resp.text())
+            async for data in iter_sse_data(resp):
+                json_chunk = json.loads(data)
+                if "choices" in json_chunk:
+                    yield {
+                        "role": "assistant",
+                        "content": json_chunk["choices"][0]["text"],
+                    }
+
+    @instrumented
+    @resilient
+    @rate_limited
     async def complete(
         self, prompt: str, with_history: List[ChatMessage] = None, **kwargs
     ) -> Coroutine[Any, Any, str]:
@@ -143,12 +154,11 @@ class TogetherLLM(LLM):
             json={"prompt": self.convert_to_prompt(messages), **args},
             headers={"Authorization": f"Bearer {self.api_key}"},
         ) as resp:
-            try:
-                text = await resp.text()
-                j = json.loads(text)
-                if "choices" not in j["output"]:
-                    raise Exception(text)
-                if "output" in j:
-                    return j["output"]["choices"][0]["text"]
-            except:
-                raise Exception(await resp.text())
+            text = await resp.text()
+            if resp.status != 200:
+                raise LLMHTTPError(resp.status, text)
+
+        try:
+            return json.loads(text)["output"]["choices"][0]["text"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise Exception(text)
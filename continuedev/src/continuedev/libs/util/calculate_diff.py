@@ -1,12 +1,14 @@
 import difflib
-from typing import List
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
 
 from ...models.filesystem import FileEdit
-from ...models.main import Position, Range
+from ...models.main import LineIndex, Position, Range
 
 
 def calculate_diff(filepath: str, original: str, updated: str) -> List[FileEdit]:
     s = difflib.SequenceMatcher(None, original, updated)
+    line_index = LineIndex(original)
     offset = 0  # The indices are offset by previous deletions/insertions
     edits = []
     for tag, i1, i2, j1, j2 in s.get_opcodes():
@@ -16,13 +18,15 @@ def calculate_diff(filepath: str, original: str, updated: str) -> List[FileEdit]
             pass
         elif tag == "delete":
             edits.append(
-                FileEdit.from_deletion(filepath, Range.from_indices(original, i1, i2))
+                FileEdit.from_deletion(
+                    filepath, Range.from_indices(original, i1, i2, line_index)
+                )
             )
             offset -= i2 - i1
         elif tag == "insert":
             edits.append(
                 FileEdit.from_insertion(
-                    filepath, Position.from_index(original, i1), replacement
+                    filepath, Position.from_index(original, i1, line_index), replacement
                 )
             )
             offset += j2 - j1
@@ -30,7 +34,7 @@ def calculate_diff(filepath: str, original: str, updated: str) -> List[FileEdit]
             edits.append(
                 FileEdit(
                     filepath=filepath,
-                    range=Range.from_indices(original, i1, i2),
+                    range=Range.from_indices(original, i1, i2, line_index),
                     replacement=replacement,
                 )
             )
@@ -41,114 +45,199 @@ def calculate_diff(filepath: str, original: str, updated: str) -> List[FileEdit]
     return edits
 
 
-def calculate_diff2(filepath: str, original: str, updated: str) -> List[FileEdit]:
-    # original_lines = original.splitlines()
-    # updated_lines = updated.splitlines()
-    # offset = 0
-    # while len(original_lines) and len(updated_lines) and original_lines[0] == updated_lines[0]:
-    #     original_lines = original_lines[1:]
-    #     updated_lines = updated_lines[1:]
-
-    # while len(original_lines) and len(updated_lines) and original_lines[-1] == updated_lines[-1]:
-    #     original_lines = original_lines[:-1]
-    #     updated_lines = updated_lines[:-1]
-
-    # original = "\n".join(original_lines)
-    # updated = "\n".join(updated_lines)
-
-    edits = []
-    max_iterations = 1000
-    i = 0
-    while not original == updated:
-        # TODO - For some reason it can't handle a single newline at the end of the file?
-        s = difflib.SequenceMatcher(None, original, updated)
-        opcodes = s.get_opcodes()
-        for edit_index in range(len(opcodes)):
-            tag, i1, i2, j1, j2 = s.get_opcodes()[edit_index]
-            replacement = updated[j1:j2]
-            if tag == "equal":
-                continue  # ;)
-            elif tag == "delete":
-                edits.append(
-                    FileEdit.from_deletion(
-                        filepath, Range.from_indices(original, i1, i2)
-                    )
-                )
-            elif tag == "insert":
-                edits.append(
-                    FileEdit.from_insertion(
-                        filepath, Position.from_index(original, i1), replacement
-                    )
-                )
-            elif tag == "replace":
-                edits.append(
-                    FileEdit(
-                        filepath=filepath,
-                        range=Range.from_indices(original, i1, i2),
-                        replacement=replacement,
-                    )
-                )
+# Line diffs further apart than this are sent as a single replacement of everything in between,
+# which keeps the (edit distance)^2 memory of the Myers backtrace bounded
+MAX_EDIT_DISTANCE = 2000
+
+
+def _matching_blocks(
+    a: List[int], b: List[int], max_edit_distance: int
+) -> Optional[List[Tuple[int, int, int]]]:
+    """
+    The blocks (i, j, size) where a[i : i + size] == b[j : j + size] in a shortest edit script
+    from a to b, found with Myers' O((N + M)D) algorithm. None if more than `max_edit_distance`
+    lines would have to be inserted or deleted.
+    """
+    n, m = len(a), len(b)
+    max_d = min(n + m, max_edit_distance)
+    offset = max_d + 1
+    # v[offset + k] is the furthest x reached on diagonal k = x - y
+    v = [0] * (2 * max_d + 3)
+    # The diagonals -d..d of v before each round d, to walk the path back afterwards
+    trace = []
+    for d in range(max_d + 1):
+        trace.append(v[offset - d : offset + d + 1])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
             else:
-                raise Exception("Unexpected difflib.SequenceMatcher tag: " + tag)
-            break
-
-        original = apply_edit_to_str(original, edits[-1])
-
-        i += 1
-        if i > max_iterations:
-            raise Exception("Max iterations reached")
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace: List[List[int]], x: int, y: int) -> List[Tuple[int, int, int]]:
+    blocks = []
+    for d in range(len(trace) - 1, -1, -1):
+        k = x - y
+        if d == 0:
+            prev_x = prev_y = snake_x = 0
+        else:
+            v = trace[d]  # v[d + k] is diagonal k after round d - 1
+            if k == -d or (k != d and v[d + k - 1] < v[d + k + 1]):
+                # Came down from diagonal k + 1, inserting b[prev_y]
+                prev_x = snake_x = v[d + k + 1]
+                prev_y = prev_x - k - 1
+            else:
+                # Came across from diagonal k - 1, deleting a[prev_x]
+                prev_x = v[d + k - 1]
+                prev_y = prev_x - k + 1
+                snake_x = prev_x + 1
+
+        # The equal lines followed after the move
+        if x > snake_x:
+            blocks.append((snake_x, snake_x - k, x - snake_x))
+        x, y = prev_x, prev_y
+
+    blocks.reverse()
+    return blocks
+
+
+def _line_opcodes(
+    a: List[str], b: List[str], max_edit_distance: int = MAX_EDIT_DISTANCE
+) -> List[Tuple[str, int, int, int, int]]:
+    """Line-level opcodes in the format of difflib.SequenceMatcher.get_opcodes"""
+    prefix = 0
+    while prefix < min(len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < min(len(a), len(b)) - prefix
+        and a[len(a) - suffix - 1] == b[len(b) - suffix - 1]
+    ):
+        suffix += 1
+
+    # Compare the lines in between as ints, so matching is a single comparison
+    ids: Dict[str, int] = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a[prefix : len(a) - suffix]]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b[prefix : len(b) - suffix]]
+    blocks = _matching_blocks(a_ids, b_ids, max_edit_distance) or []
+
+    opcodes = []
+    i = j = 0
+    for bi, bj, size in blocks + [(len(a_ids), len(b_ids), 0)]:
+        tag = None
+        if i < bi and j < bj:
+            tag = "replace"
+        elif i < bi:
+            tag = "delete"
+        elif j < bj:
+            tag = "insert"
+        if tag is not None:
+            opcodes.append((tag, prefix + i, prefix + bi, prefix + j, prefix + bj))
+        i, j = bi + size, bj + size
+    return opcodes
+
+
+def _refine_line(
+    filepath: str,
+    original: str,
+    start: int,
+    original_line: str,
+    updated_line: str,
+    line_index: LineIndex,
+) -> List[FileEdit]:
+    """Character-level edits (last first) turning original_line, at index start in original, into updated_line"""
+    s = difflib.SequenceMatcher(None, original_line, updated_line, autojunk=False)
+    if s.ratio() < 0.5:
+        # Scattered edits to an unrelated line are harder to read than replacing it
+        opcodes = [("replace", 0, len(original_line), 0, len(updated_line))]
+    else:
+        opcodes = s.get_opcodes()
 
+    edits = []
+    for tag, i1, i2, j1, j2 in reversed(opcodes):
+        if tag == "equal":
+            continue
+        edits.append(
+            FileEdit(
+                filepath=filepath,
+                range=Range.from_indices(original, start + i1, start + i2, line_index),
+                replacement=updated_line[j1:j2],
+            )
+        )
     return edits
 
 
-def read_range_in_str(s: str, r: Range) -> str:
-    lines = s.splitlines()[r.start.line : r.end.line + 1]
-    if len(lines) == 0:
-        return ""
-
-    lines[0] = lines[0][r.start.character :]
-    lines[-1] = lines[-1][: r.end.character + 1]
-    return "\n".join(lines)
+def calculate_line_diff(
+    filepath: str, original: str, updated: str, refine: bool = False
+) -> List[FileEdit]:
+    """
+    The edits that turn original into updated, diffing lines rather than characters.
 
+    The edits are in reverse order, so each one's range is in terms of the original and
+    still valid after the edits before it have been applied. With `refine`, lines that
+    were changed one-for-one are diffed by character, so that small changes stay small.
+    """
+    original_lines = original.splitlines(keepends=True)
+    updated_lines = updated.splitlines(keepends=True)
+    line_index = LineIndex(original)
+    offsets = list(accumulate(map(len, original_lines), initial=0))
 
-def apply_edit_to_str(s: str, edit: FileEdit) -> str:
-    read_range_in_str(s, edit.range)
+    edits = []
+    for tag, i1, i2, j1, j2 in reversed(_line_opcodes(original_lines, updated_lines)):
+        if refine and tag == "replace" and i2 - i1 == j2 - j1:
+            for i, j in zip(range(i2 - 1, i1 - 1, -1), range(j2 - 1, j1 - 1, -1)):
+                edits += _refine_line(
+                    filepath,
+                    original,
+                    offsets[i],
+                    original_lines[i],
+                    updated_lines[j],
+                    line_index,
+                )
+            continue
 
-    # Split lines and deal with some edge cases (could obviously be nicer)
-    lines = s.splitlines()
-    if s.startswith("\n"):
-        lines.insert(0, "")
-    if s.endswith("\n"):
-        lines.append("")
+        replacement = "".join(updated_lines[j1:j2])
+        r = Range.from_indices(original, offsets[i1], offsets[i2], line_index)
+        if tag == "delete":
+            edits.append(FileEdit.from_deletion(filepath, r))
+        elif tag == "insert":
+            edits.append(FileEdit.from_insertion(filepath, r.start, replacement))
+        else:
+            edits.append(FileEdit(filepath=filepath, range=r, replacement=replacement))
 
-    if len(lines) == 0:
-        lines = [""]
+    return edits
 
-    end = Position(line=edit.range.end.line, character=edit.range.end.character)
-    if edit.range.end.line == len(lines) and edit.range.end.character == 0:
-        end = Position(
-            line=edit.range.end.line - 1,
-            character=len(lines[min(len(lines) - 1, edit.range.end.line - 1)]),
-        )
 
-    before_lines = lines[: edit.range.start.line]
-    after_lines = lines[end.line + 1 :]
-    between_str = (
-        lines[min(len(lines) - 1, edit.range.start.line)][: edit.range.start.character]
-        + edit.replacement
-        + lines[min(len(lines) - 1, end.line)][end.character + 1 :]
-    )
-
-    Range(
-        start=edit.range.start,
-        end=Position(
-            line=edit.range.start.line + len(edit.replacement.splitlines()) - 1,
-            character=edit.range.start.character
-            + len(edit.replacement.splitlines()[-1])
-            if edit.replacement != ""
-            else 0,
-        ),
-    )
-
-    lines = before_lines + between_str.splitlines() + after_lines
-    return "\n".join(lines)
+def calculate_line_hunk(
+    original_lines: List[str], updated_lines: List[str]
+) -> Optional[Tuple[int, int, List[str]]]:
+    """
+    The smallest single replacement that turns original_lines into updated_lines,
+    as (start, end, replacement) where original_lines[start:end] is replaced. None if they are equal.
+    """
+    start = 0
+    max_start = min(len(original_lines), len(updated_lines))
+    while start < max_start and original_lines[start] == updated_lines[start]:
+        start += 1
+
+    common_suffix = 0
+    max_suffix = max_start - start
+    while (
+        common_suffix < max_suffix
+        and original_lines[-common_suffix - 1] == updated_lines[-common_suffix - 1]
+    ):
+        common_suffix += 1
+
+    end = len(original_lines) - common_suffix
+    replacement = updated_lines[start : len(updated_lines) - common_suffix]
+    if start == end and len(replacement) == 0:
+        return None
+    return start, end, replacement
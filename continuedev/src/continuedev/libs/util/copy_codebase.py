@@ -18,6 +18,7 @@ from ...models.main import (
     RenameFile,
     SequentialFileSystemEdit,
 )
+from .calculate_diff import calculate_line_diff
 from .map_path import map_path
 
 
@@ -91,7 +92,7 @@ class CopyCodebaseEventHandler(PatternMatchingEventHandler):
                 copy_filepath = map_path(src, self.orig_root, self.copy_root)
                 old = self.filesystem.read(copy_filepath)
 
-                edits = calculate_diff(src, updated, old)
+                edits = calculate_line_diff(src, old, updated)
                 return SequentialFileSystemEdit(edits)
         return None
 
@@ -1,5 +1,9 @@
+import hashlib
 import json
-from typing import Dict, List, Union
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Dict, List, Tuple, Union
 
 import tiktoken
 from tiktoken_ext import openai_public  # noqa: F401
@@ -25,26 +29,163 @@ DEFAULT_ARGS = {
 }
 
 
-def encoding_for_model(model_name: str):
-    try:
-        return tiktoken.encoding_for_model(aliases.get(model_name, model_name))
-    except:
-        return tiktoken.encoding_for_model("gpt-3.5-turbo")
+# Encodings are expensive to look up, so keep one per (resolved) model name
+_encodings: Dict[str, tiktoken.Encoding] = {}
+
+
+def encoding_for_model(model_name: str) -> tiktoken.Encoding:
+    model_name = aliases.get(model_name, model_name)
+    if model_name not in _encodings:
+        try:
+            _encodings[model_name] = tiktoken.encoding_for_model(model_name)
+        except Exception:
+            _encodings[model_name] = tiktoken.encoding_for_model("gpt-3.5-turbo")
+    return _encodings[model_name]
+
+
+# LRU cache of token counts, keyed by (encoding name, hash of the text)
+MAX_TOKEN_COUNT_CACHE_SIZE = 4096
+_token_count_cache: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+
+
+def _content_hash(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8", errors="surrogatepass")).digest()
+
+
+def count_tokens_batch(
+    model_name: str, texts: List[Union[str, None]], num_threads: int = 8
+) -> List[int]:
+    """
+    Count the tokens in each of the given texts. Cached counts are reused, and all of the
+    texts that aren't cached are encoded together with a single call to encode_ordinary_batch,
+    which runs tiktoken's native encoder on a pool of threads.
+    """
+    encoding = encoding_for_model(model_name)
+    counts = [0] * len(texts)
+
+    # Map each uncached text to the positions it appears at, so duplicates are encoded once
+    uncached: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        if text is None:
+            continue
+        key = (encoding.name, _content_hash(text))
+        if key in _token_count_cache:
+            _token_count_cache.move_to_end(key)
+            counts[i] = _token_count_cache[key]
+        else:
+            uncached.setdefault(text, []).append(i)
+
+    if len(uncached) == 0:
+        return counts
+
+    to_encode = list(uncached.keys())
+    if len(to_encode) == 1:
+        # Not worth starting a thread pool for
+        encoded = [encoding.encode_ordinary(to_encode[0])]
+    else:
+        encoded = encoding.encode_ordinary_batch(to_encode, num_threads=num_threads)
+
+    for text, tokens in zip(to_encode, encoded):
+        _token_count_cache[(encoding.name, _content_hash(text))] = len(tokens)
+        for i in uncached[text]:
+            counts[i] = len(tokens)
+    while len(_token_count_cache) > MAX_TOKEN_COUNT_CACHE_SIZE:
+        _token_count_cache.popitem(last=False)
+
+    return counts
 
 
 def count_tokens(model_name: str, text: Union[str, None]):
-    if text is None:
-        return 0
+    return count_tokens_batch(model_name, [text])[0]
+
+
+class LineTokenCounts:
+    """
+    The cumulative number of tokens in the lines of a file, so that the number of tokens
+    in any run of lines is a subtraction, and the window of lines that fits in a token budget
+    is a binary search. cumulative[i] is the number of tokens in the first i lines.
+    """
+
+    def __init__(self, counts: List[int]):
+        self.cumulative = [0] + list(accumulate(counts))
+
+    @property
+    def num_lines(self) -> int:
+        return len(self.cumulative) - 1
+
+    def tokens_in_lines(self, start: int, end: int) -> int:
+        return self.cumulative[end] - self.cumulative[start]
+
+    def fewest_lines_from_start(self, tokens: int, max_lines: int) -> int:
+        """The fewest lines (at least 1 and at most max_lines) from the start of the file that have at least `tokens` tokens"""
+        return max(1, min(bisect_left(self.cumulative, tokens), max_lines))
+
+    def fewest_lines_from_end(self, tokens: int, max_lines: int) -> int:
+        """The fewest lines (at least 1 and at most max_lines) from the end of the file that have at least `tokens` tokens"""
+        # The last i lines have at least `tokens` tokens when cumulative[num_lines - i] is at most this
+        threshold = self.cumulative[-1] - tokens
+        last_start = bisect_right(self.cumulative, threshold) - 1
+        return max(1, min(self.num_lines - last_start, max_lines))
+
+
+# LRU cache of LineTokenCounts, keyed by (encoding name, filepath, hash of the contents)
+MAX_LINE_TOKEN_COUNTS_CACHE_SIZE = 16
+_line_token_counts_cache: "OrderedDict[Tuple[str, str, bytes], LineTokenCounts]" = (
+    OrderedDict()
+)
+
+
+def line_token_counts(
+    model_name: str, filepath: str, lines: List[str], num_threads: int = 8
+) -> LineTokenCounts:
+    """
+    The LineTokenCounts of a file. They are cached until the file's contents change, so editing the same file again doesn't count its tokens again.
+    The lines are encoded directly rather than with count_tokens_batch, which would fill its cache with single lines.
+    """
     encoding = encoding_for_model(model_name)
-    return len(encoding.encode(text, disallowed_special=()))
+    key = (encoding.name, filepath, _content_hash("\n".join(lines)))
+    if key in _line_token_counts_cache:
+        _line_token_counts_cache.move_to_end(key)
+        return _line_token_counts_cache[key]
+
+    encoded = encoding.encode_ordinary_batch(lines, num_threads=num_threads)
+    counts = _line_token_counts_cache[key] = LineTokenCounts(
+        [len(tokens) for tokens in encoded]
+    )
+    while len(_line_token_counts_cache) > MAX_LINE_TOKEN_COUNTS_CACHE_SIZE:
+        _line_token_counts_cache.popitem(last=False)
+    return counts
+
+
+# Doing simpler, safer version of what is here:
+# https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+# every message follows <|start|>{role/name}\n{content}<|end|>\n
+TOKENS_PER_MESSAGE = 4
+
+
+def count_chat_messages_tokens(
+    model_name: str, chat_messages: List[ChatMessage]
+) -> List[int]:
+    """Count the tokens in each of the given messages, encoding any that aren't cached in one batch"""
+    # Each message remembers its count, which is valid as long as the content hasn't been replaced
+    encoding_name = encoding_for_model(model_name).name
+    stale = [
+        message
+        for message in chat_messages
+        if message._token_count is None
+        or message._token_count[0] != encoding_name
+        or message._token_count[1] is not message.content
+    ]
+    if len(stale) > 0:
+        counts = count_tokens_batch(model_name, [m.content for m in stale])
+        for message, count in zip(stale, counts):
+            message._token_count = (encoding_name, message.content, count)
+
+    return [message._token_count[2] + TOKENS_PER_MESSAGE for message in chat_messages]
 
 
 def count_chat_message_tokens(model_name: str, chat_message: ChatMessage) -> int:
-    # Doing simpler, safer version of what is here:
-    # https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-    # every message follows <|start|>{role/name}\n{content}<|end|>\n
-    TOKENS_PER_MESSAGE = 4
-    return count_tokens(model_name, chat_message.content) + TOKENS_PER_MESSAGE
+    return count_chat_messages_tokens(model_name, [chat_message])[0]
 
 
 def prune_raw_prompt_from_top(
@@ -65,55 +206,81 @@ def prune_chat_history(
     context_length: int,
     tokens_for_completion: int,
 ):
-    total_tokens = tokens_for_completion + sum(
-        count_chat_message_tokens(model_name, message) for message in chat_history
-    )
+    """
+    Summarize, drop, and truncate messages until the chat history fits in the context window.
+
+    Every message is tokenized once up front into a ledger, and the five pruning phases below
+    then only do arithmetic on the ledger. Dropped messages are skipped by moving a start
+    pointer rather than popping from the front of the list, so planning is linear in the
+    number of messages. The plan is applied at the end, copy-on-write: only messages whose
+    content is replaced are copied, and the messages passed in are never modified.
+    """
+    # Token ledger. content_tokens[i] is the number of tokens in message i as it will currently be sent.
+    # Dropped messages keep their per-message overhead in the total, as they always have.
+    content_tokens = [
+        count - TOKENS_PER_MESSAGE
+        for count in count_chat_messages_tokens(model_name, chat_history)
+    ]
+    total_tokens = tokens_for_completion + sum(content_tokens)
+    total_tokens += TOKENS_PER_MESSAGE * len(chat_history)
+
+    # The plan: messages before start are dropped, those in summarized have their content replaced by the summary
+    start = 0
+    summarized = set()
+
+    def summarize(i: int):
+        nonlocal total_tokens
+        summary_tokens = count_tokens(model_name, chat_history[i].summary)
+        total_tokens += summary_tokens - content_tokens[i]
+        content_tokens[i] = summary_tokens
+        summarized.add(i)
+
+    def remaining() -> int:
+        return len(chat_history) - start
 
     # 1. Replace beyond last 5 messages with summary
-    i = 0
-    while total_tokens > context_length and i < len(chat_history) - 5:
-        message = chat_history[0]
-        total_tokens -= count_tokens(model_name, message.content)
-        total_tokens += count_tokens(model_name, message.summary)
-        message.content = message.summary
-        i += 1
+    # (only the first message is ever summarized here, because that is what the original loop did)
+    if total_tokens > context_length and remaining() > 5:
+        summarize(start)
 
     # 2. Remove entire messages until the last 5
-    while (
-        len(chat_history) > 5
-        and total_tokens > context_length
-        and len(chat_history) > 0
-    ):
-        message = chat_history.pop(0)
-        total_tokens -= count_tokens(model_name, message.content)
+    while remaining() > 5 and total_tokens > context_length:
+        total_tokens -= content_tokens[start]
+        start += 1
 
     # 3. Truncate message in the last 5, except last 1
-    i = 0
-    while (
-        total_tokens > context_length
-        and len(chat_history) > 0
-        and i < len(chat_history) - 1
-    ):
-        message = chat_history[i]
-        total_tokens -= count_tokens(model_name, message.content)
-        total_tokens += count_tokens(model_name, message.summary)
-        message.content = message.summary
+    i = start
+    while total_tokens > context_length and i < len(chat_history) - 1:
+        summarize(i)
         i += 1
 
     # 4. Remove entire messages in the last 5, except last 1
-    while total_tokens > context_length and len(chat_history) > 1:
-        message = chat_history.pop(0)
-        total_tokens -= count_tokens(model_name, message.content)
+    while total_tokens > context_length and remaining() > 1:
+        total_tokens -= content_tokens[start]
+        start += 1
 
     # 5. Truncate last message
-    if total_tokens > context_length and len(chat_history) > 0:
-        message = chat_history[0]
-        message.content = prune_raw_prompt_from_top(
-            model_name, context_length, message.content, tokens_for_completion
+    truncate_first = total_tokens > context_length and remaining() > 0
+
+    # Apply the plan
+    pruned_history = chat_history[start:]
+    for i in summarized:
+        if i >= start:
+            message = chat_history[i]
+            pruned_history[i - start] = message.copy(
+                update={"content": message.summary}
+            )
+    if truncate_first:
+        message = pruned_history[0]
+        pruned_history[0] = message.copy(
+            update={
+                "content": prune_raw_prompt_from_top(
+                    model_name, context_length, message.content, tokens_for_completion
+                )
+            }
         )
-        total_tokens = context_length
 
-    return chat_history
+    return pruned_history
 
 
 # In case we've missed weird edge cases
@@ -132,7 +299,8 @@ def compile_chat_messages(
     """
     The total number of tokens is system_message + sum(msgs) + functions + prompt after it is converted to a message
     """
-    msgs_copy = [msg.copy(deep=True) for msg in msgs] if msgs is not None else []
+    # Pruning copies any message it changes, so the list only needs a shallow copy
+    msgs_copy = list(msgs) if msgs is not None else []
 
     if prompt is not None:
         prompt_msg = ChatMessage(role="user", content=prompt, summary=prompt)
@@ -153,8 +321,9 @@ def compile_chat_messages(
     # Add tokens from functions
     function_tokens = 0
     if functions is not None:
-        for function in functions:
-            function_tokens += count_tokens(model_name, json.dumps(function))
+        function_tokens = sum(
+            count_tokens_batch(model_name, [json.dumps(f) for f in functions])
+        )
 
     msgs_copy = prune_chat_history(
         model_name,
@@ -0,0 +1,113 @@
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .metrics import counter
+
+DOCUMENT_CACHE_LOOKUPS = counter(
+    "continue_document_cache_lookups",
+    "Reads of workspace files that were (hit) or weren't (miss) answered by the server's document cache",
+    ["result"],
+)
+
+
+def _mtime(filepath: str) -> Optional[float]:
+    try:
+        return os.stat(filepath).st_mtime
+    except OSError:
+        return None
+
+
+class CachedDocument:
+    def __init__(self, contents: str, mtime: Optional[float]):
+        self.contents = contents
+        # Of the file on disk when the contents were read, to notice changes made outside of the IDE
+        self.mtime = mtime
+
+
+class DocumentCache:
+    """
+    The contents of workspace files, as last read from the IDE, so that reading the same file
+    several times in a step only goes over the websocket once.
+
+    Every file has a version, which is bumped whenever the IDE says the file changed. A read
+    that started before a change is never cached, even if its response arrives after it.
+    Entries are also dropped if the file's mtime on disk has changed since they were read.
+    The least recently used documents are evicted once the cache holds more than `max_size`
+    characters.
+    """
+
+    def __init__(self, max_size: int = 16 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self._documents: "OrderedDict[str, CachedDocument]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    def version(self, filepath: str) -> int:
+        return self._versions.get(filepath, 0)
+
+    def mtime(self, filepath: str) -> Optional[float]:
+        return _mtime(filepath)
+
+    def get(self, filepath: str) -> Optional[str]:
+        document = self._documents.get(filepath)
+        if document is not None and document.mtime != _mtime(filepath):
+            self._remove(filepath)
+            document = None
+
+        if document is None:
+            DOCUMENT_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        DOCUMENT_CACHE_LOOKUPS.labels("hit").inc()
+        self._documents.move_to_end(filepath)
+        return document.contents
+
+    def put(
+        self,
+        filepath: str,
+        contents: str,
+        version: Optional[int] = None,
+        mtime: Optional[float] = None,
+    ):
+        """
+        Cache the contents of a file. `version` and `mtime` should be taken before the read
+        was started; if the file has changed since, the contents are stale and aren't cached.
+        """
+        if version is not None and version != self.version(filepath):
+            return
+
+        self._remove(filepath)
+        if len(contents) > self.max_size / 4:
+            return
+
+        self._documents[filepath] = CachedDocument(
+            contents, mtime if version is not None else _mtime(filepath)
+        )
+        self.size += len(contents)
+        while self.size > self.max_size:
+            self._remove(next(iter(self._documents)))
+
+    def update(self, filepath: str, contents: str):
+        """The IDE says that the file now has these contents"""
+        self.invalidate(filepath)
+        self.put(filepath, contents)
+
+    def invalidate(self, filepath: str):
+        self._versions[filepath] = self.version(filepath) + 1
+        self._remove(filepath)
+
+    def invalidate_directory(self, path: str):
+        prefix = os.path.join(path, "")
+        for filepath in list(self._documents):
+            if filepath.startswith(prefix):
+                self.invalidate(filepath)
+
+    def clear(self):
+        for filepath in list(self._documents):
+            self.invalidate(filepath)
+
+    def _remove(self, filepath: str):
+        document = self._documents.pop(filepath, None)
+        if document is not None:
+            self.size -= len(document.contents)
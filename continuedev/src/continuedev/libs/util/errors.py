@@ -1,2 +1,10 @@
 class SessionNotFound(Exception):
     pass
+
+
+class LLMHTTPError(Exception):
+    """An LLM provider responded with an error status. The message is the body of the response."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
@@ -0,0 +1,146 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Callable, Dict, Iterable, TypeVar
+
+from .metrics import add_collector, gauge
+
+T = TypeVar("T")
+
+# Blocking calls are run on bounded thread pools rather than on the event loop. Each kind
+# of work has its own lane, so e.g. one large workspace scan can't hold up git commands
+# or web requests for every other session.
+DEFAULT_LANE = "default"
+FS_LANE = "fs"
+GIT_LANE = "git"
+NETWORK_LANE = "network"
+
+LANE_MAX_WORKERS: Dict[str, int] = {
+    # Anything that doesn't fit another lane, e.g. the completion cache
+    DEFAULT_LANE: 16,
+    # Walking and reading the workspace
+    FS_LANE: 4,
+    # git subprocesses
+    GIT_LANE: 4,
+    # Synchronous HTTP clients, e.g. requests and replicate
+    NETWORK_LANE: 8,
+}
+
+
+class ExecutorLane:
+    """A bounded thread pool that keeps count of its queued and running calls"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"continue-{name}"
+        )
+
+    def _run(self, fn: Callable[[], T]) -> T:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, fn: Callable[[], T]) -> T:
+        with self._lock:
+            self.queued += 1
+        try:
+            future = self._executor.submit(self._run, fn)
+        except RuntimeError:
+            # The interpreter is shutting down (e.g. persisting sessions at exit), so just run it here
+            return self._run(fn)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Don't leave work in the queue for a caller that has gone away
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+        }
+
+
+_lanes: Dict[str, ExecutorLane] = {}
+
+
+def get_lane(name: str = DEFAULT_LANE) -> ExecutorLane:
+    lane = _lanes.get(name)
+    if lane is None:
+        lane = _lanes[name] = ExecutorLane(
+            name, LANE_MAX_WORKERS.get(name, LANE_MAX_WORKERS[DEFAULT_LANE])
+        )
+    return lane
+
+
+def executor_stats() -> Dict[str, Dict[str, int]]:
+    return {name: lane.stats() for name, lane in _lanes.items()}
+
+
+async def run_in_executor(
+    fn: Callable[..., T], *args, lane: str = DEFAULT_LANE, **kwargs
+) -> T:
+    """Run a blocking function on one of the shared executor lanes without blocking the event loop"""
+    return await get_lane(lane).run(functools.partial(fn, *args, **kwargs))
+
+
+_done = object()
+
+
+async def iterate_in_executor(
+    make_iterable: Callable[[], Iterable[T]], lane: str = DEFAULT_LANE
+) -> AsyncGenerator[T, None]:
+    """
+    Asynchronously iterate over a blocking iterable. Both creating the iterable
+    and fetching each item happen on the executor lane.
+    """
+    iterator = await run_in_executor(lambda: iter(make_iterable()), lane=lane)
+    try:
+        while True:
+            item = await run_in_executor(next, iterator, _done, lane=lane)
+            if item is _done:
+                break
+            yield item
+    finally:
+        # Let a generator clean up (e.g. close its connection) if we stop early
+        if hasattr(iterator, "close"):
+            await run_in_executor(iterator.close, lane=lane)
+
+
+EXECUTOR_QUEUED = gauge(
+    "continue_executor_queued",
+    "Blocking calls waiting for a thread in each executor lane",
+    ["lane"],
+)
+EXECUTOR_RUNNING = gauge(
+    "continue_executor_running",
+    "Blocking calls running in each executor lane",
+    ["lane"],
+)
+
+
+def _collect_executor_metrics():
+    for name, lane in _lanes.items():
+        EXECUTOR_QUEUED.labels(name).set(lane.queued)
+        EXECUTOR_RUNNING.labels(name).set(lane.running)
+
+
+add_collector(_collect_executor_metrics)
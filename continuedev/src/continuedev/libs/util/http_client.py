@@ -0,0 +1,119 @@
+import asyncio
+import ssl
+from typing import Dict, Optional, Tuple, Union
+
+import aiohttp
+
+from .logging import logger
+
+# Connection pool settings, shared by every session the pool creates
+MAX_CONNECTIONS = 100
+MAX_CONNECTIONS_PER_HOST = 10
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+
+# Timeouts in seconds. There is no total timeout, because completions can stream for a long time,
+# but a backend that sends nothing for READ_TIMEOUT seconds (between chunks, or before the response
+# of a non-streaming call) has stalled. It matches the total timeout aiohttp sessions had by default
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT: Optional[float] = 300
+
+SSLSetting = Union[bool, ssl.SSLContext]
+
+# One session per (event loop, SSL setting), since aiohttp sessions can't be shared across loops
+# and a connector's SSL setting applies to every connection it opens
+# The loop is stored alongside the session, because ids of closed loops can be reused
+_sessions: Dict[
+    Tuple[int, Union[bool, int]],
+    Tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession],
+] = {}
+
+
+def configure_http_client(
+    max_connections: Optional[int] = None,
+    max_connections_per_host: Optional[int] = None,
+    keepalive_timeout: Optional[float] = None,
+    dns_cache_ttl: Optional[int] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+):
+    """
+    Change the pool settings. Only sessions created afterwards are affected.
+    A read_timeout of 0 or less turns the read timeout off.
+    """
+    global MAX_CONNECTIONS, MAX_CONNECTIONS_PER_HOST, KEEPALIVE_TIMEOUT, DNS_CACHE_TTL
+    global CONNECT_TIMEOUT, READ_TIMEOUT
+
+    if max_connections is not None:
+        MAX_CONNECTIONS = max_connections
+    if max_connections_per_host is not None:
+        MAX_CONNECTIONS_PER_HOST = max_connections_per_host
+    if keepalive_timeout is not None:
+        KEEPALIVE_TIMEOUT = keepalive_timeout
+    if dns_cache_ttl is not None:
+        DNS_CACHE_TTL = dns_cache_ttl
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        READ_TIMEOUT = read_timeout if read_timeout > 0 else None
+
+
+def _ssl_key(ssl_setting: SSLSetting) -> Union[bool, int]:
+    if isinstance(ssl_setting, ssl.SSLContext):
+        return id(ssl_setting)
+    return ssl_setting
+
+
+def _connector_ssl(ssl_setting: SSLSetting) -> Union[None, bool, ssl.SSLContext]:
+    """The ssl argument for aiohttp.TCPConnector. None is aiohttp's default, verifying certificates."""
+    # Older versions of aiohttp (e.g. 3.8) treat ssl=True as not verifying certificates
+    if ssl_setting is True:
+        return None
+    return ssl_setting
+
+
+def get_client_session(
+    verify_ssl: bool = True, ssl_context: Optional[ssl.SSLContext] = None
+) -> aiohttp.ClientSession:
+    """
+    Borrow the shared aiohttp session for the given SSL settings, creating it if needed.
+
+    Connections are kept alive and reused across requests, so callers should not close the
+    session they're given. Call close_client_sessions when shutting down instead.
+    """
+    ssl_setting: SSLSetting = ssl_context if ssl_context is not None else verify_ssl
+    loop = asyncio.get_running_loop()
+    key = (id(loop), _ssl_key(ssl_setting))
+
+    session_loop, session = _sessions.get(key, (None, None))
+    if session is None or session.closed or session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            ssl=_connector_ssl(ssl_setting),
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT
+            ),
+        )
+        _sessions[key] = (loop, session)
+
+    return session
+
+
+async def close_client_sessions():
+    """Close all of the shared sessions that belong to the running event loop"""
+    loop = asyncio.get_running_loop()
+    for key, (session_loop, session) in list(_sessions.items()):
+        if session_loop is not loop:
+            continue
+        del _sessions[key]
+        try:
+            await session.close()
+        except Exception as e:
+            logger.warning(f"Error closing HTTP client session: {e}")
@@ -0,0 +1,87 @@
+import difflib
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+
+class LineHashIndex:
+    """The positions of every distinct line in a list of lines, to find matching lines without scanning them all"""
+
+    def __init__(self, lines: List[str], key: Callable[[str], str] = lambda l: l):
+        self.key = key
+        self._positions: Dict[str, List[int]] = defaultdict(list)
+        for i, line in enumerate(lines):
+            self._positions[key(line)].append(i)
+
+    def positions(self, line: str, start: int = 0) -> List[int]:
+        """Positions of the lines matching `line`, from `start` on"""
+        positions = self._positions.get(self.key(line), [])
+        return positions[bisect_left(positions, start) :]
+
+    def first(self, line: str, start: int = 0) -> Optional[int]:
+        positions = self._positions.get(self.key(line), [])
+        i = bisect_left(positions, start)
+        return positions[i] if i < len(positions) else None
+
+
+class LineAligner:
+    """
+    Follows a stream of generated lines through the original lines they are rewriting,
+    to tell which of the original lines haven't been rewritten yet.
+
+    Each generated line moves a cursor past the first original line after it that is similar
+    (difflib ratio above `threshold`). Similar lines are only looked for in the `lookahead` lines
+    after the cursor, with the cheap upper bounds of the ratio checked first; further ahead, a
+    hash index finds lines that are the same apart from whitespace. So each generated line costs
+    O(lookahead), however long the original is.
+    """
+
+    def __init__(
+        self, original_lines: List[str], threshold: float = 0.7, lookahead: int = 20
+    ):
+        self.original_lines = original_lines
+        self.threshold = threshold
+        self.lookahead = lookahead
+        # The original lines before this have been rewritten
+        self.cursor = 0
+        # How many generated lines have been aligned
+        self.lines_aligned = 0
+        self._index = LineHashIndex(original_lines, key=str.strip)
+        self._matcher = difflib.SequenceMatcher(None)
+
+    def _similar(self, original_line: str) -> bool:
+        self._matcher.set_seq1(original_line)
+        return (
+            self._matcher.real_quick_ratio() > self.threshold
+            and self._matcher.quick_ratio() > self.threshold
+            and self._matcher.ratio() > self.threshold
+        )
+
+    def _find_match(self, line: str) -> Optional[int]:
+        # The matcher caches what it knows about seq2, so the generated line goes there
+        self._matcher.set_seq2(line)
+        end = min(len(self.original_lines), self.cursor + self.lookahead)
+        for i in range(self.cursor, end):
+            if self.original_lines[i].strip() != "" and self._similar(
+                self.original_lines[i]
+            ):
+                return i
+
+        if line.strip() == "":
+            return None
+        return self._index.first(line, end)
+
+    def add_line(self, line: str):
+        self.lines_aligned += 1
+        match = self._find_match(line)
+        if match is not None:
+            self.cursor = match + 1
+
+    def update(self, generated_lines: List[str]):
+        """Align to a list of generated lines that only ever grows, adding the lines that are new since the last update"""
+        for line in generated_lines[self.lines_aligned :]:
+            self.add_line(line)
+
+    @property
+    def remaining_lines(self) -> List[str]:
+        return self.original_lines[self.cursor :]
@@ -0,0 +1,160 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .logging import logger
+from .metrics import counter, gauge, histogram
+
+LOOP_LAG = histogram(
+    "continue_event_loop_lag_seconds",
+    "How much later than scheduled the event loop ran the lag sampler",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+LAST_LOOP_LAG = gauge(
+    "continue_event_loop_lag_last_seconds", "The most recent event loop lag sample"
+)
+LOOP_STALLS = counter(
+    "continue_event_loop_stalls",
+    "Times a single callback blocked the event loop for longer than the slow callback threshold",
+)
+LOOP_STALL_DURATION = histogram(
+    "continue_event_loop_stall_duration_seconds",
+    "How long the event loop was blocked, for stalls longer than the slow callback threshold",
+    buckets=[0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60],
+)
+
+
+class LoopLagSampler:
+    """
+    Measures event loop lag by scheduling a callback every `interval` seconds and recording
+    how late it runs. Anything that blocks the loop (sync I/O, heavy CPU work) delays it.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._expected = 0.0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._schedule()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self):
+        self._expected = self._loop.time() + self.interval
+        self._handle = self._loop.call_at(self._expected, self._sample)
+
+    def _sample(self):
+        lag = max(0.0, self._loop.time() - self._expected)
+        LOOP_LAG.observe(lag)
+        LAST_LOOP_LAG.set(lag)
+        self._schedule()
+
+
+class SlowCallbackDetector:
+    """
+    Logs the stack of the event loop thread whenever the loop is blocked for longer than `threshold` seconds.
+
+    A watchdog thread wakes every threshold / 2 seconds and, once the previous heartbeat has run,
+    schedules a new one on the loop. If a heartbeat has been waiting for longer than the threshold,
+    the loop is stuck in a callback, so the stack of the loop thread shows what is blocking it. This
+    is much cheaper than asyncio's debug mode (which times every callback), so it can stay on in production.
+    Each stall is only reported once, and its total duration is logged when it ends.
+    """
+
+    def __init__(self, threshold: float = 0.25):
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        # When the heartbeat that hasn't run yet was scheduled, and when the last one ran
+        self._pending_since: Optional[float] = None
+        self._last_beat = 0.0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._pending_since = None
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="slow-callback-detector", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        self._pending_since = None
+
+    def _watch(self):
+        stall_started = None
+        while not self._stopped.wait(self.threshold / 2):
+            pending_since = self._pending_since
+            if pending_since is not None:
+                # Measured from when the heartbeat was scheduled, not from when the previous one ran,
+                # which would count the time the watchdog spent sleeping as blocked
+                blocked = time.monotonic() - pending_since
+                if blocked > self.threshold and stall_started != pending_since:
+                    stall_started = pending_since
+                    LOOP_STALLS.inc()
+                    self._report(blocked)
+                continue
+
+            if stall_started is not None:
+                duration = self._last_beat - stall_started
+                stall_started = None
+                LOOP_STALL_DURATION.observe(duration)
+                logger.warning(f"Event loop was blocked for {duration:.2f}s")
+
+            self._pending_since = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(self._beat)
+            except RuntimeError:
+                return  # The loop was closed
+
+    def _report(self, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        coro = task.get_coro() if task is not None else None
+        logger.warning(
+            f"Event loop blocked for more than {blocked:.2f}s"
+            + (f" while running {getattr(coro, '__qualname__', coro)}" if coro else "")
+            + f", stack of the event loop thread:\n{stack}"
+        )
+
+
+loop_lag_sampler = LoopLagSampler()
+slow_callback_detector = SlowCallbackDetector()
+
+
+def start_loop_monitor(
+    lag_sample_interval: float = 0.5, slow_callback_threshold: Optional[float] = 0.25
+):
+    """Start sampling event loop lag, and reporting slow callbacks unless slow_callback_threshold is 0 or None"""
+    loop_lag_sampler.interval = lag_sample_interval
+    loop_lag_sampler.start()
+    if slow_callback_threshold:
+        slow_callback_detector.threshold = slow_callback_threshold
+        slow_callback_detector.start()
+
+
+def stop_loop_monitor():
+    loop_lag_sampler.stop()
+    slow_callback_detector.stop()
@@ -84,3 +84,9 @@ def getSavedContextGroupsPath():
         with open(path, "w") as f:
             f.write("\{\}")
     return path
+
+
+def getCompletionCachePath():
+    path = os.path.join(getGlobalFolderPath(), "completion_cache.sqlite")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
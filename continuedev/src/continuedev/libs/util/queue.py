@@ -3,8 +3,11 @@ from typing import Dict
 
 
 class AsyncSubscriptionQueue:
-    # The correct way to do this is probably to keep request IDs
-    queues: Dict[str, asyncio.Queue] = {}
+    queues: Dict[str, asyncio.Queue]
+
+    def __init__(self):
+        # Each instance has its own queues, so subscribers never see messages meant for another
+        self.queues = {}
 
     def post(self, messageType: str, data: any):
         if messageType not in self.queues:
@@ -0,0 +1,134 @@
+import codecs
+import json
+from typing import Any, AsyncGenerator, List, Optional
+
+import aiohttp
+
+
+class LineDecoder:
+    """
+    Incrementally splits a byte stream into lines, regardless of where the chunks are split.
+
+    A partial line at the end of a chunk is carried over in a buffer until the rest of it arrives.
+    Only the bytes that haven't been searched yet are scanned for newlines, and lines are returned
+    as bytes, because splitting UTF-8 on b"\\n" never cuts through a character.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._buffer += data
+        lines = []
+        start = 0
+        while (end := self._buffer.find(b"\n", self._scanned)) != -1:
+            line = self._buffer[start:end]
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            lines.append(bytes(line))
+            start = self._scanned = end + 1
+
+        if start > 0:
+            del self._buffer[:start]
+        self._scanned = len(self._buffer)
+        return lines
+
+    def flush(self) -> List[bytes]:
+        """Return the final line if the stream didn't end with a newline"""
+        line = bytes(self._buffer).rstrip(b"\r")
+        self._buffer.clear()
+        self._scanned = 0
+        return [line] if line else []
+
+
+class NDJSONDecoder:
+    """Incrementally decodes newline-delimited JSON, skipping blank lines"""
+
+    def __init__(self):
+        self._lines = LineDecoder()
+
+    def _decode(self, lines: List[bytes]) -> List[Any]:
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def feed(self, data: bytes) -> List[Any]:
+        return self._decode(self._lines.feed(data))
+
+    def flush(self) -> List[Any]:
+        return self._decode(self._lines.flush())
+
+
+class SSEDecoder:
+    """
+    Incrementally decodes a text/event-stream, returning the data of each event.
+
+    Comment lines (like ": ping") and fields other than data are ignored, and the data lines
+    of an event are joined with newlines, as described in the server-sent events spec.
+    """
+
+    def __init__(self):
+        self._lines = LineDecoder()
+        self._data: List[bytes] = []
+
+    def _decode(self, lines: List[bytes]) -> List[str]:
+        events = []
+        for line in lines:
+            if line == b"":
+                if len(self._data) > 0:
+                    events.append(b"\n".join(self._data).decode("utf-8"))
+                    self._data = []
+            elif line.startswith(b"data:"):
+                data = line[5:]
+                self._data.append(data[1:] if data.startswith(b" ") else data)
+        return events
+
+    def feed(self, data: bytes) -> List[str]:
+        return self._decode(self._lines.feed(data))
+
+    def flush(self) -> List[str]:
+        # A stream that ends without a blank line still completes its last event
+        return self._decode(self._lines.flush() + [b""])
+
+
+async def iter_lines(resp: aiohttp.ClientResponse) -> AsyncGenerator[bytes, None]:
+    decoder = LineDecoder()
+    async for chunk in resp.content.iter_any():
+        for line in decoder.feed(chunk):
+            yield line
+    for line in decoder.flush():
+        yield line
+
+
+async def iter_ndjson(resp: aiohttp.ClientResponse) -> AsyncGenerator[Any, None]:
+    decoder = NDJSONDecoder()
+    async for chunk in resp.content.iter_any():
+        for obj in decoder.feed(chunk):
+            yield obj
+    for obj in decoder.flush():
+        yield obj
+
+
+async def iter_sse_data(
+    resp: aiohttp.ClientResponse, done: Optional[str] = "[DONE]"
+) -> AsyncGenerator[str, None]:
+    """Yield the data of each server-sent event, stopping at the `done` sentinel"""
+    decoder = SSEDecoder()
+    async for chunk in resp.content.iter_any():
+        for data in decoder.feed(chunk):
+            if data == done:
+                return
+            yield data
+    for data in decoder.flush():
+        if data == done:
+            return
+        yield data
+
+
+async def iter_text(resp: aiohttp.ClientResponse) -> AsyncGenerator[str, None]:
+    """Yield the body as text as it arrives, without splitting multi-byte characters"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in resp.content.iter_any():
+        if text := decoder.decode(chunk):
+            yield text
+    if text := decoder.decode(b"", final=True):
+        yield text
@@ -49,3 +49,21 @@ def remove_quotes_and_escapes(output: str) -> str:
         output = output[1:-1]
 
     return output
+
+
+def parse_title_and_description(output: str) -> Tuple[str, str]:
+    """
+    Split a completion of the form "Title: ...\n<description>" into the title and the description.
+    If there is no title line, the whole output is the description and the title is empty.
+    """
+    lines = output.strip().splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip().lstrip("#*").strip()
+        if stripped.lower().startswith("title:"):
+            title = stripped[len("title:") :].strip().strip("*").strip()
+            description = "\n".join(lines[:i] + lines[i + 1 :]).strip()
+            if description.lower().startswith("description:"):
+                description = description[len("description:") :].strip()
+            return title, description
+
+    return "", output
@@ -2,6 +2,8 @@ import os
 
 import chevron
 
+from .executor import FS_LANE, run_in_executor
+
 
 def get_vars_in_template(template):
     """
@@ -21,11 +23,22 @@ def escape_var(var: str) -> str:
     return var.replace(os.path.sep, "").replace(".", "")
 
 
+def read_template_file(path: str) -> str:
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return f.read()
+    return ""
+
+
 def render_templated_string(template: str) -> str:
     """
     Render system message or other templated string with mustache syntax.
     Right now it only supports rendering absolute file paths as their contents.
     """
+    if "{{" not in template:
+        # Nothing to render, so skip tokenizing (this is called for every LLM request)
+        return template
+
     vars = get_vars_in_template(template)
 
     args = {}
@@ -34,10 +47,14 @@ def render_templated_string(template: str) -> str:
             # Escape vars which are filenames, because mustache doesn't allow / in variable names
             escaped_var = escape_var(var)
             template = template.replace(var, escaped_var)
-
-            if os.path.exists(var):
-                args[escaped_var] = open(var, "r").read()
-            else:
-                args[escaped_var] = ""
+            args[escaped_var] = read_template_file(var)
 
     return chevron.render(template, args)
+
+
+async def render_templated_string_async(template: str) -> str:
+    """Like render_templated_string, but reads the files off the event loop"""
+    if "{{" not in template:
+        return template
+
+    return await run_in_executor(render_templated_string, template, lane=FS_LANE)
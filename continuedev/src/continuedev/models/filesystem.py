@@ -1,10 +1,10 @@
 import os
 from abc import abstractmethod
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from pydantic import BaseModel
 
-from ..models.main import AbstractModel, Position, Range
+from ..models.main import AbstractModel, LineIndex, Position, Range
 from .filesystem_edit import (
     AddDirectory,
     AddFile,
@@ -84,6 +84,24 @@ class RangeInFileWithContents(RangeInFile):
         )
 
 
+def _read_range_with_line_index(s: str, r: Range, line_index: LineIndex) -> str:
+    """FileSystem.read_range_in_str, by slicing s once instead of splitting it into lines"""
+    if r.start.line >= line_index.num_lines or r.end.line < r.start.line:
+        return ""
+
+    start = line_index.line_start(r.start.line) + min(
+        r.start.character, line_index.line_length(r.start.line)
+    )
+    last_line = min(r.end.line, line_index.num_lines - 1)
+    last_line_end = line_index.line_start(last_line) + line_index.line_length(last_line)
+    if last_line == r.start.line:
+        # The end character is counted from the start character when both are on the same line
+        end = start + r.end.character + 1
+    else:
+        end = line_index.line_start(last_line) + r.end.character + 1
+    return s[start : min(end, last_line_end)]
+
+
 class FileSystem(AbstractModel):
     """An abstract filesystem that can read/write from a set of files."""
 
@@ -137,7 +155,12 @@ class FileSystem(AbstractModel):
         raise NotImplementedError
 
     @classmethod
-    def read_range_in_str(self, s: str, r: Range) -> str:
+    def read_range_in_str(
+        self, s: str, r: Range, line_index: Optional[LineIndex] = None
+    ) -> str:
+        if line_index is not None:
+            return _read_range_with_line_index(s, r, line_index)
+
         lines = s.split("\n")[r.start.line : r.end.line + 1]
         if len(lines) == 0:
             return ""
@@ -147,8 +170,10 @@ class FileSystem(AbstractModel):
         return "\n".join(lines)
 
     @classmethod
-    def apply_edit_to_str(cls, s: str, edit: FileEdit) -> Tuple[str, EditDiff]:
-        original = cls.read_range_in_str(s, edit.range)
+    def apply_edit_to_str(
+        cls, s: str, edit: FileEdit, line_index: Optional[LineIndex] = None
+    ) -> Tuple[str, EditDiff]:
+        original = cls.read_range_in_str(s, edit.range, line_index)
 
         # Split lines and deal with some edge cases (could obviously be nicer)
         lines = s.splitlines()
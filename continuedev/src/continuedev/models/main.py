@@ -1,6 +1,8 @@
 from abc import ABC
+from bisect import bisect_right
 from functools import total_ordering
-from typing import List, Tuple, Union
+from itertools import accumulate
+from typing import List, Optional, Tuple, Union
 
 from pydantic import BaseModel, root_validator
 
@@ -30,8 +32,13 @@ class Position(BaseModel):
             return False
 
     @staticmethod
-    def from_index(string: str, index: int) -> "Position":
+    def from_index(
+        string: str, index: int, line_index: Optional["LineIndex"] = None
+    ) -> "Position":
         """Convert index in string to line and character"""
+        if line_index is not None:
+            return line_index.position(index)
+
         line = string.count("\n", 0, index)
         if line == 0:
             character = index
@@ -44,10 +51,49 @@ class Position(BaseModel):
     def from_end_of_file(contents: str) -> "Position":
         return Position.from_index(contents, len(contents))
 
-    def to_index(self, string: str) -> int:
-        """Convert line and character to index in string"""
-        lines = string.splitlines()
-        return sum(map(len, lines[: self.line])) + self.character
+    def to_index(self, string: str, line_index: Optional["LineIndex"] = None) -> int:
+        """Convert line and character to index in string, counting the newlines before it. Pass a LineIndex of the string when converting many positions."""
+        return (line_index or LineIndex(string)).index(self)
+
+
+class LineIndex:
+    """
+    The offsets at which each line of a string starts, to convert between indices in the
+    string and Positions in O(log n), without scanning the string every time.
+    Build one when converting many indices or ranges in the same string.
+    """
+
+    def __init__(self, string: str):
+        self.length = len(string)
+        self.line_starts = list(
+            accumulate((len(line) + 1 for line in string.split("\n")[:-1]), initial=0)
+        )
+
+    @property
+    def num_lines(self) -> int:
+        return len(self.line_starts)
+
+    def line_start(self, line: int) -> int:
+        return self.line_starts[line]
+
+    def line_length(self, line: int) -> int:
+        """Length of the line, not counting its newline"""
+        if line + 1 < len(self.line_starts):
+            return self.line_starts[line + 1] - self.line_starts[line] - 1
+        return self.length - self.line_starts[line]
+
+    def position(self, index: int) -> Position:
+        line = bisect_right(self.line_starts, index) - 1
+        return Position(line=line, character=index - self.line_starts[line])
+
+    def index(self, position: Position) -> int:
+        if position.line >= len(self.line_starts):
+            # Past the last line, e.g. the end of a range covering a whole file.
+            # Like splitlines, a trailing newline doesn't start another line
+            last_line = len(self.line_starts) - 1
+            end = self.length + 1 if self.line_length(last_line) > 0 else self.length
+            return end + position.character
+        return self.line_starts[position.line] + position.character
 
 
 class Range(BaseModel):
@@ -76,20 +122,15 @@ class Range(BaseModel):
     def is_empty(self) -> bool:
         return self.start == self.end
 
-    def indices_in_string(self, string: str) -> Tuple[int, int]:
-        """Get the start and end indicees of this range in the string"""
-        lines = string.splitlines()
-        if len(lines) == 0:
+    def indices_in_string(
+        self, string: str, line_index: Optional[LineIndex] = None
+    ) -> Tuple[int, int]:
+        """Get the start and end indicees of this range in the string. Pass a LineIndex of the string when converting many ranges."""
+        if string == "":
             return (0, 0)
 
-        start_index = (
-            sum([len(line) + 1 for line in lines[: self.start.line]])
-            + self.start.character
-        )
-        end_index = (
-            sum([len(line) + 1 for line in lines[: self.end.line]]) + self.end.character
-        )
-        return (start_index, end_index)
+        line_index = line_index or LineIndex(string)
+        return (line_index.index(self.start), line_index.index(self.end))
 
     def overlaps_with(self, other: "Range") -> bool:
         return not (self.end < other.start or self.start > other.end)
@@ -101,10 +142,15 @@ class Range(BaseModel):
         )
 
     @staticmethod
-    def from_indices(string: str, start_index: int, end_index: int) -> "Range":
+    def from_indices(
+        string: str,
+        start_index: int,
+        end_index: int,
+        line_index: Optional[LineIndex] = None,
+    ) -> "Range":
         return Range(
-            start=Position.from_index(string, start_index),
-            end=Position.from_index(string, end_index),
+            start=Position.from_index(string, start_index, line_index),
+            end=Position.from_index(string, end_index, line_index),
         )
 
     @staticmethod
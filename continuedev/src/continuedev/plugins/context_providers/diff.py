@@ -3,6 +3,7 @@ from typing import List
 
 from ...core.context import ContextProvider
 from ...core.main import ContextItem, ContextItemDescription, ContextItemId
+from ...libs.util.executor import GIT_LANE, run_in_executor
 
 
 class DiffContextProvider(ContextProvider):
@@ -33,9 +34,14 @@ class DiffContextProvider(ContextProvider):
         if not id.item_id == self.DIFF_CONTEXT_ITEM_ID:
             raise Exception("Invalid item id")
 
-        diff = subprocess.check_output(["git", "diff"], cwd=self.workspace_dir).decode(
-            "utf-8"
-        )
+        diff = (
+            await run_in_executor(
+                subprocess.check_output,
+                ["git", "diff"],
+                cwd=self.workspace_dir,
+                lane=GIT_LANE,
+            )
+        ).decode("utf-8")
 
         ctx_item = self.BASE_CONTEXT_ITEM.copy()
         ctx_item.content = diff
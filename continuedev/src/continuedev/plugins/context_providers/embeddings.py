@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from ...core.context import ContextProvider
 from ...core.main import ContextItem, ContextItemDescription, ContextItemId
 from ...libs.chroma.query import ChromaIndexManager
+from ...libs.util.executor import FS_LANE, NETWORK_LANE, run_in_executor
 
 
 class EmbeddingResult(BaseModel):
@@ -46,7 +47,9 @@ class EmbeddingsProvider(ContextProvider):
         )
 
     async def _get_query_results(self, query: str) -> str:
-        results = self.index.query_codebase_index(query)
+        results = await run_in_executor(
+            self.index.query_codebase_index, query, lane=NETWORK_LANE
+        )
 
         ret = []
         for node in results.source_nodes:
@@ -57,7 +60,7 @@ class EmbeddingsProvider(ContextProvider):
         return ret
 
     async def provide_context_items(self) -> List[ContextItem]:
-        self.index.create_codebase_index()  # TODO Synchronous here is not ideal
+        await run_in_executor(self.index.create_codebase_index, lane=FS_LANE)
 
         return [self.BASE_CONTEXT_ITEM]
 
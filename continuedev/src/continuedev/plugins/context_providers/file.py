@@ -4,6 +4,7 @@ from typing import List
 
 from ...core.context import ContextProvider
 from ...core.main import ContextItem, ContextItemDescription, ContextItemId
+from ...libs.util.executor import FS_LANE, run_in_executor
 from .util import remove_meilisearch_disallowed_chars
 
 MAX_SIZE_IN_BYTES = 1024 * 1024 * 1
@@ -54,6 +55,12 @@ class FileContextProvider(ContextProvider):
     )
 
     async def provide_context_items(self, workspace_dir: str) -> List[ContextItem]:
+        # Walking and reading the workspace blocks, so it's done off the event loop
+        return await run_in_executor(
+            self._load_context_items, workspace_dir, lane=FS_LANE
+        )
+
+    def _load_context_items(self, workspace_dir: str) -> List[ContextItem]:
         absolute_filepaths: List[str] = []
         for root, dir_names, file_names in os.walk(workspace_dir):
             dir_names[:] = [
@@ -3,6 +3,7 @@ from typing import List
 
 from ...core.context import ContextProvider
 from ...core.main import ContextItem, ContextItemDescription, ContextItemId
+from ...libs.util.executor import FS_LANE, run_in_executor
 
 
 def format_file_tree(startpath) -> str:
@@ -23,9 +24,11 @@ class FileTreeContextProvider(ContextProvider):
 
     workspace_dir: str = None
 
-    def _filetree_context_item(self):
+    async def _filetree_context_item(self):
         return ContextItem(
-            content=format_file_tree(self.workspace_dir),
+            content=await run_in_executor(
+                format_file_tree, self.workspace_dir, lane=FS_LANE
+            ),
             description=ContextItemDescription(
                 name="File Tree",
                 description="Add a formatted file tree of this directory to the context",
@@ -35,10 +38,10 @@ class FileTreeContextProvider(ContextProvider):
 
     async def provide_context_items(self, workspace_dir: str) -> List[ContextItem]:
         self.workspace_dir = workspace_dir
-        return [self._filetree_context_item()]
+        return [await self._filetree_context_item()]
 
     async def get_item(self, id: ContextItemId, query: str) -> ContextItem:
         if not id.item_id == self.title:
             raise Exception("Invalid item id")
 
-        return self._filetree_context_item()
+        return await self._filetree_context_item()
@@ -1,10 +1,9 @@
 import json
 from typing import List
 
-import aiohttp
-
 from ...core.context import ContextProvider
 from ...core.main import ContextItem, ContextItemDescription, ContextItemId
+from ...libs.util.http_client import get_client_session
 from .util import remove_meilisearch_disallowed_chars
 
 
@@ -34,9 +33,9 @@ class GoogleContextProvider(ContextProvider):
         payload = json.dumps({"q": query})
         headers = {"X-API-KEY": self.serper_api_key, "Content-Type": "application/json"}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=payload) as response:
-                return await response.text()
+        session = get_client_session()
+        async with session.post(url, headers=headers, data=payload) as response:
+            return await response.text()
 
     async def provide_context_items(self, workspace_dir: str) -> List[ContextItem]:
         return [self.BASE_CONTEXT_ITEM]
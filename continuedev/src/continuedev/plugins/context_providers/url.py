@@ -1,3 +1,4 @@
+import asyncio
 from typing import List
 
 import requests
@@ -5,6 +6,7 @@ from bs4 import BeautifulSoup
 
 from ...core.context import ContextProvider
 from ...core.main import ContextItem, ContextItemDescription, ContextItemId
+from ...libs.util.executor import NETWORK_LANE, run_in_executor
 from .util import remove_meilisearch_disallowed_chars
 
 
@@ -35,8 +37,8 @@ class URLContextProvider(ContextProvider):
             ),
         )
 
-    def static_url_context_item_from_url(self, url: str) -> ContextItem:
-        content, title = self._get_url_text_contents_and_title(url)
+    async def static_url_context_item_from_url(self, url: str) -> ContextItem:
+        content, title = await self._get_url_text_contents_and_title(url)
         return ContextItem(
             content=content,
             description=ContextItemDescription(
@@ -49,7 +51,12 @@ class URLContextProvider(ContextProvider):
             ),
         )
 
-    def _get_url_text_contents_and_title(self, url: str) -> (str, str):
+    async def _get_url_text_contents_and_title(self, url: str) -> (str, str):
+        return await run_in_executor(
+            self._fetch_url_text_contents_and_title, url, lane=NETWORK_LANE
+        )
+
+    def _fetch_url_text_contents_and_title(self, url: str) -> (str, str):
         response = requests.get(url)
         soup = BeautifulSoup(response.text, "html.parser")
         title = url.replace("https://", "").replace("http://", "").replace("www.", "")
@@ -58,9 +65,9 @@ class URLContextProvider(ContextProvider):
         return soup.get_text(), title
 
     async def provide_context_items(self, workspace_dir: str) -> List[ContextItem]:
-        self.static_url_context_items = [
-            self.static_url_context_item_from_url(url) for url in self.preset_urls
-        ]
+        self.static_url_context_items = await asyncio.gather(
+            *[self.static_url_context_item_from_url(url) for url in self.preset_urls]
+        )
 
         return [self.DYNAMIC_CONTEXT_ITEM] + self.static_url_context_items
 
@@ -85,7 +92,7 @@ class URLContextProvider(ContextProvider):
         url = query.lstrip("url ").strip()
         if url is None or url == "":
             return None
-        content, title = self._get_url_text_contents_and_title(url)
+        content, title = await self._get_url_text_contents_and_title(url)
 
         ctx_item = self.DYNAMIC_CONTEXT_ITEM.copy()
         ctx_item.content = content
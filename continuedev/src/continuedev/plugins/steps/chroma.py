@@ -5,6 +5,7 @@ from ...core.main import Step
 from ...core.observation import Observation
 from ...core.sdk import ContinueSDK
 from ...libs.chroma.query import ChromaIndexManager
+from ...libs.util.executor import FS_LANE, GIT_LANE, NETWORK_LANE, run_in_executor
 from .core.core import EditFileStep
 
 
@@ -17,9 +18,10 @@ class CreateCodebaseIndexChroma(Step):
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         index = ChromaIndexManager(await sdk.ide.getWorkspaceDirectory())
-        if not index.check_index_exists():
+        # Finding the index runs git to get the current branch
+        if not await run_in_executor(index.check_index_exists, lane=GIT_LANE):
             self.hide = False
-        index.create_codebase_index()
+        await run_in_executor(index.create_codebase_index, lane=FS_LANE)
 
 
 class AnswerQuestionChroma(Step):
@@ -35,7 +37,9 @@ class AnswerQuestionChroma(Step):
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         index = ChromaIndexManager(await sdk.ide.getWorkspaceDirectory())
-        results = index.query_codebase_index(self.question)
+        results = await run_in_executor(
+            index.query_codebase_index, self.question, lane=NETWORK_LANE
+        )
 
         code_snippets = ""
 
@@ -73,7 +77,9 @@ class EditFileChroma(Step):
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         index = ChromaIndexManager(await sdk.ide.getWorkspaceDirectory())
-        results = index.query_codebase_index(self.request)
+        results = await run_in_executor(
+            index.query_codebase_index, self.request, lane=NETWORK_LANE
+        )
 
         resource_name = list(results.source_nodes[0].node.relationships.values())[0]
         filepath = resource_name[: resource_name.index("::")]
@@ -3,7 +3,7 @@ import difflib
 import os
 import traceback
 from textwrap import dedent
-from typing import Any, Coroutine, List, Union
+from typing import Any, Coroutine, Dict, List, Tuple, Union
 
 from pydantic import validator
 
@@ -15,9 +15,12 @@ from ....core.observation import (
 )
 from ....libs.llm.ggml import GGML
 from ....libs.llm.maybe_proxy_openai import MaybeProxyOpenAI
-from ....libs.util.count_tokens import DEFAULT_MAX_TOKENS
+from ....libs.util.calculate_diff import calculate_line_diff, calculate_line_hunk
+from ....libs.util.count_tokens import DEFAULT_MAX_TOKENS, line_token_counts
+from ....libs.util.line_alignment import LineAligner, LineHashIndex
 from ....libs.util.strings import (
     dedent_and_get_common_whitespace,
+    parse_title_and_description,
     remove_quotes_and_escapes,
 )
 from ....libs.util.telemetry import posthog_logger
@@ -27,6 +30,7 @@ from ....models.filesystem_edit import (
     FileEdit,
     FileEditWithFullContents,
     FileSystemEdit,
+    SequentialFileSystemEdit,
 )
 
 # from ....libs.llm.replicate import ReplicateLLM
@@ -213,31 +217,35 @@ class DefaultModelEditCodeStep(Step):
 
     async def describe(self, models: Models) -> Coroutine[str, None, None]:
         if self._previous_contents.strip() == self._new_contents.strip():
-            description = "No edits were made"
-        else:
-            changes = "\n".join(
-                difflib.ndiff(
-                    self._previous_contents.splitlines(),
-                    self._new_contents.splitlines(),
-                )
+            name = await models.medium.complete(
+                f"Write a very short title to describe this requested change (no quotes): '{self.user_input}'. This is the title:"
             )
-            description = await models.medium.complete(
-                dedent(
-                    f"""\
-                Diff summary: "{self.user_input}"
+            self.name = remove_quotes_and_escapes(name)
+            return "No edits were made"
+
+        # Ask for the title and the description in a single request
+        changes = "\n".join(
+            difflib.ndiff(
+                self._previous_contents.splitlines(),
+                self._new_contents.splitlines(),
+            )
+        )
+        completion = await models.medium.complete(
+            dedent(
+                f"""\
+            Diff summary: "{self.user_input}"
 
-                ```diff
-                {changes}
-                ```
+            ```diff
+            {changes}
+            ```
 
-                Please give brief a description of the changes made above using markdown bullet points. Be concise:"""
-                )
+            First, write "Title: " followed by a very short title (no quotes) to describe the requested change, on a single line. Then, starting on the next line, give a brief description of the changes made above using markdown bullet points. Be concise:"""
             )
-        name = await models.medium.complete(
-            f"Write a very short title to describe this requested change (no quotes): '{self.user_input}'. This is the title:"
         )
-        self.name = remove_quotes_and_escapes(name)
 
+        title, description = parse_title_and_description(completion)
+        if title:
+            self.name = remove_quotes_and_escapes(title)
         return f"{remove_quotes_and_escapes(description)}"
 
     async def get_prompt_parts(
@@ -287,22 +295,28 @@ class DefaultModelEditCodeStep(Step):
         cur_end_line = len(full_file_contents_lst) - 1
 
         if total_tokens > model_to_use.context_length:
-            while cur_end_line > min_end_line:
-                total_tokens -= model_to_use.count_tokens(
-                    full_file_contents_lst[cur_end_line]
+            # Count the tokens in each line once, and find how many lines to drop by binary search
+            line_tokens = line_token_counts(
+                model_to_use.name, rif.filepath, full_file_contents_lst
+            )
+            overflow = total_tokens - model_to_use.context_length
+
+            if cur_end_line > min_end_line:
+                lines_dropped = line_tokens.fewest_lines_from_end(
+                    overflow, cur_end_line - min_end_line
                 )
-                cur_end_line -= 1
-                if total_tokens < model_to_use.context_length:
-                    break
+                total_tokens -= line_tokens.tokens_in_lines(
+                    len(full_file_contents_lst) - lines_dropped,
+                    len(full_file_contents_lst),
+                )
+                cur_end_line -= lines_dropped
+                overflow = total_tokens - model_to_use.context_length
 
-        if total_tokens > model_to_use.context_length:
-            while cur_start_line < max_start_line:
-                cur_start_line += 1
-                total_tokens -= model_to_use.count_tokens(
-                    full_file_contents_lst[cur_start_line]
+            if overflow > 0 and cur_start_line < max_start_line:
+                cur_start_line = line_tokens.fewest_lines_from_start(
+                    overflow, max_start_line
                 )
-                if total_tokens < model_to_use.context_length:
-                    break
+                total_tokens -= line_tokens.tokens_in_lines(0, cur_start_line)
 
         # Now use the found start/end lines to get the prefix and suffix strings
         file_prefix = "\n".join(full_file_contents_lst[cur_start_line:max_start_line])
@@ -421,53 +435,58 @@ Please output the code to be inserted at the cursor in order to fulfill the user
         full_file_contents_lines = full_file_contents.split("\n")
 
         lines_to_display = []
+        # Keeps track of which of the original lines have been rewritten so far
+        line_aligner = LineAligner(rif.contents.split("\n"))
+        # The lines between the prefix and suffix that the IDE is showing, None until the diff has been started
+        displayed_lines = None
 
         async def sendDiffUpdate(
             lines: List[str], sdk: ContinueSDK, final: bool = False
         ):
-            nonlocal full_file_contents_lines, rif, lines_to_display
-
-            completion = "\n".join(lines)
+            nonlocal full_file_contents_lines, rif, lines_to_display, displayed_lines
 
             full_prefix_lines = full_file_contents_lines[: rif.range.start.line]
             full_suffix_lines = full_file_contents_lines[rif.range.end.line :]
+            step_index = sdk.history.current_index
 
             # Don't do this at the very end, just show the inserted code
             if final:
-                lines_to_display = []
-            # Only recalculate at every new-line, because this is sort of expensive
-            elif completion.endswith("\n"):
-                contents_lines = rif.contents.split("\n")
-                rewritten_lines = 0
-                for line in lines:
-                    for i in range(rewritten_lines, len(contents_lines)):
-                        if (
-                            difflib.SequenceMatcher(
-                                None, line, contents_lines[i]
-                            ).ratio()
-                            > 0.7
-                            and contents_lines[i].strip() != ""
-                        ):
-                            rewritten_lines = i + 1
-                            break
-                lines_to_display = contents_lines[rewritten_lines:]
-
-            new_file_contents = (
-                "\n".join(full_prefix_lines)
-                + "\n"
-                + completion
-                + "\n"
-                + (
-                    "\n".join(lines_to_display) + "\n"
-                    if len(lines_to_display) > 0
-                    else ""
+                new_file_contents = (
+                    "\n".join(full_prefix_lines)
+                    + "\n"
+                    + "\n".join(lines)
+                    + "\n"
+                    + "\n".join(full_suffix_lines)
                 )
-                + "\n".join(full_suffix_lines)
-            )
-
-            step_index = sdk.history.current_index
+                await sdk.ide.showDiff(rif.filepath, new_file_contents, step_index)
+                return
 
-            await sdk.ide.showDiff(rif.filepath, new_file_contents, step_index)
+            # Only the new lines are aligned, and not the last one, which is still being generated
+            line_aligner.update(lines[:-1])
+            lines_to_display = line_aligner.remaining_lines
+
+            # While streaming, only send the part of the file that changed since the last update.
+            # These are the lines of the file as a whole, split the same way as the final contents
+            prefix_lines = full_prefix_lines if len(full_prefix_lines) > 0 else [""]
+            suffix_lines = full_suffix_lines if len(full_suffix_lines) > 0 else [""]
+            new_lines = (lines if len(lines) > 0 else [""]) + lines_to_display
+
+            if displayed_lines is None:
+                await sdk.ide.showDiffBase(
+                    rif.filepath,
+                    "\n".join(prefix_lines + new_lines + suffix_lines),
+                    step_index,
+                )
+            elif hunk := calculate_line_hunk(displayed_lines, new_lines):
+                start, end, replacement = hunk
+                await sdk.ide.showDiffHunk(
+                    rif.filepath,
+                    len(prefix_lines) + start,
+                    len(prefix_lines) + end,
+                    replacement,
+                    step_index,
+                )
+            displayed_lines = new_lines
 
         # Important state variables
         # -------------------------
@@ -476,6 +495,7 @@ Please output the code to be inserted at the cursor in order to fulfill the user
         current_line_in_file = rif.range.start.line
         current_block_lines = []
         original_lines_below_previous_blocks = original_lines
+        original_line_index = LineHashIndex(original_lines)
         # The start of the current block in file, taking into account block offset
         current_block_start = -1
         offset_from_blocks = 0
@@ -607,14 +627,15 @@ Please output the code to be inserted at the cursor in order to fulfill the user
                 return
 
             # Always look for new matching candidates
-            new_matches = []
-            for i in range(len(original_lines_below_previous_blocks)):
-                og_line = original_lines_below_previous_blocks[i]
-                # TODO: It's a bit sus to be disqualifying empty lines.
-                # What you ideally do is find ALL matches, and then throw them out as you check the following lines
-                if og_line == line:  # and og_line.strip() != "":
-                    new_matches.append((i, 1))
-            indices_of_last_matched_lines += new_matches
+            # TODO: It's a bit sus to be disqualifying empty lines.
+            # What you ideally do is find ALL matches, and then throw them out as you check the following lines
+            lines_consumed = len(original_lines) - len(
+                original_lines_below_previous_blocks
+            )
+            indices_of_last_matched_lines += [
+                (i - lines_consumed, 1)
+                for i in original_line_index.positions(line, lines_consumed)
+            ]
 
             # Make sure they are sorted by index
             indices_of_last_matched_lines = sorted(
@@ -806,19 +827,20 @@ Please output the code to be inserted at the cursor in order to fulfill the user
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
         await sdk.update_ui()
 
-        rif_with_contents = []
-        for range_in_file in map(
-            lambda x: RangeInFile(
+        range_in_files = [
+            RangeInFile(
                 filepath=x.filepath,
                 # Only consider the range line-by-line. Maybe later don't if it's only a single line.
                 range=x.range.to_full_lines(),
-            ),
-            self.range_in_files,
-        ):
-            file_contents = await sdk.ide.readRangeInFile(range_in_file)
-            rif_with_contents.append(
-                RangeInFileWithContents.from_range_in_file(range_in_file, file_contents)
             )
+            for x in self.range_in_files
+        ]
+        rif_with_contents = [
+            RangeInFileWithContents.from_range_in_file(range_in_file, file_contents)
+            for range_in_file, file_contents in zip(
+                range_in_files, await sdk.ide.readRangesInFiles(range_in_files)
+            )
+        ]
 
         rif_dict = {}
         for rif in rif_with_contents:
@@ -879,12 +901,35 @@ class ManualEditStep(ReversibleStep):
         #     Maximally concise summary of changes in bullet points (can use markdown):
         # """))
 
+    @classmethod
+    def from_contents(
+        cls, filepath: str, original: str, updated: str
+    ) -> "ManualEditStep":
+        return cls(
+            edit_diff=EditDiff(
+                forward=SequentialFileSystemEdit(
+                    edits=calculate_line_diff(filepath, original, updated)
+                ),
+                backward=SequentialFileSystemEdit(
+                    edits=calculate_line_diff(filepath, updated, original)
+                ),
+            )
+        )
+
     @classmethod
     def from_sequence(cls, edits: List[FileEditWithFullContents]) -> "ManualEditStep":
-        diffs = []
+        # Rather than keeping every keystroke, diff each file from before its first edit to after its last
+        contents: Dict[str, Tuple[str, str]] = {}
         for edit in edits:
-            _, diff = FileSystem.apply_edit_to_str(edit.fileContents, edit.fileEdit)
-            diffs.append(diff)
+            updated, _ = FileSystem.apply_edit_to_str(edit.fileContents, edit.fileEdit)
+            filepath = edit.fileEdit.filepath
+            original = contents.get(filepath, (edit.fileContents,))[0]
+            contents[filepath] = (original, updated)
+
+        diffs = [
+            cls.from_contents(filepath, original, updated).edit_diff
+            for filepath, (original, updated) in contents.items()
+        ]
         return cls(edit_diff=EditDiff.from_sequence(diffs))
 
     async def run(self, sdk: ContinueSDK) -> Coroutine[Observation, None, None]:
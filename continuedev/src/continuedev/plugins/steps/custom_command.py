@@ -1,6 +1,6 @@
 from ...core.main import Step
 from ...core.sdk import ContinueSDK, Models
-from ...libs.util.templating import render_templated_string
+from ...libs.util.templating import render_templated_string_async
 from ..steps.chat import SimpleChatStep
 
 
@@ -15,7 +15,7 @@ class CustomCommandStep(Step):
         return self.prompt
 
     async def run(self, sdk: ContinueSDK):
-        task = render_templated_string(self.prompt)
+        task = await render_templated_string_async(self.prompt)
 
         prompt_user_input = f"Task: {task}. Additional info: {self.user_input}"
         messages = await sdk.get_chat_context()
@@ -8,10 +8,10 @@ from ...core.main import ContinueCustomException, Step
 from ...core.observation import Observation
 from ...core.sdk import ContinueSDK, Models
 from ...libs.llm.prompt_utils import MarkdownStyleEncoderDecoder
-from ...libs.util.calculate_diff import calculate_diff2
+from ...libs.util.calculate_diff import calculate_line_diff
 from ...libs.util.logging import logger
 from ...models.filesystem import RangeInFile, RangeInFileWithContents
-from ...models.filesystem_edit import EditDiff, FileEdit
+from ...models.filesystem_edit import EditDiff, SequentialFileSystemEdit
 from ...models.main import Range, Traceback
 from .core.core import DefaultModelEditCodeStep
 
@@ -87,9 +87,7 @@ class FasterEditHighlightedCodeStep(Step):
         if len(range_in_files) == 0:
             # Get the full contents of all visible files
             files = await sdk.ide.getVisibleFiles()
-            contents = {}
-            for file in files:
-                contents[file] = await sdk.ide.readFile(file)
+            contents = dict(zip(files, await sdk.ide.readFiles(files)))
 
             range_in_files = [
                 RangeInFileWithContents.from_entire_file(filepath, content)
@@ -100,10 +98,6 @@ class FasterEditHighlightedCodeStep(Step):
         code_string = enc_dec.encode()
         prompt = self._prompt.format(code=code_string, user_input=self.user_input)
 
-        rif_dict = {}
-        for rif in range_in_files:
-            rif_dict[rif.filepath] = rif.contents
-
         completion = await sdk.models.medium.complete(prompt)
 
         # Temporarily doing this to generate description.
@@ -119,7 +113,7 @@ class FasterEditHighlightedCodeStep(Step):
         for i in range(0, len(lines)):
             line = lines[i]
             if line == "FILEPATH":
-                if "FILEPATH" in current_edit:
+                if "filepath" in current_edit:
                     raw_file_edits.append(current_edit)
                 current_edit = {}
                 status = "FILEPATH"
@@ -142,28 +136,39 @@ class FasterEditHighlightedCodeStep(Step):
         if "filepath" in current_edit:
             raw_file_edits.append(current_edit)
 
-        file_edits = []
+        # Make the replacements in each file's contents, then diff the result, so that the
+        # ranges of later replacements aren't thrown off by earlier ones in the same file
+        filepaths = list(dict.fromkeys(edit["filepath"] for edit in raw_file_edits))
+        original_contents = dict(zip(filepaths, await sdk.ide.readFiles(filepaths)))
+        updated_contents = dict(original_contents)
         for edit in raw_file_edits:
             filepath = edit["filepath"]
-            replace_me = edit["replace_me"]
-            replace_with = edit["replace_with"]
-            file_edits.append(
-                FileEdit(
-                    filepath=filepath,
-                    range=Range.from_lines_snippet_in_file(
-                        content=rif_dict[filepath], snippet=replace_me
-                    ),
-                    replacement=replace_with,
-                )
+            lines = updated_contents[filepath].splitlines(keepends=True)
+            r = Range.from_lines_snippet_in_file(
+                content=updated_contents[filepath], snippet=edit["replace_me"]
+            )
+            replacement = edit.get("replace_with", "")
+            if replacement != "" and lines[r.end.line].endswith("\n"):
+                replacement += "\n"
+            updated_contents[filepath] = "".join(
+                lines[: r.start.line] + [replacement] + lines[r.end.line + 1 :]
             )
-        # ------------------------------
 
         self._edit_diffs = []
-        for file_edit in file_edits:
-            diff = await sdk.apply_filesystem_edit(file_edit)
-            self._edit_diffs.append(diff)
+        for filepath in filepaths:
+            file_edits = calculate_line_diff(
+                filepath,
+                original_contents[filepath],
+                updated_contents[filepath],
+                refine=True,
+            )
+            if len(file_edits) > 0:
+                diff = await sdk.apply_filesystem_edit(
+                    SequentialFileSystemEdit(edits=file_edits)
+                )
+                self._edit_diffs.append(diff)
 
-        for filepath in set([file_edit.filepath for file_edit in file_edits]):
+        for filepath in filepaths:
             await sdk.ide.saveFile(filepath)
             await sdk.ide.setFileOpen(filepath)
 
@@ -189,26 +194,25 @@ class StarCoderEditHighlightedCodeStep(Step):
         if not found_highlighted_code:
             # Get the full contents of all visible files
             files = await sdk.ide.getVisibleFiles()
-            contents = {}
-            for file in files:
-                contents[file] = await sdk.ide.readFile(file)
+            contents = dict(zip(files, await sdk.ide.readFiles(files)))
 
             range_in_files = [
                 RangeInFileWithContents.from_entire_file(filepath, content)
                 for filepath, content in contents.items()
             ]
 
-        rif_dict = {}
-        for rif in range_in_files:
-            rif_dict[rif.filepath] = rif.contents
+        if found_highlighted_code:
+            full_file_contents_list = await sdk.ide.readFiles(
+                [rif.filepath for rif in range_in_files]
+            )
 
-        for rif in range_in_files:
+        for i, rif in enumerate(range_in_files):
             prompt = self._prompt.format(
                 code=rif.contents, user_request=self.user_input
             )
 
             if found_highlighted_code:
-                full_file_contents = await sdk.ide.readFile(rif.filepath)
+                full_file_contents = full_file_contents_list[i]
                 segs = full_file_contents.split(rif.contents)
                 prompt = f"<file_prefix>{segs[0]}<file_suffix>{segs[1]}" + prompt
 
@@ -222,8 +226,8 @@ class StarCoderEditHighlightedCodeStep(Step):
 
             self._prompt_and_completion += prompt + completion
 
-            edits = calculate_diff2(
-                rif.filepath, rif.contents, completion.removesuffix("\n")
+            edits = calculate_line_diff(
+                rif.filepath, rif.contents, completion.removesuffix("\n"), refine=True
             )
             for edit in edits:
                 await sdk.ide.applyFileSystemEdit(edit)
@@ -318,10 +322,11 @@ class SolveTracebackStep(Step):
             """
         ).format(traceback=self.traceback.full_traceback, code="{code}")
 
-        range_in_files = []
-        for frame in self.traceback.frames:
-            content = await sdk.ide.readFile(frame.filepath)
-            range_in_files.append(RangeInFile.from_entire_file(frame.filepath, content))
+        filepaths = [frame.filepath for frame in self.traceback.frames]
+        range_in_files = [
+            RangeInFile.from_entire_file(filepath, content)
+            for filepath, content in zip(filepaths, await sdk.ide.readFiles(filepaths))
+        ]
 
         await sdk.run_step(
             DefaultModelEditCodeStep(range_in_files=range_in_files, user_input=prompt)
@@ -17,6 +17,7 @@ class DefaultOnTracebackStep(Step):
 
     async def find_relevant_files(self, sdk: ContinueSDK):
         # Add context for any files in the traceback that are in the workspace
+        filepaths = []
         for line in self.output.split("\n"):
             segs = line.split(" ")
             for seg in segs:
@@ -26,14 +27,18 @@ class DefaultOnTracebackStep(Step):
                     and os.path.commonprefix([seg, sdk.ide.workspace_directory])
                     == sdk.ide.workspace_directory
                 ):
-                    file_contents = await sdk.ide.readFile(seg)
-                    self.chat_context.append(
-                        ChatMessage(
-                            role="user",
-                            content=f"The contents of {seg}:\n```\n{file_contents}\n```",
-                            summary="",
-                        )
-                    )
+                    filepaths.append(seg)
+
+        for filepath, file_contents in zip(
+            filepaths, await sdk.ide.readFiles(filepaths)
+        ):
+            self.chat_context.append(
+                ChatMessage(
+                    role="user",
+                    content=f"The contents of {filepath}:\n```\n{file_contents}\n```",
+                    summary="",
+                )
+            )
         # TODO: The ideal is that these are added as context items, so then the user can see them
         # And this function is where you can get arbitrarily fancy about adding context
 
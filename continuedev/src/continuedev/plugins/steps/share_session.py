@@ -1,6 +1,6 @@
+import asyncio
 import json
 import os
-import time
 from typing import Optional
 
 from ...core.main import FullState, Step
@@ -17,7 +17,7 @@ class ShareSessionStep(Step):
             self.session_id = sdk.ide.session_id
 
         await session_manager.persist_session(self.session_id)
-        time.sleep(0.5)
+        await asyncio.sleep(0.5)
 
         # Load the session data and format as a markdown file
         session_filepath = getSessionFilePath(self.session_id)
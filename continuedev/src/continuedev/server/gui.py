@@ -11,6 +11,7 @@ from uvicorn.main import Server
 from ..core.main import ContextItem
 from ..libs.util.create_async_task import create_async_task
 from ..libs.util.logging import logger
+from ..libs.util.metrics import WEBSOCKET_REQUEST_DURATION, count_websocket_message
 from ..libs.util.queue import AsyncSubscriptionQueue
 from ..libs.util.telemetry import posthog_logger
 from ..plugins.steps.core.core import DisplayErrorStep
@@ -48,14 +49,16 @@ T = TypeVar("T", bound=BaseModel)
 class GUIProtocolServer(AbstractGUIProtocolServer):
     websocket: WebSocket
     session: Session
-    sub_queue: AsyncSubscriptionQueue = AsyncSubscriptionQueue()
+    sub_queue: AsyncSubscriptionQueue
 
     def __init__(self, session: Session):
         self.session = session
+        self.sub_queue = AsyncSubscriptionQueue()
 
     async def _send_json(self, message_type: str, data: Any):
         if self.websocket.application_state == WebSocketState.DISCONNECTED:
             return
+        count_websocket_message("gui", "sent", message_type)
         await self.websocket.send_json({"messageType": message_type, "data": data})
 
     async def _receive_json(self, message_type: str, timeout: int = 20) -> Any:
@@ -69,8 +72,9 @@ class GUIProtocolServer(AbstractGUIProtocolServer):
     async def _send_and_receive_json(
         self, data: Any, resp_model: Type[T], message_type: str
     ) -> T:
-        await self._send_json(message_type, data)
-        resp = await self._receive_json(message_type)
+        with WEBSOCKET_REQUEST_DURATION.labels("gui", message_type).time():
+            await self._send_json(message_type, data)
+            resp = await self._receive_json(message_type)
         return resp_model.parse_obj(resp)
 
     def on_error(self, e: Exception):
@@ -113,6 +117,13 @@ class GUIProtocolServer(AbstractGUIProtocolServer):
             self.select_context_group(data["id"])
         elif message_type == "delete_context_group":
             self.delete_context_group(data["id"])
+        elif message_type == "resync":
+            self.on_resync()
+
+    def on_resync(self):
+        # The GUI missed a delta, so send it a full snapshot
+        self.session.state_encoder.reset()
+        create_async_task(self.session.autopilot.update_subscribers(), self.on_error)
 
     def on_main_input(self, input: str):
         # Do something with user input
@@ -238,6 +249,7 @@ async def websocket_endpoint(
                 continue  # :o
             message_type = message["messageType"]
             data = message["data"]
+            count_websocket_message("gui", "received", message_type)
 
             protocol.handle_json(message_type, data)
     except WebSocketDisconnect:
@@ -1,10 +1,12 @@
 # This is a separate server from server/main.py
 import asyncio
+import base64
+import gzip
 import json
 import os
 import traceback
 import uuid
-from typing import Any, Coroutine, List, Type, TypeVar, Union
+from typing import Any, Coroutine, Dict, List, Optional, Tuple, Type, TypeVar, Union
 
 import nest_asyncio
 from fastapi import APIRouter, WebSocket
@@ -13,8 +15,9 @@ from starlette.websockets import WebSocketDisconnect, WebSocketState
 from uvicorn.main import Server
 
 from ..libs.util.create_async_task import create_async_task
+from ..libs.util.document_cache import DocumentCache
 from ..libs.util.logging import logger
-from ..libs.util.queue import AsyncSubscriptionQueue
+from ..libs.util.metrics import WEBSOCKET_REQUEST_DURATION, count_websocket_message
 from ..libs.util.telemetry import posthog_logger
 from ..models.filesystem import (
     EditDiff,
@@ -35,6 +38,7 @@ from ..models.filesystem_edit import (
     RenameFile,
     SequentialFileSystemEdit,
 )
+from ..models.main import LineIndex
 from ..plugins.steps.core.core import DisplayErrorStep
 from .gui import session_manager
 from .ide_protocol import AbstractIdeProtocolServer
@@ -96,6 +100,19 @@ class ReadFileResponse(BaseModel):
     contents: str
 
 
+class ReadFilesResponse(BaseModel):
+    contents: Optional[List[str]] = None
+    # gzipped, base64 encoded JSON list of the contents, if compression was requested
+    compressedContents: Optional[str] = None
+
+    def get_contents(self) -> List[str]:
+        if self.compressedContents is not None:
+            return json.loads(
+                gzip.decompress(base64.b64decode(self.compressedContents))
+            )
+        return self.contents or []
+
+
 class EditFileResponse(BaseModel):
     fileEdit: FileEditWithFullContents
 
@@ -139,15 +156,42 @@ class cached_property_no_none:
         return f"<cached_property_no_none '{self.func.__name__}'>"
 
 
+# Responses from the IDE to a request sent with _send_and_receive_json
+RESPONSE_MESSAGE_TYPES = [
+    "highlightedCode",
+    "openFiles",
+    "visibleFiles",
+    "readFile",
+    "readFiles",
+    "editFile",
+    "getUserSecret",
+    "runCommand",
+    "getTerminalContents",
+    "showSuggestion",
+]
+
+
 class IdeProtocolServer(AbstractIdeProtocolServer):
     websocket: WebSocket
     session_manager: SessionManager
-    sub_queue: AsyncSubscriptionQueue = AsyncSubscriptionQueue()
     session_id: Union[str, None] = None
 
+    # Requests waiting for a response, by messageId. These are per-connection,
+    # so any number of requests can be in flight on one websocket at a time.
+    _pending_requests: Dict[str, Tuple[str, asyncio.Future]]
+
+    # Contents of the files read through this connection, kept up to date by the IDE's fileEdits
+    document_cache: DocumentCache
+
+    # The version of each diff being streamed with showDiffHunk
+    _diff_versions: Dict[str, int]
+
     def __init__(self, session_manager: SessionManager, websocket: WebSocket):
         self.websocket = websocket
         self.session_manager = session_manager
+        self._pending_requests = {}
+        self.document_cache = DocumentCache()
+        self._diff_versions = {}
 
     workspace_directory: str = None
     unique_id: str = None
@@ -165,6 +209,7 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             message_type = message["messageType"]
             data = message["data"]
             logger.debug(f"Received message while initializing {message_type}")
+            count_websocket_message("ide", "received", message_type)
             if message_type == "workspaceDirectory":
                 self.workspace_directory = data["workspaceDirectory"]
             elif message_type == "uniqueId":
@@ -176,39 +221,89 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
                 break
         return other_msgs
 
-    async def _send_json(self, message_type: str, data: Any):
+    async def _send_json(
+        self, message_type: str, data: Any, message_id: Optional[str] = None
+    ):
         if self.websocket.application_state == WebSocketState.DISCONNECTED:
             logger.debug(
                 f"Tried to send message, but websocket is disconnected: {message_type}"
             )
             return
         logger.debug(f"Sending IDE message: {message_type}")
-        await self.websocket.send_json({"messageType": message_type, "data": data})
+        count_websocket_message("ide", "sent", message_type)
+        message = {"messageType": message_type, "data": data}
+        if message_id is not None:
+            message["messageId"] = message_id
+        await self.websocket.send_json(message)
 
-    async def _receive_json(self, message_type: str, timeout: int = 20) -> Any:
-        try:
-            return await asyncio.wait_for(
-                self.sub_queue.get(message_type), timeout=timeout
+    async def _send_and_receive_json(
+        self, data: Any, resp_model: Type[T], message_type: str, timeout: float = 20
+    ) -> T:
+        """Send a request to the IDE, and wait for the response with the same messageId"""
+        if self.websocket.application_state == WebSocketState.DISCONNECTED:
+            raise Exception(
+                f"IDE Protocol request failed, the IDE is disconnected: {message_type}"
             )
+
+        message_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending_requests[message_id] = (message_type, future)
+        try:
+            with WEBSOCKET_REQUEST_DURATION.labels("ide", message_type).time():
+                await self._send_json(message_type, data, message_id)
+                resp = await asyncio.wait_for(future, timeout=timeout)
         except asyncio.TimeoutError:
             raise Exception(
-                f"IDE Protocol _receive_json timed out after 20 seconds: {message_type}"
+                f"IDE Protocol request timed out after {timeout} seconds: {message_type}"
             )
-
-    async def _send_and_receive_json(
-        self, data: Any, resp_model: Type[T], message_type: str
-    ) -> T:
-        await self._send_json(message_type, data)
-        resp = await self._receive_json(message_type)
+        finally:
+            self._pending_requests.pop(message_id, None)
         return resp_model.parse_obj(resp)
 
-    async def handle_json(self, message_type: str, data: Any):
-        if message_type == "getSessionId":
+    def fail_pending_requests(self):
+        """Fail the requests still waiting for a response, because the IDE has disconnected"""
+        pending_requests = list(self._pending_requests.values())
+        self._pending_requests.clear()
+        for message_type, future in pending_requests:
+            if not future.done():
+                future.set_exception(
+                    Exception(
+                        f"IDE Protocol request failed, the IDE disconnected: {message_type}"
+                    )
+                )
+
+    def _resolve_request(
+        self, message_type: str, data: Any, message_id: Optional[str] = None
+    ):
+        pending = self._pending_requests.get(message_id)
+        if pending is None:
+            # IDEs that don't send back the messageId answer requests of each type in order
+            pending = next(
+                (
+                    p
+                    for p in self._pending_requests.values()
+                    if p[0] == message_type and not p[1].done()
+                ),
+                None,
+            )
+        if pending is None or pending[1].done():
+            logger.debug(f"Received response to no pending request: {message_type}")
+            return
+        pending[1].set_result(data)
+
+    async def handle_json(
+        self, message_type: str, data: Any, message_id: Optional[str] = None
+    ):
+        if message_type in RESPONSE_MESSAGE_TYPES:
+            self._resolve_request(message_type, data, message_id)
+        elif message_type == "getSessionId":
             await self.getSessionId()
         elif message_type == "setFileOpen":
-            await self.setFileOpen(data["filepath"], data["open"])
+            self.onFileOpenChanged(data["filepath"], data["open"])
         elif message_type == "setSuggestionsLocked":
             await self.setSuggestionsLocked(data["filepath"], data["locked"])
+        elif message_type == "filesChanged":
+            self.onFilesChanged(data["filepaths"])
         elif message_type == "fileEdits":
             fileEdits = list(
                 map(lambda d: FileEditWithFullContents.parse_obj(d), data["fileEdits"])
@@ -232,17 +327,6 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             self.onMainUserInput(data["input"])
         elif message_type == "deleteAtIndex":
             self.onDeleteAtIndex(data["index"])
-        elif message_type in [
-            "highlightedCode",
-            "openFiles",
-            "visibleFiles",
-            "readFile",
-            "editFile",
-            "getUserSecret",
-            "runCommand",
-            "getTerminalContents",
-        ]:
-            self.sub_queue.post(message_type, data)
         elif message_type == "workspaceDirectory":
             self.workspace_directory = data["workspaceDirectory"]
         elif message_type == "uniqueId":
@@ -254,6 +338,7 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
         await self._send_json("showSuggestion", {"edit": file_edit.dict()})
 
     async def showDiff(self, filepath: str, replacement: str, step_index: int):
+        self._diff_versions.pop(filepath, None)
         await self._send_json(
             "showDiff",
             {
@@ -263,6 +348,37 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             },
         )
 
+    async def showDiffBase(self, filepath: str, contents: str, step_index: int):
+        """Start streaming a diff. Later updates are sent as hunks, with showDiffHunk, and it ends with showDiff."""
+        self._diff_versions[filepath] = 0
+        await self._send_json(
+            "showDiffBase",
+            {"filepath": filepath, "contents": contents, "step_index": step_index},
+        )
+
+    async def showDiffHunk(
+        self,
+        filepath: str,
+        start: int,
+        end: int,
+        lines: List[str],
+        step_index: int,
+    ):
+        """Replace lines start to end (exclusive) of the streamed diff, as of the previous update, with `lines`"""
+        version = self._diff_versions.get(filepath, 0) + 1
+        self._diff_versions[filepath] = version
+        await self._send_json(
+            "showDiffHunk",
+            {
+                "filepath": filepath,
+                "version": version,
+                "start": start,
+                "end": end,
+                "lines": lines,
+                "step_index": step_index,
+            },
+        )
+
     async def setFileOpen(self, filepath: str, open: bool = True):
         # Autopilot needs access to this.
         await self._send_json("setFileOpen", {"filepath": filepath, "open": open})
@@ -300,15 +416,15 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
         ).output
 
     async def showSuggestionsAndWait(self, suggestions: List[FileEdit]) -> bool:
-        ids = [str(uuid.uuid4()) for _ in suggestions]
-        for i in range(len(suggestions)):
-            self._send_json(
-                "showSuggestion", {"suggestion": suggestions[i], "suggestionId": ids[i]}
-            )
         responses = await asyncio.gather(
             *[
-                self._receive_json(ShowSuggestionResponse)
-                for i in range(len(suggestions))
+                self._send_and_receive_json(
+                    {"suggestion": suggestion.dict()},
+                    ShowSuggestionResponse,
+                    "showSuggestion",
+                    timeout=None,
+                )
+                for suggestion in suggestions
             ]
         )  # WORKING ON THIS FLOW HERE. Fine now to just await for response, instead of doing something fancy with a "waiting" state on the autopilot.
         # Just need connect the suggestionId to the IDE (and the gui)
@@ -344,8 +460,17 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
         return autopilot if autopilot.started else None
 
     def onFileEdits(self, edits: List[FileEditWithFullContents]):
-        if autopilot := self.__get_autopilot():
-            pass
+        for edit in edits:
+            self.document_cache.update(edit.fileEdit.filepath, edit.fileContents)
+
+    def onFilesChanged(self, filepaths: List[str]):
+        # The IDE only says that a file it has given us changed, so it's read again when needed
+        for filepath in filepaths:
+            self.document_cache.invalidate(filepath)
+
+    def onFileOpenChanged(self, filepath: str, open: bool):
+        # Reads come from the editor while a file is open and from disk otherwise, which can differ
+        self.document_cache.invalidate(filepath)
 
     def onDeleteAtIndex(self, index: int):
         if autopilot := self.__get_autopilot():
@@ -394,11 +519,44 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
 
     async def readFile(self, filepath: str) -> str:
         """Read a file"""
+        if (contents := self.document_cache.get(filepath)) is not None:
+            return contents
+
+        version = self.document_cache.version(filepath)
+        mtime = self.document_cache.mtime(filepath)
         resp = await self._send_and_receive_json(
             {"filepath": filepath}, ReadFileResponse, "readFile"
         )
+        self.document_cache.put(filepath, resp.contents, version, mtime)
         return resp.contents
 
+    async def readFiles(
+        self, filepaths: List[str], compress: bool = False
+    ) -> List[str]:
+        """Read many files in one round trip, optionally gzipped"""
+        contents = {
+            filepath: self.document_cache.get(filepath)
+            for filepath in dict.fromkeys(filepaths)
+        }
+        missing = [filepath for filepath, c in contents.items() if c is None]
+        if len(missing) > 0:
+            versions = [
+                (self.document_cache.version(f), self.document_cache.mtime(f))
+                for f in missing
+            ]
+            resp = await self._send_and_receive_json(
+                {"filepaths": missing, "compress": compress},
+                ReadFilesResponse,
+                "readFiles",
+            )
+            for filepath, file_contents, (version, mtime) in zip(
+                missing, resp.get_contents(), versions
+            ):
+                self.document_cache.put(filepath, file_contents, version, mtime)
+                contents[filepath] = file_contents
+
+        return [contents[filepath] for filepath in filepaths]
+
     async def getUserSecret(self, key: str) -> str:
         """Get a user secret"""
         try:
@@ -419,8 +577,28 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
         full_contents = await self.readFile(range_in_file.filepath)
         return FileSystem.read_range_in_str(full_contents, range_in_file.range)
 
+    async def readRangesInFiles(
+        self, range_in_files: List[RangeInFile], compress: bool = False
+    ) -> List[str]:
+        """Read many ranges, reading each file only once"""
+        filepaths = list(dict.fromkeys(rif.filepath for rif in range_in_files))
+        full_contents = dict(
+            zip(filepaths, await self.readFiles(filepaths, compress=compress))
+        )
+        line_indices = {
+            filepath: LineIndex(contents)
+            for filepath, contents in full_contents.items()
+        }
+        return [
+            FileSystem.read_range_in_str(
+                full_contents[rif.filepath], rif.range, line_indices[rif.filepath]
+            )
+            for rif in range_in_files
+        ]
+
     async def editFile(self, edit: FileEdit) -> FileEditWithFullContents:
         """Edit a file"""
+        self.document_cache.invalidate(edit.filepath)
         resp = await self._send_and_receive_json(
             {"edit": edit.dict()}, EditFileResponse, "editFile"
         )
@@ -437,13 +615,17 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             )
             backward = diff.backward
         elif isinstance(edit, AddFile):
+            self.document_cache.invalidate(edit.filepath)
             fs.write(edit.filepath, edit.content)
             backward = DeleteFile(filepath=edit.filepath)
         elif isinstance(edit, DeleteFile):
             contents = await self.readFile(edit.filepath)
             backward = AddFile(filepath=edit.filepath, content=contents)
+            self.document_cache.invalidate(edit.filepath)
             fs.delete_file(edit.filepath)
         elif isinstance(edit, RenameFile):
+            self.document_cache.invalidate(edit.filepath)
+            self.document_cache.invalidate(edit.new_filepath)
             fs.rename_file(edit.filepath, edit.new_filepath)
             backward = RenameFile(
                 filepath=edit.new_filepath, new_filepath=edit.filepath
@@ -473,6 +655,8 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
             backward_edits.reverse()
             backward = SequentialFileSystemEdit(edits=backward_edits)
         elif isinstance(edit, RenameDirectory):
+            self.document_cache.invalidate_directory(edit.path)
+            self.document_cache.invalidate_directory(edit.new_path)
             fs.rename_directory(edit.path, edit.new_path)
             backward = RenameDirectory(path=edit.new_path, new_path=edit.path)
         elif isinstance(edit, FileSystemEdit):
@@ -489,6 +673,7 @@ class IdeProtocolServer(AbstractIdeProtocolServer):
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, session_id: str = None):
+    ideProtocolServer = None
     try:
         # Accept the websocket connection
         await websocket.accept()
@@ -512,8 +697,11 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str = None):
             data = message["data"]
 
             logger.debug(f"Received IDE message: {message_type}")
+            count_websocket_message("ide", "received", message_type)
             create_async_task(
-                ideProtocolServer.handle_json(message_type, data),
+                ideProtocolServer.handle_json(
+                    message_type, data, message.get("messageId")
+                ),
                 ideProtocolServer.on_error,
             )
 
@@ -554,6 +742,8 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str = None):
         raise e
     finally:
         logger.debug("Closing ide websocket")
+        if ideProtocolServer is not None:
+            ideProtocolServer.fail_pending_requests()
         if websocket.client_state != WebSocketState.DISCONNECTED:
             await websocket.close()
 
@@ -75,10 +75,22 @@ class AbstractIdeProtocolServer(ABC):
     async def readFile(self, filepath: str) -> str:
         """Read a file"""
 
+    @abstractmethod
+    async def readFiles(
+        self, filepaths: List[str], compress: bool = False
+    ) -> List[str]:
+        """Read many files in one round trip"""
+
     @abstractmethod
     async def readRangeInFile(self, range_in_file: RangeInFile) -> str:
         """Read a range in a file"""
 
+    @abstractmethod
+    async def readRangesInFiles(
+        self, range_in_files: List[RangeInFile], compress: bool = False
+    ) -> List[str]:
+        """Read many ranges in files in one round trip"""
+
     @abstractmethod
     async def editFile(self, edit: FileEdit):
         """Edit a file"""
@@ -115,5 +127,15 @@ class AbstractIdeProtocolServer(ABC):
     async def showDiff(self, filepath: str, replacement: str, step_index: int):
         """Show a diff"""
 
+    @abstractmethod
+    async def showDiffBase(self, filepath: str, contents: str, step_index: int):
+        """Start streaming a diff"""
+
+    @abstractmethod
+    async def showDiffHunk(
+        self, filepath: str, start: int, end: int, lines: List[str], step_index: int
+    ):
+        """Update part of a streamed diff"""
+
     workspace_directory: str
     unique_id: str
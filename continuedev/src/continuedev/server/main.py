@@ -5,8 +5,15 @@ import atexit
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
+from ..libs.llm.instrumentation import llm_metrics
+from ..libs.llm.rate_limit import provider_limiter_stats
+from ..libs.llm.retry import resilience_stats
+from ..libs.util.http_client import close_client_sessions, configure_http_client
 from ..libs.util.logging import logger
+from ..libs.util.loop_monitor import start_loop_monitor, stop_loop_monitor
+from ..libs.util.metrics import render_metrics
 from .gui import router as gui_router
 from .ide import router as ide_router
 from .session_manager import router as sessions_router
@@ -34,10 +41,82 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Server metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/metrics/llm")
+def llm_metrics_summary():
+    """Per-model latency and throughput of LLM calls, and the state of the provider limiters"""
+    return {
+        "llm": llm_metrics(),
+        "rate_limits": provider_limiter_stats(),
+        "resilience": resilience_stats(),
+    }
+
+
+@app.on_event("startup")
+async def on_startup():
+    configure_http_client(
+        max_connections=args.http_max_connections,
+        max_connections_per_host=args.http_max_connections_per_host,
+        connect_timeout=args.http_connect_timeout,
+        read_timeout=args.http_read_timeout,
+    )
+    start_loop_monitor(
+        lag_sample_interval=args.loop_lag_interval,
+        slow_callback_threshold=args.slow_callback_threshold,
+    )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    stop_loop_monitor()
+    # Close the pooled HTTP connections that are shared by all sessions
+    await close_client_sessions()
+
+
 try:
     # add cli arg for server port
     parser = argparse.ArgumentParser()
     parser.add_argument("-p", "--port", help="server port", type=int, default=65432)
+    parser.add_argument(
+        "--loop-lag-interval",
+        help="seconds between event loop lag samples",
+        type=float,
+        default=0.5,
+    )
+    parser.add_argument(
+        "--slow-callback-threshold",
+        help="log the stack when the event loop is blocked for longer than this many seconds (0 to disable)",
+        type=float,
+        default=0.25,
+    )
+    # Settings of the HTTP connection pool shared by the LLM backends (None keeps the default)
+    parser.add_argument(
+        "--http-max-connections",
+        help="maximum number of open connections to LLM backends",
+        type=int,
+    )
+    parser.add_argument(
+        "--http-max-connections-per-host",
+        help="maximum number of open connections to each LLM backend host",
+        type=int,
+    )
+    parser.add_argument(
+        "--http-connect-timeout",
+        help="seconds to wait for a connection to an LLM backend",
+        type=float,
+    )
+    parser.add_argument(
+        "--http-read-timeout",
+        help="seconds an LLM backend can go without sending anything before the request fails (0 to disable)",
+        type=float,
+    )
     args = parser.parse_args()
 except Exception as e:
     logger.debug(f"Error parsing command line arguments: {e}")
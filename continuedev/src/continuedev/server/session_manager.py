@@ -1,5 +1,6 @@
 import json
 import os
+import threading
 import traceback
 from typing import Any, Coroutine, Dict, Optional, Union
 from uuid import uuid4
@@ -11,13 +12,16 @@ from ..core.autopilot import Autopilot
 from ..core.main import FullState
 from ..libs.util.create_async_task import create_async_task
 from ..libs.util.errors import SessionNotFound
+from ..libs.util.executor import FS_LANE, run_in_executor
 from ..libs.util.logging import logger
+from ..libs.util.metrics import add_collector, count_websocket_message, gauge
 from ..libs.util.paths import (
     getSessionFilePath,
     getSessionsFolderPath,
     getSessionsListFilePath,
 )
 from .ide_protocol import AbstractIdeProtocolServer
+from .state_delta import StateDeltaEncoder
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
 
@@ -27,11 +31,42 @@ class Session:
     autopilot: Autopilot
     # The GUI websocket for the session
     ws: Union[WebSocket, None]
+    # Tracks what the GUI has been sent, so only changes need to be sent
+    state_encoder: StateDeltaEncoder
 
     def __init__(self, session_id: str, autopilot: Autopilot):
         self.session_id = session_id
         self.autopilot = autopilot
         self.ws = None
+        self.state_encoder = StateDeltaEncoder()
+
+
+# Sessions can be persisted concurrently, but the sessions list must be updated by one at a time
+_sessions_list_lock = threading.Lock()
+
+
+def _write_session_files(session_id: str, full_state: dict, session_info: dict):
+    with open(getSessionFilePath(session_id), "w") as f:
+        json.dump(full_state, f)
+
+    # Read and update the sessions list
+    with _sessions_list_lock:
+        with open(getSessionsListFilePath(), "r") as f:
+            sessions_list = json.load(f)
+
+        session_ids = [s["session_id"] for s in sessions_list]
+        if session_id not in session_ids:
+            sessions_list.append(session_info)
+
+        with open(getSessionsListFilePath(), "w") as f:
+            json.dump(sessions_list, f)
+
+
+def _load_full_state(session_id: str) -> Optional[FullState]:
+    if not os.path.exists(getSessionFilePath(session_id)):
+        return None
+    with open(getSessionFilePath(session_id), "r") as f:
+        return FullState(**json.load(f))
 
 
 class SessionManager:
@@ -64,9 +99,10 @@ class SessionManager:
 
         # Load the persisted state (not being used right now)
         full_state = None
-        if session_id is not None and os.path.exists(getSessionFilePath(session_id)):
-            with open(getSessionFilePath(session_id), "r") as f:
-                full_state = FullState(**json.load(f))
+        if session_id is not None:
+            full_state = await run_in_executor(
+                _load_full_state, session_id, lane=FS_LANE
+            )
 
         # Register the session and ide (do this first so that the autopilot can access the session)
         autopilot = Autopilot(ide=ide)
@@ -78,9 +114,7 @@ class SessionManager:
 
         # Set up the autopilot to update the GUI
         async def on_update(state: FullState):
-            await session_manager.send_ws_data(
-                session_id, "state_update", {"state": state.dict()}
-            )
+            await session_manager.send_state_update(session_id, state)
 
         autopilot.on_update(on_update)
 
@@ -119,19 +153,14 @@ class SessionManager:
         if full_state.session_info is None:
             return
 
-        with open(getSessionFilePath(session_id), "w") as f:
-            json.dump(full_state.dict(), f)
-
-        # Read and update the sessions list
-        with open(getSessionsListFilePath(), "r") as f:
-            sessions_list = json.load(f)
-
-        session_ids = [s["session_id"] for s in sessions_list]
-        if session_id not in session_ids:
-            sessions_list.append(full_state.session_info.dict())
-
-        with open(getSessionsListFilePath(), "w") as f:
-            json.dump(sessions_list, f)
+        # Writing the files blocks, so it's done off the event loop
+        await run_in_executor(
+            _write_session_files,
+            session_id,
+            full_state.dict(),
+            full_state.session_info.dict(),
+            lane=FS_LANE,
+        )
 
     async def load_session(
         self, old_session_id: str, new_session_id: Optional[str] = None
@@ -151,6 +180,8 @@ class SessionManager:
 
     def register_websocket(self, session_id: str, ws: WebSocket):
         self.sessions[session_id].ws = ws
+        # A newly connected GUI needs a full snapshot before it can apply deltas
+        self.sessions[session_id].state_encoder.reset()
         logger.debug(f"Registered websocket for session {session_id}")
 
     async def send_ws_data(self, session_id: str, message_type: str, data: Any):
@@ -160,13 +191,46 @@ class SessionManager:
             # logger.debug(f"Session {session_id} has no websocket")
             return
 
+        count_websocket_message("gui", "sent", message_type)
         await self.sessions[session_id].ws.send_json(
             {"messageType": message_type, "data": data}
         )
 
+    async def send_state_update(self, session_id: str, state: FullState):
+        """Send the GUI either a snapshot of the state or the changes since the last update"""
+        if session_id not in self.sessions:
+            raise SessionNotFound(f"Session {session_id} not found")
+        session = self.sessions[session_id]
+        if session.ws is None:
+            return
+
+        if message := session.state_encoder.encode(state):
+            message_type, data = message
+            count_websocket_message("gui", "sent", message_type)
+            await session.ws.send_json({"messageType": message_type, "data": data})
+
 
 session_manager = SessionManager()
 
+ACTIVE_SESSIONS = gauge("continue_active_sessions", "Sessions currently loaded")
+CONNECTED_GUIS = gauge(
+    "continue_connected_guis", "Sessions with a GUI websocket connected"
+)
+REGISTERED_IDES = gauge("continue_registered_ides", "IDE websockets connected")
+
+
+def collect_session_metrics():
+    ACTIVE_SESSIONS.set(len(session_manager.sessions))
+    CONNECTED_GUIS.set(
+        sum(
+            1 for session in session_manager.sessions.values() if session.ws is not None
+        )
+    )
+    REGISTERED_IDES.set(len(session_manager.registered_ides))
+
+
+add_collector(collect_session_metrics)
+
 
 @router.get("/list")
 async def list_sessions():
@@ -0,0 +1,338 @@
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from ..core.main import ContextItem, FullState, HistoryNode
+
+# Top-level FullState fields that are small enough to compare by value and resend whole
+SMALL_FIELDS = ["active", "user_input_queue", "adding_highlighted_code"]
+
+
+def _values_are_same(a: Tuple, b: Tuple) -> bool:
+    return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+
+
+def _flatten(value: Any, out: List[Any]):
+    """The structure of a nested value as a flat list: container types and sizes, then their contents"""
+    if isinstance(value, BaseModel):
+        out.append(type(value))
+        value = value.__dict__
+    if isinstance(value, dict):
+        out += (dict, len(value))
+        for key, item in value.items():
+            out.append(key)
+            _flatten(item, out)
+    elif isinstance(value, (list, tuple, set)):
+        out += (type(value), len(value))
+        for item in value:
+            _flatten(item, out)
+    else:
+        out.append(value)
+
+
+def _flat_values_are_same(a: List[Any], b: List[Any]) -> bool:
+    # Sizes and other numbers aren't interned, so compare them by value
+    return len(a) == len(b) and all(
+        x is y or (type(x) in (int, float) and type(y) is type(x) and x == y)
+        for x, y in zip(a, b)
+    )
+
+
+class NodeFingerprint:
+    """
+    A cheap snapshot of a HistoryNode, used to tell whether it needs to be re-sent.
+
+    Rather than serializing the node, we hold references to the values of its fields.
+    Strings and other immutable values are replaced (never mutated) when a step updates itself,
+    so comparing by identity catches changes without looking at their contents.
+    Lists, dicts and models can be mutated in place, so step fields holding them are flattened
+    into references to everything they contain, and the containers' sizes.
+    Holding the references keeps the old values alive, so ids can never be reused.
+    """
+
+    def __init__(self, node: HistoryNode):
+        self.node = node
+        self.revision = node._revision
+        self.node_values = (node.deleted, node.active, node.observation, node.step)
+        self.step_values = dict(node.step.__dict__)
+        self.lengths = (len(node.logs), len(node.llm_calls))
+        self.nested_values: Dict[str, List[Any]] = {}
+        for key, value in self.step_values.items():
+            if isinstance(value, (BaseModel, dict, list, tuple, set)):
+                _flatten(value, self.nested_values.setdefault(key, []))
+
+    def may_have_changed(self) -> bool:
+        """
+        Whether the node needs to be fingerprinted again to see if it changed. Only active nodes
+        change without being marked, so this is cheap to check for every node in the timeline.
+        """
+        return (
+            self.node.active
+            or self.node_values[1]
+            or self.node._revision != self.revision
+            or self.node.deleted is not self.node_values[0]
+        )
+
+    def _field_changed(self, other: "NodeFingerprint", key: str) -> bool:
+        if key in self.nested_values or key in other.nested_values:
+            return not _flat_values_are_same(
+                self.nested_values.get(key, []), other.nested_values.get(key, [])
+            )
+        return self.step_values[key] is not other.step_values[key]
+
+    def changed_step_fields(self, other: "NodeFingerprint") -> Optional[List[str]]:
+        """Return the names of the step fields that changed, or None if anything else about the node changed"""
+        if not _values_are_same(self.node_values, other.node_values):
+            return None
+        if (
+            self.lengths != other.lengths
+            or self.step_values.keys() != other.step_values.keys()
+        ):
+            return None
+        return [key for key in self.step_values if self._field_changed(other, key)]
+
+
+def _context_item_values(item: ContextItem) -> Tuple:
+    return (item.description, item.content, item.editing, item.editable)
+
+
+class StateDeltaEncoder:
+    """
+    Keeps track of the FullState that a GUI client has been sent, and encodes each new state
+    as either a full snapshot or a versioned list of operations against the previous version.
+
+    Snapshots are sent as a "state_update" message (on connect, or when the client asks to resync),
+    and deltas as "state_delta" messages. The ops in a delta are:
+    - {"op": "set", "key", "value"}: replace a top-level field of the FullState
+    - {"op": "set_current_index", "value"}: set history.current_index
+    - {"op": "splice_nodes", "start", "delete_count", "nodes"}: replace a run of the history timeline
+    - {"op": "update_node", "index", "node"}: replace a single node of the history timeline
+    - {"op": "append_description", "index", "text"}: append text to a step's description
+    - {"op": "add_context_item", "index", "item"}, {"op": "remove_context_item", "id"}
+      and {"op": "update_context_item", "id", "item"}: changes to selected_context_items
+    """
+
+    version: int
+    _needs_snapshot: bool
+
+    def __init__(self):
+        self.version = 0
+        self.reset()
+
+    def reset(self):
+        """Forget what the client has been sent, so that the next state is sent as a snapshot"""
+        self._needs_snapshot = True
+        self._fingerprints: List[NodeFingerprint] = []
+        self._current_index: int = -1
+        self._small_fields: Dict[str, Any] = {}
+        self._slash_commands: List[Tuple[str, str]] = []
+        self._session_info: Optional[Dict] = None
+        self._saved_context_groups: Dict[str, Tuple] = {}
+        self._context_items: Dict[str, Tuple] = {}
+        self._context_item_ids: List[str] = []
+
+    def encode(self, state: FullState) -> Optional[Tuple[str, Dict]]:
+        """
+        Return the (message_type, data) that brings the client up to date with the given state,
+        or None if nothing has changed since the last message.
+        """
+        if self._needs_snapshot:
+            self._needs_snapshot = False
+            self._remember(state)
+            self._fingerprints = [
+                NodeFingerprint(node) for node in state.history.timeline
+            ]
+            self.version += 1
+            return "state_update", {"state": state.dict(), "version": self.version}
+
+        ops = self._diff(state)
+        self._remember(state)
+        if len(ops) == 0:
+            return None
+
+        self.version += 1
+        return "state_delta", {
+            "version": self.version,
+            "base_version": self.version - 1,
+            "ops": ops,
+        }
+
+    def _remember(self, state: FullState):
+        self._current_index = state.history.current_index
+        self._small_fields = {
+            key: copy.copy(getattr(state, key)) for key in SMALL_FIELDS
+        }
+        self._slash_commands = [(c.name, c.description) for c in state.slash_commands]
+        self._session_info = (
+            state.session_info.dict() if state.session_info is not None else None
+        )
+        self._saved_context_groups = {
+            title: tuple(map(_context_item_values, items))
+            for title, items in state.saved_context_groups.items()
+        }
+        self._context_items = {
+            item.description.id.to_string(): _context_item_values(item)
+            for item in state.selected_context_items
+        }
+        self._context_item_ids = list(self._context_items.keys())
+
+    def _diff(self, state: FullState) -> List[Dict]:
+        ops = []
+
+        for key in SMALL_FIELDS:
+            value = getattr(state, key)
+            if value != self._small_fields[key]:
+                ops.append({"op": "set", "key": key, "value": value})
+
+        if [
+            (c.name, c.description) for c in state.slash_commands
+        ] != self._slash_commands:
+            ops.append(
+                {
+                    "op": "set",
+                    "key": "slash_commands",
+                    "value": [c.dict() for c in state.slash_commands],
+                }
+            )
+
+        session_info = (
+            state.session_info.dict() if state.session_info is not None else None
+        )
+        if session_info != self._session_info:
+            ops.append({"op": "set", "key": "session_info", "value": session_info})
+
+        if (
+            state.saved_context_groups.keys() != self._saved_context_groups.keys()
+            or any(
+                not _values_are_same(
+                    tuple(map(_context_item_values, items)),
+                    self._saved_context_groups[title],
+                )
+                for title, items in state.saved_context_groups.items()
+            )
+        ):
+            ops.append(
+                {
+                    "op": "set",
+                    "key": "saved_context_groups",
+                    "value": {
+                        title: [item.dict() for item in items]
+                        for title, items in state.saved_context_groups.items()
+                    },
+                }
+            )
+
+        ops += self._diff_context_items(state.selected_context_items)
+        ops += self._diff_timeline(state.history.timeline)
+
+        if state.history.current_index != self._current_index:
+            ops.append(
+                {"op": "set_current_index", "value": state.history.current_index}
+            )
+
+        return ops
+
+    def _diff_context_items(self, items: List[ContextItem]) -> List[Dict]:
+        items_by_id = {item.description.id.to_string(): item for item in items}
+        new_ids = list(items_by_id.keys())
+
+        removed = [id for id in self._context_item_ids if id not in items_by_id]
+        kept = [id for id in self._context_item_ids if id in items_by_id]
+        if len(new_ids) != len(items) or kept != [
+            id for id in new_ids if id in self._context_items
+        ]:
+            # Duplicate ids or a change in order, so just send the whole list (it's usually short)
+            return [
+                {
+                    "op": "set",
+                    "key": "selected_context_items",
+                    "value": [item.dict() for item in items],
+                }
+            ]
+
+        ops = [{"op": "remove_context_item", "id": id} for id in removed]
+        for index, id in enumerate(new_ids):
+            item = items_by_id[id]
+            if id not in self._context_items:
+                ops.append(
+                    {"op": "add_context_item", "index": index, "item": item.dict()}
+                )
+            elif not _values_are_same(
+                _context_item_values(item), self._context_items[id]
+            ):
+                ops.append({"op": "update_context_item", "id": id, "item": item.dict()})
+        return ops
+
+    def _diff_timeline(self, timeline: List[HistoryNode]) -> List[Dict]:
+        old = self._fingerprints
+
+        # Nodes are only ever inserted or removed, so find the run in the middle that differs by identity
+        prefix = 0
+        while (
+            prefix < len(old)
+            and prefix < len(timeline)
+            and old[prefix].node is timeline[prefix]
+        ):
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < len(old) - prefix
+            and suffix < len(timeline) - prefix
+            and old[-1 - suffix].node is timeline[-1 - suffix]
+        ):
+            suffix += 1
+
+        # Splice first, so that the indices of the following ops refer to the new timeline
+        ops = []
+        fingerprints: List[NodeFingerprint] = [None] * len(timeline)
+        if prefix + suffix < len(old) or prefix + suffix < len(timeline):
+            inserted = timeline[prefix : len(timeline) - suffix]
+            ops.append(
+                {
+                    "op": "splice_nodes",
+                    "start": prefix,
+                    "delete_count": len(old) - prefix - suffix,
+                    "nodes": [node.dict() for node in inserted],
+                }
+            )
+            fingerprints[prefix : len(timeline) - suffix] = map(
+                NodeFingerprint, inserted
+            )
+
+        # Fingerprints are kept between updates, so only the nodes that may have changed
+        # (usually just the running one) are fingerprinted again
+        for index in list(range(prefix)) + list(
+            range(len(timeline) - suffix, len(timeline))
+        ):
+            old_index = index if index < prefix else index - len(timeline) + len(old)
+            fingerprint = old[old_index]
+            if fingerprint.may_have_changed():
+                new = NodeFingerprint(timeline[index])
+                ops += self._diff_node(index, fingerprint, new)
+                fingerprint = new
+            fingerprints[index] = fingerprint
+
+        self._fingerprints = fingerprints
+        return ops
+
+    def _diff_node(
+        self, index: int, old: NodeFingerprint, new: NodeFingerprint
+    ) -> List[Dict]:
+        changed = new.changed_step_fields(old)
+        if changed is not None and len(changed) == 0:
+            return []
+
+        if changed == ["description"]:
+            old_description = old.step_values["description"] or ""
+            new_description = new.step_values["description"] or ""
+            if new_description.startswith(old_description):
+                return [
+                    {
+                        "op": "append_description",
+                        "index": index,
+                        "text": new_description[len(old_description) :],
+                    }
+                ]
+
+        return [{"op": "update_node", "index": index, "node": new.node.dict()}]
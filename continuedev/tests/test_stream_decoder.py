@@ -0,0 +1,132 @@
+import asyncio
+import json
+import random
+from typing import Iterator, List
+
+import pytest
+
+from ..src.continuedev.libs.util.stream_decoder import (
+    LineDecoder,
+    NDJSONDecoder,
+    SSEDecoder,
+    iter_lines,
+)
+
+SEEDS = range(200)
+
+
+def random_chunks(data: bytes, rng: random.Random) -> Iterator[bytes]:
+    """Split data at random points, including empty chunks and splits inside characters"""
+    i = 0
+    while i < len(data):
+        size = rng.choice([0, 1, 1, 2, 3, rng.randint(1, 16)])
+        yield data[i : i + size]
+        i += size
+
+
+def decode_all(decoder, data: bytes, rng: random.Random) -> List:
+    results = []
+    for chunk in random_chunks(data, rng):
+        results += decoder.feed(chunk)
+    return results + decoder.flush()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_line_decoder_random_chunks(seed: int):
+    rng = random.Random(seed)
+    lines = ["héllo wörld", "", "日本語のテキスト", "emoji 🎉🚀", "crlf", "last"]
+    data = "\r\n".join(lines[:5]).encode("utf-8") + b"\n" + lines[5].encode("utf-8")
+
+    decoded = decode_all(LineDecoder(), data, rng)
+
+    assert [line.decode("utf-8") for line in decoded] == lines
+
+
+def test_line_decoder_crlf_split_across_chunks():
+    decoder = LineDecoder()
+    assert decoder.feed(b"abc\r") == []
+    assert decoder.feed(b"\ndef") == [b"abc"]
+    assert decoder.flush() == [b"def"]
+
+
+def test_line_decoder_final_line_without_newline():
+    decoder = LineDecoder()
+    assert decoder.feed(b"one\ntwo") == [b"one"]
+    assert decoder.flush() == [b"two"]
+    assert decoder.flush() == []
+
+
+def test_line_decoder_split_inside_multibyte_character():
+    data = "ü€😀\n".encode("utf-8")
+    decoder = LineDecoder()
+    lines = []
+    for i in range(len(data)):
+        lines += decoder.feed(data[i : i + 1])
+    assert lines == ["ü€😀".encode("utf-8")]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_ndjson_decoder_random_chunks(seed: int):
+    rng = random.Random(seed)
+    objects = [
+        {"content": "naïve ☃"},
+        {"content": "line\nbreak"},
+        {"n": 1, "nested": {"text": "中文"}},
+        {"done": True},
+    ]
+    lines = [json.dumps(obj, ensure_ascii=False) for obj in objects]
+    # Blank lines are skipped, and the last object has no trailing newline
+    data = ("\r\n".join(lines[:2]) + "\n\n" + "\n".join(lines[2:])).encode("utf-8")
+
+    assert decode_all(NDJSONDecoder(), data, rng) == objects
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_sse_decoder_random_chunks(seed: int):
+    rng = random.Random(seed)
+    data = (
+        ": ping\r\n"
+        "event: message\r\n"
+        'data: {"text": "größe"}\r\n'
+        "\r\n"
+        "data: first line\n"
+        "data:second line\n"
+        "data:  indented\n"
+        "id: 3\n"
+        "\n"
+        "data: 🎉 last event, without a blank line"
+    ).encode("utf-8")
+
+    assert decode_all(SSEDecoder(), data, rng) == [
+        '{"text": "größe"}',
+        "first line\nsecond line\n indented",
+        "🎉 last event, without a blank line",
+    ]
+
+
+def test_sse_decoder_ignores_events_without_data():
+    decoder = SSEDecoder()
+    assert decoder.feed(b": comment\n\nevent: ping\n\ndata: x\n\n") == ["x"]
+    assert decoder.flush() == []
+
+
+class FakeContent:
+    def __init__(self, chunks: List[bytes]):
+        self.chunks = chunks
+
+    async def iter_any(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class FakeResponse:
+    def __init__(self, chunks: List[bytes]):
+        self.content = FakeContent(chunks)
+
+
+def test_iter_lines_flushes_the_last_line():
+    async def collect():
+        resp = FakeResponse([b'{"a": 1}\n{"b"', b": 2}"])
+        return [line async for line in iter_lines(resp)]
+
+    assert asyncio.run(collect()) == [b'{"a": 1}', b'{"b": 2}']
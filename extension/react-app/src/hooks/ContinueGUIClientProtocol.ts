@@ -3,8 +3,73 @@ import AbstractContinueGUIClientProtocol from "./AbstractContinueGUIClientProtoc
 import { Messenger, WebsocketMessenger } from "./messenger";
 import { VscodeMessenger } from "./vscodeMessenger";
 
+function applyStateDelta(state: any, ops: any[]): any {
+  // Copy everything that is changed, so that React sees new objects
+  const newState = {
+    ...state,
+    history: { ...state.history, timeline: [...state.history.timeline] },
+    selected_context_items: [...state.selected_context_items],
+  };
+  const timeline = newState.history.timeline;
+  const contextItemIndex = (id: string) =>
+    newState.selected_context_items.findIndex(
+      (item: any) =>
+        `${item.description.id.provider_title}-${item.description.id.item_id}` ===
+        id
+    );
+
+  for (const op of ops) {
+    switch (op.op) {
+      case "set":
+        newState[op.key] = op.value;
+        break;
+      case "set_current_index":
+        newState.history.current_index = op.value;
+        break;
+      case "splice_nodes":
+        timeline.splice(op.start, op.delete_count, ...op.nodes);
+        break;
+      case "update_node":
+        timeline[op.index] = op.node;
+        break;
+      case "append_description":
+        timeline[op.index] = {
+          ...timeline[op.index],
+          step: {
+            ...timeline[op.index].step,
+            description:
+              (timeline[op.index].step.description || "") + op.text,
+          },
+        };
+        break;
+      case "add_context_item":
+        newState.selected_context_items.splice(op.index, 0, op.item);
+        break;
+      case "remove_context_item": {
+        const index = contextItemIndex(op.id);
+        if (index >= 0) {
+          newState.selected_context_items.splice(index, 1);
+        }
+        break;
+      }
+      case "update_context_item": {
+        const index = contextItemIndex(op.id);
+        if (index >= 0) {
+          newState.selected_context_items[index] = op.item;
+        }
+        break;
+      }
+    }
+  }
+  return newState;
+}
+
 class ContinueGUIClientProtocol extends AbstractContinueGUIClientProtocol {
   messenger?: Messenger;
+  // The last state received from the server, which deltas are applied to
+  private state?: any;
+  private stateVersion?: number;
+  private awaitingResync: boolean = false;
   // Server URL must contain the session ID param
   serverUrlWithSessionId: string;
   useVscodeMessagePassing: boolean;
@@ -77,9 +142,26 @@ class ContinueGUIClientProtocol extends AbstractContinueGUIClientProtocol {
   onStateUpdate(callback: (state: any) => void) {
     this.messenger?.onMessageType("state_update", (data: any) => {
       if (data.state) {
+        this.state = data.state;
+        this.stateVersion = data.version;
+        this.awaitingResync = false;
         callback(data.state);
       }
     });
+    this.messenger?.onMessageType("state_delta", (data: any) => {
+      if (this.awaitingResync) {
+        return;
+      }
+      if (!this.state || data.base_version !== this.stateVersion) {
+        // Missed an update, so ask for a full snapshot
+        this.awaitingResync = true;
+        this.messenger?.send("resync", {});
+        return;
+      }
+      this.state = applyStateDelta(this.state, data.ops);
+      this.stateVersion = data.version;
+      callback(this.state);
+    });
   }
 
   onAvailableSlashCommands(
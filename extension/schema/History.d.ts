@@ -22,6 +22,20 @@ export type Depth = number;
 export type Deleted = boolean;
 export type Active = boolean;
 export type Logs = string[];
+export type Provider = string;
+export type Model = string;
+export type Method = string;
+export type Roles = string[];
+export type QueueWait = number;
+export type TimeToFirstToken = number;
+export type Duration = number;
+export type InterTokenLatencyHistogram = number[];
+export type PromptTokens = number;
+export type CompletionTokens = number;
+export type CacheHit = boolean;
+export type Retries = number;
+export type Error = string;
+export type LlmCalls = LLMCallTelemetry[];
 export type Timeline = HistoryNode[];
 export type CurrentIndex = number;
 
@@ -43,6 +57,7 @@ export interface HistoryNode {
   deleted?: Deleted;
   active?: Active;
   logs?: Logs;
+  llm_calls?: LlmCalls;
   [k: string]: unknown;
 }
 export interface Step {
@@ -70,3 +85,22 @@ export interface FunctionCall {
 export interface Observation {
   [k: string]: unknown;
 }
+/**
+ * Timings and token counts for a single call to an LLM. Durations are in seconds.
+ */
+export interface LLMCallTelemetry {
+  provider: Provider;
+  model: Model;
+  method: Method;
+  roles?: Roles;
+  queue_wait?: QueueWait;
+  time_to_first_token?: TimeToFirstToken;
+  duration?: Duration;
+  inter_token_latency_histogram?: InterTokenLatencyHistogram;
+  prompt_tokens?: PromptTokens;
+  completion_tokens?: CompletionTokens;
+  cache_hit?: CacheHit;
+  retries?: Retries;
+  error?: Error;
+  [k: string]: unknown;
+}
@@ -13,8 +13,10 @@ import {
 } from "./suggestions";
 import { FileEditWithFullContents } from "../schema/FileEditWithFullContents";
 import * as fs from "fs";
+import * as path from "path";
+import * as zlib from "zlib";
 import { WebsocketMessenger } from "./util/messenger";
-import { diffManager } from "./diffs";
+import { DIFF_DIRECTORY, diffManager } from "./diffs";
 const os = require("os");
 
 const continueVirtualDocumentScheme = "continue";
@@ -23,8 +25,6 @@ class IdeProtocolClient {
   private messenger: WebsocketMessenger | null = null;
   private readonly context: vscode.ExtensionContext;
 
-  private _makingEdit = 0;
-
   private _highlightDebounce: NodeJS.Timeout | null = null;
 
   private _lastReloadTime: number = 16;
@@ -33,7 +33,19 @@ class IdeProtocolClient {
   sessionId: string | null = null;
   private _serverUrl: string;
 
+  // Files read by the server since they last changed, which it may have cached
+  private _filesReadByServer: Set<string> = new Set();
+
+  private _markReadByServer(filepaths: string[]) {
+    // Diff files are rewritten for every streamed hunk, so never report changes to them
+    filepaths
+      .filter((filepath) => path.dirname(filepath) !== DIFF_DIRECTORY)
+      .forEach((filepath) => this._filesReadByServer.add(filepath));
+  }
+
   private _newWebsocketMessenger() {
+    // A new connection has a new cache on the server
+    this._filesReadByServer.clear();
     const requestUrl =
       this._serverUrl + (this.sessionId ? `?session_id=${this.sessionId}` : "");
     const messenger = new WebsocketMessenger(requestUrl);
@@ -64,19 +76,21 @@ class IdeProtocolClient {
     messenger.onError(() => {
       reconnect();
     });
-    messenger.onMessage((messageType, data, messenger) => {
-      this.handleMessage(messageType, data, messenger).catch((err) => {
-        vscode.window
-          .showErrorMessage(
-            "Error handling message from Continue server: " + err.message,
-            "View Logs"
-          )
-          .then((selection) => {
-            if (selection === "View Logs") {
-              vscode.commands.executeCommand("continue.viewLogs");
-            }
-          });
-      });
+    messenger.onMessage((messageType, data, messageId, messenger) => {
+      this.handleMessage(messageType, data, messageId, messenger).catch(
+        (err) => {
+          vscode.window
+            .showErrorMessage(
+              "Error handling message from Continue server: " + err.message,
+              "View Logs"
+            )
+            .then((selection) => {
+              if (selection === "View Logs") {
+                vscode.commands.executeCommand("continue.viewLogs");
+              }
+            });
+        }
+      );
     });
   }
 
@@ -85,35 +99,39 @@ class IdeProtocolClient {
     this._serverUrl = serverUrl;
     this._newWebsocketMessenger();
 
-    // Setup listeners for any file changes in open editors
-    // vscode.workspace.onDidChangeTextDocument((event) => {
-    //   if (this._makingEdit === 0) {
-    //     let fileEdits: FileEditWithFullContents[] = event.contentChanges.map(
-    //       (change) => {
-    //         return {
-    //           fileEdit: {
-    //             filepath: event.document.uri.fsPath,
-    //             range: {
-    //               start: {
-    //                 line: change.range.start.line,
-    //                 character: change.range.start.character,
-    //               },
-    //               end: {
-    //                 line: change.range.end.line,
-    //                 character: change.range.end.character,
-    //               },
-    //             },
-    //             replacement: change.text,
-    //           },
-    //           fileContents: event.document.getText(),
-    //         };
-    //       }
-    //     );
-    //     this.messenger?.send("fileEdits", { fileEdits });
-    //   } else {
-    //     this._makingEdit--;
-    //   }
-    // });
+    // Setup listeners for any file changes in open editors, so that the
+    // server's cache of file contents stays up to date. Only files that the
+    // server has read can be in its cache, and it only needs to hear about
+    // the first change after each read, since it reads the file again later
+    vscode.workspace.onDidChangeTextDocument((event) => {
+      const filepath = event.document.uri.fsPath;
+      if (
+        event.document.uri.scheme !== "file" ||
+        event.contentChanges.length === 0 ||
+        !this._filesReadByServer.delete(filepath)
+      ) {
+        return;
+      }
+      this.messenger?.send("filesChanged", { filepaths: [filepath] });
+    });
+
+    // Reads come from the editor while a file is open and from disk otherwise
+    vscode.workspace.onDidOpenTextDocument((document) => {
+      if (document.uri.scheme === "file") {
+        this.messenger?.send("setFileOpen", {
+          filepath: document.uri.fsPath,
+          open: true,
+        });
+      }
+    });
+    vscode.workspace.onDidCloseTextDocument((document) => {
+      if (document.uri.scheme === "file") {
+        this.messenger?.send("setFileOpen", {
+          filepath: document.uri.fsPath,
+          open: false,
+        });
+      }
+    });
 
     // Setup listeners for any selection changes in open editors
     vscode.window.onDidChangeTextEditorSelection((event) => {
@@ -189,62 +207,112 @@ class IdeProtocolClient {
   async handleMessage(
     messageType: string,
     data: any,
+    messageId: string | undefined,
     messenger: WebsocketMessenger
   ) {
     switch (messageType) {
       case "highlightedCode":
-        messenger.send("highlightedCode", {
-          highlightedCode: this.getHighlightedCode(),
-        });
+        messenger.send(
+          "highlightedCode",
+          {
+            highlightedCode: this.getHighlightedCode(),
+          },
+          messageId
+        );
         break;
       case "workspaceDirectory":
-        messenger.send("workspaceDirectory", {
-          workspaceDirectory: this.getWorkspaceDirectory(),
-        });
+        messenger.send(
+          "workspaceDirectory",
+          {
+            workspaceDirectory: this.getWorkspaceDirectory(),
+          },
+          messageId
+        );
         break;
       case "uniqueId":
-        messenger.send("uniqueId", {
-          uniqueId: this.getUniqueId(),
-        });
+        messenger.send(
+          "uniqueId",
+          {
+            uniqueId: this.getUniqueId(),
+          },
+          messageId
+        );
         break;
       case "getUserSecret":
-        messenger.send("getUserSecret", {
-          value: await this.getUserSecret(data.key),
-        });
+        messenger.send(
+          "getUserSecret",
+          {
+            value: await this.getUserSecret(data.key),
+          },
+          messageId
+        );
         break;
       case "openFiles":
-        messenger.send("openFiles", {
-          openFiles: this.getOpenFiles(),
-        });
+        messenger.send(
+          "openFiles",
+          {
+            openFiles: this.getOpenFiles(),
+          },
+          messageId
+        );
         break;
       case "visibleFiles":
-        messenger.send("visibleFiles", {
-          visibleFiles: this.getVisibleFiles(),
-        });
+        messenger.send(
+          "visibleFiles",
+          {
+            visibleFiles: this.getVisibleFiles(),
+          },
+          messageId
+        );
         break;
       case "readFile":
-        messenger.send("readFile", {
-          contents: this.readFile(data.filepath),
-        });
+        this._markReadByServer([data.filepath]);
+        messenger.send(
+          "readFile",
+          {
+            contents: this.readFile(data.filepath),
+          },
+          messageId
+        );
+        break;
+      case "readFiles":
+        this._markReadByServer(data.filepaths);
+        messenger.send(
+          "readFiles",
+          this.readFiles(data.filepaths, data.compress),
+          messageId
+        );
         break;
       case "getTerminalContents":
-        messenger.send("getTerminalContents", {
-          contents: await this.getTerminalContents(),
-        });
+        messenger.send(
+          "getTerminalContents",
+          {
+            contents: await this.getTerminalContents(),
+          },
+          messageId
+        );
         break;
       case "editFile":
         const fileEdit = await this.editFile(data.edit);
-        messenger.send("editFile", {
-          fileEdit,
-        });
+        messenger.send(
+          "editFile",
+          {
+            fileEdit,
+          },
+          messageId
+        );
         break;
       case "highlightCode":
         this.highlightCode(data.rangeInFile, data.color);
         break;
       case "runCommand":
-        messenger.send("runCommand", {
-          output: await this.runCommand(data.command),
-        });
+        messenger.send(
+          "runCommand",
+          {
+            output: await this.runCommand(data.command),
+          },
+          messageId
+        );
         break;
       case "saveFile":
         this.saveFile(data.filepath);
@@ -279,6 +347,23 @@ class IdeProtocolClient {
       case "showDiff":
         this.showDiff(data.filepath, data.replacement, data.step_index);
         break;
+      case "showDiffBase":
+        diffManager.writeDiffBase(
+          data.filepath,
+          data.contents,
+          data.step_index
+        );
+        break;
+      case "showDiffHunk":
+        diffManager.writeDiffHunk(
+          data.filepath,
+          data.version,
+          data.start,
+          data.end,
+          data.lines,
+          data.step_index
+        );
+        break;
       case "getSessionId":
       case "connected":
         break;
@@ -496,6 +581,21 @@ class IdeProtocolClient {
     return contents;
   }
 
+  readFiles(
+    filepaths: string[],
+    compress: boolean = false
+  ): { contents?: string[]; compressedContents?: string } {
+    const contents = filepaths.map((filepath) => this.readFile(filepath));
+    if (!compress) {
+      return { contents };
+    }
+    // gzipped JSON array, base64 encoded to fit in the JSON message
+    const compressedContents = zlib
+      .gzipSync(JSON.stringify(contents))
+      .toString("base64");
+    return { compressedContents };
+  }
+
   async getTerminalContents(): Promise<string> {
     const tempCopyBuffer = await vscode.env.clipboard.readText();
     await vscode.commands.executeCommand("workbench.action.terminal.selectAll");
@@ -525,7 +625,6 @@ class IdeProtocolClient {
         );
 
         editor.edit((editBuilder) => {
-          this._makingEdit += 2; // editBuilder.replace takes 2 edits: delete and insert
           editBuilder.replace(range, edit.replacement);
           resolve({
             fileEdit: edit,
@@ -23,6 +23,10 @@ class DiffManager {
   // Doing this because virtual files are read-only
   private diffs: Map<string, DiffInfo> = new Map();
 
+  // Diffs that are being streamed as a base followed by hunks, by original filepath
+  private streamedDiffs: Map<string, { version: number; lines: string[] }> =
+    new Map();
+
   diffAtNewFilepath(newFilepath: string): DiffInfo | undefined {
     return this.diffs.get(newFilepath);
   }
@@ -132,6 +136,50 @@ class DiffManager {
     originalFilepath: string,
     newContent: string,
     step_index: number
+  ): string {
+    this.streamedDiffs.delete(originalFilepath);
+    return this._writeDiff(originalFilepath, newContent, step_index);
+  }
+
+  writeDiffBase(
+    originalFilepath: string,
+    newContent: string,
+    step_index: number
+  ): string {
+    this.streamedDiffs.set(originalFilepath, {
+      version: 0,
+      lines: newContent.split("\n"),
+    });
+    return this._writeDiff(originalFilepath, newContent, step_index);
+  }
+
+  writeDiffHunk(
+    originalFilepath: string,
+    version: number,
+    start: number,
+    end: number,
+    lines: string[],
+    step_index: number
+  ): string | undefined {
+    const streamed = this.streamedDiffs.get(originalFilepath);
+    // Each hunk applies to the version before it, so if one was missed,
+    // wait for the full contents that are sent at the end of the stream
+    if (!streamed || streamed.version !== version - 1) {
+      return undefined;
+    }
+    streamed.lines.splice(start, end - start, ...lines);
+    streamed.version = version;
+    return this._writeDiff(
+      originalFilepath,
+      streamed.lines.join("\n"),
+      step_index
+    );
+  }
+
+  private _writeDiff(
+    originalFilepath: string,
+    newContent: string,
+    step_index: number
   ): string {
     this.setupDirectory();
 
@@ -176,6 +224,7 @@ class DiffManager {
       vscode.commands.executeCommand("workbench.action.closeActiveEditor");
     }
     this.diffs.delete(diffInfo.newFilepath);
+    this.streamedDiffs.delete(diffInfo.originalFilepath);
     fs.unlinkSync(diffInfo.newFilepath);
   }
 
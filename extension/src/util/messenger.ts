@@ -2,14 +2,16 @@ const WebSocket = require("ws");
 import fetch from "node-fetch";
 
 export abstract class Messenger {
-  abstract send(messageType: string, data: object): void;
+  abstract send(messageType: string, data: object, messageId?: string): void;
 
   abstract onMessageType(
     messageType: string,
     callback: (data: object) => void
   ): void;
 
-  abstract onMessage(callback: (messageType: string, data: any) => void): void;
+  abstract onMessage(
+    callback: (messageType: string, data: any, messageId?: string) => void
+  ): void;
 
   abstract onOpen(callback: () => void): void;
 
@@ -103,8 +105,9 @@ export class WebsocketMessenger extends Messenger {
     // }, 1000);
   }
 
-  send(messageType: string, data: object) {
-    const payload = JSON.stringify({ messageType, data });
+  send(messageType: string, data: object, messageId?: string) {
+    // Responses carry the messageId of the request they answer
+    const payload = JSON.stringify({ messageType, data, messageId });
     if (this.websocket.readyState === this.websocket.OPEN) {
       this.websocket.send(payload);
     } else {
@@ -142,12 +145,13 @@ export class WebsocketMessenger extends Messenger {
     callback: (
       messageType: string,
       data: any,
+      messageId: string | undefined,
       messenger: WebsocketMessenger
     ) => void
   ): void {
     this.websocket.addEventListener("message", (event) => {
       const msg = JSON.parse(event.data);
-      callback(msg.messageType, msg.data, this);
+      callback(msg.messageType, msg.data, msg.messageId, this);
     });
   }
 